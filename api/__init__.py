@@ -1 +1 @@
-from .api_utils import save_response_images_to_file_api
\ No newline at end of file
+from .api_utils import save_response_images_to_file_api
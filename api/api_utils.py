@@ -1,21 +1,43 @@
+from typing import List
+
 import requests
 
 
-def save_response_images_to_file_api(response: dict):
+def response_image_urls(response: dict) -> List[str]:
     """
-    download image by link and save to disk with prompt + id
+    links to the generated images of the task response
     status is guaranteed to be 'succeeded'
     """
     assert (
         response["status"] == "succeeded"
     ), "task response status is not 'succeeded'"
-    images_urls = [
+    return [
         x["generation"]["image_path"] for x in response["generations"]["data"]
     ]
+
+
+def image_filename(caption: str, i: int) -> str:
+    """
+    filename of the i-th generated image, prompt + id
+    """
+    return f"{caption}_{i+1}.png"
+
+
+def response_image_filename(response: dict, i: int) -> str:
+    """
+    filename of the i-th generated image of the task response
+    """
+    return image_filename(response["prompt"]["prompt"]["caption"], i)
+
+
+def save_response_images_to_file_api(response: dict):
+    """
+    download image by link and save to disk with prompt + id
+    status is guaranteed to be 'succeeded'
+    """
+    images_urls = response_image_urls(response)
     for i, image_url in enumerate(images_urls):
         print(f"saving image {i+1}")
         img_data = requests.get(image_url).content
-        with open(
-            f'{response["prompt"]["prompt"]["caption"]}_{i+1}.png', "wb"
-        ) as f:
+        with open(response_image_filename(response, i), "wb") as f:
             f.write(img_data)
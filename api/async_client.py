@@ -0,0 +1,186 @@
+"""
+Asynchronous client for the labs task API
+
+All requests go through one keep-alive session, so the TLS handshake is
+done once per connection instead of once per request. Tasks are polled
+with exponential backoff and generations are downloaded concurrently.
+Authorization is sent only to the tasks endpoint, never to the hosts the
+generations are downloaded from.
+"""
+
+import asyncio
+import os
+from typing import List, Optional
+
+import aiohttp
+
+from api.api_utils import (
+    image_filename,
+    response_image_filename,
+    response_image_urls,
+)
+from image_preparation.result_cache import ResultCache, make_key
+
+LABS_TASKS_URL = "https://labs.openai.com/api/labs/tasks"
+
+
+class LabsClient:
+    def __init__(
+        self,
+        auth_header: str,
+        tasks_url: str = LABS_TASKS_URL,
+        max_tasks: int = 4,
+        max_connections: int = 8,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 10.0,
+        poll_backoff: float = 1.5,
+        timeout: float = 600.0,
+        cache: Optional[ResultCache] = None,
+    ):
+        """
+        :param auth_header: Authorization header, "Bearer ..."
+        :param tasks_url: url of the tasks endpoint, e.g. of a local server
+        :param max_tasks: number of tasks in flight at the same time
+        :param max_connections: size of the connection pool
+        :param poll_interval: seconds before the first status check
+        :param max_poll_interval: longest wait between status checks
+        :param poll_backoff: wait is multiplied by it after every check
+        :param timeout: seconds to wait for a task to finish
+        :param cache: if set, images of the same payload are reused from it
+        """
+        self.headers = {
+            "Content-type": "application/json",
+            "Authorization": auth_header,
+        }
+        self.tasks_url = tasks_url
+        self.max_connections = max_connections
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.poll_backoff = poll_backoff
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.cache = cache
+        self._tasks: Optional[asyncio.Semaphore] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        # created here to be bound to the running event loop
+        self._tasks = asyncio.Semaphore(self.max_tasks)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._session.close()
+        self._session = None
+
+    async def create_task(self, payload: dict) -> dict:
+        async with self._session.post(
+            self.tasks_url, json=payload, headers=self.headers
+        ) as ret:
+            ret.raise_for_status()
+            return await ret.json()
+
+    async def get_task(self, task_id: str) -> dict:
+        async with self._session.get(
+            f"{self.tasks_url}/{task_id}", headers=self.headers
+        ) as ret:
+            ret.raise_for_status()
+            return await ret.json()
+
+    async def wait_task(self, task: dict) -> dict:
+        """
+        Polls the task until it's not pending anymore
+        Wait between checks grows from poll_interval to max_poll_interval
+        :return: task response
+        """
+        interval = self.poll_interval
+        while task["status"] == "pending":
+            await asyncio.sleep(interval)
+            interval = min(
+                interval * self.poll_backoff, self.max_poll_interval
+            )
+            task = await self.get_task(task["id"])
+        return task
+
+    async def download(self, url: str) -> bytes:
+        # image host is not the API, it doesn't get the API key
+        async with self._session.get(url) as ret:
+            ret.raise_for_status()
+            return await ret.read()
+
+    async def download_generations(
+        self, response: dict, folder: str = ""
+    ) -> List[str]:
+        """
+        Downloads all generated images at the same time
+        and saves them to disk with prompt + id
+        :return: paths to the saved images
+        """
+        images_data = await asyncio.gather(
+            *[self.download(url) for url in response_image_urls(response)]
+        )
+        paths = []
+        for i, img_data in enumerate(images_data):
+            path = os.path.join(folder, response_image_filename(response, i))
+            with open(path, "wb") as f:
+                f.write(img_data)
+            paths.append(path)
+        return paths
+
+    def _cache_keys(self, payload: dict) -> List[str]:
+        return [
+            make_key(payload, str(i))
+            for i in range(payload["prompt"].get("batch_size", 1))
+        ]
+
+    def _load_cached(self, payload: dict, folder: str) -> List[str]:
+        """
+        Saves cached images of the payload to disk
+        :return: paths to the saved images, empty if any of them is missing
+        """
+        images_data = [
+            self.cache.get_bytes(x) for x in self._cache_keys(payload)
+        ]
+        if any(x is None for x in images_data):
+            return []
+        paths = []
+        for i, img_data in enumerate(images_data):
+            path = os.path.join(
+                folder, image_filename(payload["prompt"]["caption"], i)
+            )
+            with open(path, "wb") as f:
+                f.write(img_data)
+            paths.append(path)
+        return paths
+
+    async def generate(self, payload: dict) -> dict:
+        """
+        Creates the task and waits for it
+        No more than max_tasks tasks are in flight at the same time
+        :return: task response
+        """
+        async with self._tasks:
+            task = await self.create_task(payload)
+            return await asyncio.wait_for(self.wait_task(task), self.timeout)
+
+    async def generate_and_save(
+        self, payload: dict, folder: str = ""
+    ) -> List[str]:
+        """
+        :return: paths to the saved images, empty if the task has failed
+        """
+        if self.cache is not None:
+            paths = self._load_cached(payload, folder)
+            if paths:
+                return paths
+        response = await self.generate(payload)
+        if response["status"] != "succeeded":
+            return []
+        paths = await self.download_generations(response, folder)
+        if self.cache is not None:
+            for key, path in zip(self._cache_keys(payload), paths):
+                with open(path, "rb") as f:
+                    self.cache.put_bytes(key, f.read())
+        return paths
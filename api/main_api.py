@@ -1,8 +1,6 @@
-from time import sleep
+import asyncio
 
-import requests
-
-from api.api_utils import save_response_images_to_file_api
+from api.async_client import LABS_TASKS_URL, LabsClient
 
 payload = {
     "task_type": "text2im",
@@ -22,22 +20,13 @@ auth_header: str = ""
 # auth_header = "Bearer ************"
 assert len(auth_header), "auth_header is not set"
 assert "bearer" in auth_header.lower(), "bearer is not valid"
-content_type = "application/json"
-create_task_link = "https://labs.openai.com/api/labs/tasks"
 
-headers = {
-    "Content-type": content_type,
-    "Authorization": auth_header,
-}
+
+async def main():
+    async with LabsClient(auth_header, tasks_url=LABS_TASKS_URL) as client:
+        await client.generate_and_save(payload)
+
 
 if __name__ == "__main__":
-    ret = requests.post(create_task_link, json=payload, headers=headers)
-    ret = ret.json()
-    sleep(5)
-    while ret["status"] == "pending":
-        ret = requests.get(create_task_link + "/" + ret["id"], headers=headers)
-        ret = ret.json()
-        sleep(5)
-    if ret["status"] == "succeeded":
-        save_response_images_to_file_api(ret)
-print("DONE")
+    asyncio.run(main())
+    print("DONE")
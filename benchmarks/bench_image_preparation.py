@@ -0,0 +1,454 @@
+"""
+Benchmarks of the image_preparation hot paths
+
+Synthetic RGBA images from 1k up to 32k pixels along the seam (height of
+the image extended to the left and right, width of the image extended to
+the top and bottom) are run through shift, shift_large, prepare_full_panorama,
+combine_parts and combine_images. Every case runs in its own process, so
+peak RSS of one case doesn't hide the next one. For every case it's
+recorded:
+    wall_time - best wall time of --repeat runs, seconds
+    peak_rss - peak resident memory of the process, bytes
+    allocated - peak of memory allocated by Python and numpy during
+        the run (tracemalloc), bytes
+
+Wall time and memory depend on the machine and on the versions of numpy
+and OpenCV, so no baselines are stored in the repository. --against REV
+runs every case with the image_preparation of the git revision REV as
+well, on the same machine, and reports where this tree is worse.
+Results can also be compared with baselines stored locally with
+--update-baseline.
+
+python benchmarks/bench_image_preparation.py --sizes 1024,4096 --against main
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import importlib
+import io
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# tree the cases are imported from, set for the processes of --against
+ROOT_ENV = "BENCH_IMAGE_PREPARATION_ROOT"
+sys.path.insert(0, os.environ.get(ROOT_ENV, REPO_ROOT))
+
+# only the functions every revision has, with their default geometry
+from image_preparation import shift, shift_large  # noqa: E402
+from image_preparation.data import Directions  # noqa: E402
+from image_preparation.panorama_dalle2 import (  # noqa: E402
+    combine_images,
+    combine_parts,
+    prepare_full_panorama,
+)
+
+DEFAULT_SIZES = [1024, 2048, 4096, 8192, 16384, 32768]
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "baselines.json")
+# caches of decoded images, in the revisions that have them
+CACHES = [
+    ("image_preparation.image_store", "IMAGE_STORE"),
+    ("image_preparation.data.panorama_part", "PARTS_CACHE"),
+    ("image_preparation.data.panorama_part", "RGBA_CACHE"),
+]
+# images are extended either horizontally or vertically
+ORIENTATIONS = {
+    "LEFT_RIGHT": [Directions.LEFT, Directions.RIGHT],
+    "UP_DOWN": [Directions.UP, Directions.DOWN],
+}
+METRICS = ["wall_time", "peak_rss", "allocated"]
+# differences below these are noise, even if relatively large
+MIN_TIME_DIFFERENCE = 0.002
+MIN_MEMORY_DIFFERENCE = 1024**2
+
+
+def synthetic_image(height: int, width: int, seed: int = 0) -> np.ndarray:
+    """
+    Smooth gradients with noise, compresses like a real image
+    :return: BGRA image, same for the same arguments
+    """
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    im = np.empty((height, width, 4), dtype=np.uint8)
+    im[..., 0] = (y * 0.5 + x * 0.5).astype(np.uint8)
+    im[..., 1] = ((y + x * 2) % 256).astype(np.uint8)
+    im[..., 2] = rng.integers(0, 32, (height, width), dtype=np.uint8) + 96
+    im[..., 3] = 255
+    return im
+
+
+def image_shape(orientation: str, size: int):
+    """
+    :return: height and width of the image of size pixels along the seam
+    """
+    if orientation == "LEFT_RIGHT":
+        return size, 1024
+    return 1024, size
+
+
+def write_inputs(folder: str, orientation: str, size: int) -> str:
+    """
+    Writes the source image and its direction_done images
+    :return: path to the source image
+    """
+    height, width = image_shape(orientation, size)
+    impath = os.path.join(folder, "bench.png")
+    cv2.imwrite(impath, synthetic_image(height, width))
+    for i, direction in enumerate(ORIENTATIONS[orientation]):
+        cv2.imwrite(
+            os.path.join(folder, f"bench_{direction}_done.png"),
+            synthetic_image(height, width, seed=i + 1),
+        )
+    return impath
+
+
+def clear_caches(names=("IMAGE_STORE", "PARTS_CACHE", "RGBA_CACHE")):
+    """
+    Clears the caches of decoded images the tree has
+    """
+    for module_name, name in CACHES:
+        if name not in names:
+            continue
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        cache = getattr(module, name, None)
+        if cache is not None:
+            cache.clear()
+
+
+def setup_case(
+    name: str, orientation: str, size: int, impath: str
+) -> Callable[[], object]:
+    """
+    Prepares the inputs of the case in memory
+    :return: function that runs the case once
+    """
+    directions = ORIENTATIONS[orientation]
+    if name == "shift":
+        im = synthetic_image(*image_shape(orientation, size))
+        return lambda: [shift(im, direction) for direction in directions]
+    if name == "shift_large":
+        im = synthetic_image(*image_shape(orientation, size))
+        return lambda: [shift_large(im, direction) for direction in directions]
+    if name == "prepare_full_panorama":
+
+        def run():
+            # source is decoded again, as on the first run of a job
+            clear_caches()
+            parts = prepare_full_panorama(impath, directions)
+            return [part.img for x in parts.values() for part in x]
+
+        return run
+    if name == "combine_parts":
+        parts = prepare_full_panorama(impath, directions)
+        for direction_parts in parts.values():
+            for part in direction_parts:
+                # pixels are pinned, only combining is measured
+                part.img = part.img
+
+        def run():
+            ret = []
+            for direction_parts in parts.values():
+                combined = direction_parts[0]
+                for part in direction_parts[1:]:
+                    combined = combine_parts(combined, part)
+                ret.append(combined)
+            return ret
+
+        return run
+    if name == "combine_images":
+
+        def run():
+            # images are decoded again, as in a new process
+            clear_caches(["IMAGE_STORE"])
+            return combine_images(impath, directions)
+
+        return run
+    raise ValueError(f"Unknown case {name}")
+
+
+CASES = [
+    "shift",
+    "shift_large",
+    "prepare_full_panorama",
+    "combine_parts",
+    "combine_images",
+]
+
+
+def peak_rss() -> int:
+    """
+    :return: peak resident memory of the process, bytes
+    """
+    # ru_maxrss survives exec on Linux, it may be the peak of the parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(
+    name: str, orientation: str, size: int, impath: str, repeat: int
+) -> Dict[str, float]:
+    """
+    Runs the case, meant to be run in a fresh process
+    :return: metrics of the case
+    """
+    run = setup_case(name, orientation, size, impath)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+        del result
+    # taken before tracemalloc, it allocates on its own
+    rss = peak_rss()
+    tracemalloc.start()
+    run()
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"wall_time": min(times), "peak_rss": rss, "allocated": allocated}
+
+
+def run_case(
+    name: str,
+    orientation: str,
+    size: int,
+    repeat: int,
+    root: Optional[str] = None,
+) -> Dict[str, float]:
+    """
+    Writes the inputs and measures the case in a new process
+    :param root: tree image_preparation is imported from in that process,
+        this one if None
+    """
+    folder = tempfile.mkdtemp(prefix="bench_")
+    try:
+        impath = write_inputs(folder, orientation, size)
+        context = multiprocessing.get_context("spawn")
+        os.environ[ROOT_ENV] = root or REPO_ROOT
+        try:
+            with context.Pool(1) as pool:
+                return pool.apply(
+                    measure, (name, orientation, size, impath, repeat)
+                )
+        finally:
+            os.environ.pop(ROOT_ENV)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def export_revision(revision: str, folder: str):
+    """
+    Writes the files of the git revision to the folder
+    :raise subprocess.CalledProcessError: if it's not a revision
+    """
+    archive = subprocess.run(
+        ["git", "-C", REPO_ROOT, "archive", revision],
+        check=True,
+        stdout=subprocess.PIPE,
+    )
+    with tarfile.open(fileobj=io.BytesIO(archive.stdout)) as tar:
+        tar.extractall(folder)
+
+
+def case_key(name: str, orientation: str, size: int) -> str:
+    return f"{name}/{orientation}/{size}"
+
+
+def machine() -> Dict[str, str]:
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def load_baselines(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"machine": None, "results": {}}
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baselines: Dict[str, Dict[str, float]],
+    time_tolerance: float,
+    memory_tolerance: float,
+) -> List[str]:
+    """
+    :return: description of every metric worse than its baseline
+        by more than the tolerance
+    """
+    regressions = []
+    for key, metrics in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        for metric in METRICS:
+            if metric not in baseline:
+                continue
+            if metric == "wall_time":
+                tolerance, floor = time_tolerance, MIN_TIME_DIFFERENCE
+            else:
+                tolerance, floor = memory_tolerance, MIN_MEMORY_DIFFERENCE
+            limit = max(
+                baseline[metric] * (1 + tolerance), baseline[metric] + floor
+            )
+            if metrics[metric] > limit:
+                regressions.append(
+                    f"{key} {metric}: {format_metric(metric, metrics[metric])}"
+                    f" > {format_metric(metric, baseline[metric])}"
+                )
+    return regressions
+
+
+def format_metric(metric: str, value: float) -> str:
+    if metric == "wall_time":
+        return f"{value:.4f}s"
+    return f"{value / 1024 ** 2:.1f}MB"
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the image_preparation hot paths"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(x) for x in DEFAULT_SIZES),
+        help="comma separated sizes along the seam",
+    )
+    parser.add_argument(
+        "--orientations",
+        default=",".join(ORIENTATIONS),
+        help="comma separated LEFT_RIGHT, UP_DOWN",
+    )
+    parser.add_argument(
+        "--cases",
+        default=",".join(CASES),
+        help="comma separated functions to benchmark",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--against",
+        metavar="REV",
+        help="git revision every case is run with as well, "
+        "regressions are reported against it",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=DEFAULT_BASELINE,
+        help="baselines stored on this machine with --update-baseline",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="store the results as the new baselines",
+    )
+    parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        default=0.25,
+        help="allowed relative increase of wall time",
+    )
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=0.1,
+        help="allowed relative increase of peak RSS and allocated bytes",
+    )
+    args = parser.parse_args(args)
+    sizes = [int(x) for x in args.sizes.split(",")]
+    orientations = args.orientations.split(",")
+    cases = args.cases.split(",")
+
+    base_root = None
+    if args.against:
+        base_root = tempfile.mkdtemp(prefix="bench_base_")
+    try:
+        if base_root is not None:
+            export_revision(args.against, base_root)
+        results = {}
+        base_results = {}
+        for name in cases:
+            for orientation in orientations:
+                for size in sizes:
+                    key = case_key(name, orientation, size)
+                    results[key] = run_case(
+                        name, orientation, size, args.repeat
+                    )
+                    print_metrics(key, results[key])
+                    if base_root is not None:
+                        base_results[key] = run_case(
+                            name, orientation, size, args.repeat, base_root
+                        )
+                        print_metrics(f"  {args.against}", base_results[key])
+    finally:
+        if base_root is not None:
+            shutil.rmtree(base_root, ignore_errors=True)
+
+    baselines = load_baselines(args.baseline)
+    if base_root is not None:
+        compared = base_results
+    else:
+        compared = baselines["results"]
+        if baselines["machine"] not in (None, machine()):
+            print("Baselines were measured on another machine:")
+            print(json.dumps(baselines["machine"], indent=4))
+    regressions = compare(
+        results,
+        compared,
+        args.time_tolerance,
+        args.memory_tolerance,
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if args.update_baseline:
+        baselines["machine"] = machine()
+        baselines["results"].update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=4, sort_keys=True)
+        print(f"Baselines are stored in {args.baseline}")
+        return 0
+    return 1 if regressions else 0
+
+
+def print_metrics(label: str, metrics: Dict[str, float]):
+    print(
+        f"{label:42}"
+        + "".join(
+            f"{metric} {format_metric(metric, metrics[metric]):>9}  "
+            for metric in METRICS
+        ),
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
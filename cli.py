@@ -0,0 +1,260 @@
+"""
+Generate panoramas without UI
+
+Example:
+    python cli.py images/*.png --directions LEFT_RIGHT --backend folder
+    python cli.py images/*.png --backend fill --backend-arg latency=0.5
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List
+
+from image_preparation import tracing
+from image_preparation.backends import BACKENDS
+from image_preparation.batch import (
+    BatchResult,
+    JobSettings,
+    expand_paths,
+    run_batch,
+)
+from image_preparation.blending import BlendMode
+from image_preparation.data.directions import CombinedDirections
+from image_preparation.geometry import TileGeometry
+from image_preparation.image_io import Codec
+
+
+def positive_int(value: str) -> int:
+    """
+    :return: value as int
+    :raise argparse.ArgumentTypeError: if value is not an int above 0
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a positive int")
+    return number
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Panorama dalle 2")
+    parser.add_argument(
+        "images",
+        nargs="+",
+        help="source images, glob patterns and folders are expanded",
+    )
+    parser.add_argument(
+        "--directions",
+        nargs="+",
+        choices=[x.name for x in CombinedDirections],
+        default=[CombinedDirections.LEFT_RIGHT.name],
+        help="both directions extend the image in one pass, corners included",
+    )
+    parser.add_argument(
+        "--backend", choices=list(BACKENDS), default="folder"
+    )
+    parser.add_argument(
+        "--backend-arg",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="argument of the backend, e.g. latency=0.5 for fill",
+    )
+    parser.add_argument(
+        "--tile-size",
+        type=positive_int,
+        default=1024,
+        help="size of the square images the backend generates",
+    )
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=1 / 3,
+        help="part of every tile repeated from the previous one",
+    )
+    parser.add_argument(
+        "--num-pixels",
+        type=int,
+        help="number of pixels to extend the image by, overrides --overlap",
+    )
+    parser.add_argument(
+        "--no-logo",
+        action="store_true",
+        help="generated images have no logo to cut off",
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=1,
+        help="number of parts of an image generated at the same time",
+    )
+    parser.add_argument(
+        "--processes",
+        type=positive_int,
+        default=1,
+        help="number of images generated at the same time, each in its own "
+        "process (--trace records only the first process)",
+    )
+    parser.add_argument(
+        "--blend",
+        choices=[str(x) for x in BlendMode],
+        default=str(BlendMode.NONE),
+        help="blending of the seams between generated parts "
+        "(only when extending in one direction)",
+    )
+    parser.add_argument(
+        "--cache", help="folder of the cache of generated parts"
+    )
+    parser.add_argument(
+        "--prompt", default="", help="prompt the parts are generated with"
+    )
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="write only the combined images, parts are kept in memory "
+        "(not with the folder backend, nothing to resume from)",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=[str(Codec.FAST), str(Codec.NPY)],
+        default=str(Codec.FAST),
+        help="codec of the intermediate files, npy is not encoded at all "
+        "(not with the folder backend)",
+    )
+    parser.add_argument(
+        "--final-codec",
+        choices=[str(Codec.FAST), str(Codec.SMALL)],
+        default=str(Codec.FAST),
+        help="codec of the combined images, small is slower to encode",
+    )
+    parser.add_argument(
+        "--canvas-folder",
+        help="keep the canvas of the combined images in a memory-mapped "
+        "file in this folder instead of RAM, for panoramas that don't fit",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="start over instead of resuming an interrupted panorama",
+    )
+    parser.add_argument(
+        "--trace",
+        help="write timing spans of every stage to this JSON file",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=["json", "chrome"],
+        default="json",
+        help="chrome writes Chrome trace format (chrome://tracing)",
+    )
+    return parser.parse_args(argv)
+
+
+def parse_backend_args(args: List[str]) -> Dict[str, Any]:
+    """
+    :param args: NAME=VALUE strings, values are parsed as JSON if they can be
+    :return: keyword arguments of the backend
+    """
+    ret = {}
+    for arg in args:
+        name, sep, value = arg.partition("=")
+        if not sep:
+            raise ValueError(f"Backend argument {arg} is not NAME=VALUE")
+        try:
+            ret[name.replace("-", "_")] = json.loads(value)
+        except ValueError:
+            ret[name.replace("-", "_")] = value
+    return ret
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.trace:
+        tracing.enable()
+    directions = [
+        direction
+        for name in dict.fromkeys(args.directions)
+        for direction in CombinedDirections[name].to_directions()
+    ]
+    logo_size = (0, 0) if args.no_logo else (17, 81)
+    option = "--num-pixels" if args.num_pixels is not None else "--overlap"
+    try:
+        if args.num_pixels is not None:
+            geometry = TileGeometry(
+                args.tile_size, args.tile_size - args.num_pixels, logo_size
+            )
+        else:
+            geometry = TileGeometry.from_ratio(
+                args.tile_size, args.overlap, logo_size
+            )
+    except ValueError as e:
+        print(f"{option}: {e}", file=sys.stderr)
+        return 2
+    reads_done_files = BACKENDS[args.backend].reads_done_files
+    if args.in_memory and reads_done_files:
+        print(
+            f"--in-memory: {args.backend} backend reads _done files",
+            file=sys.stderr,
+        )
+        return 2
+    grid = len(set(args.directions)) > 1
+    if grid and args.blend != str(BlendMode.NONE):
+        print(
+            "--blend: seams are not blended when the image is extended "
+            "in both directions",
+            file=sys.stderr,
+        )
+        return 2
+    if args.codec == str(Codec.NPY) and reads_done_files:
+        print(
+            f"--codec: {args.backend} backend reads _done files",
+            file=sys.stderr,
+        )
+        return 2
+    try:
+        settings = JobSettings(
+            directions,
+            geometry=geometry,
+            backend=args.backend,
+            backend_args=parse_backend_args(args.backend_arg),
+            cache_folder=args.cache,
+            prompt=args.prompt,
+            blend=BlendMode(args.blend),
+            resume=not args.restart,
+            grid=grid,
+            max_workers=args.workers,
+            in_memory=args.in_memory,
+            codec=Codec(args.codec),
+            final_codec=Codec(args.final_codec),
+            canvas_folder=args.canvas_folder,
+        )
+        settings.make_backend().close()
+    except (TypeError, ValueError) as e:
+        print(f"--backend-arg: {e}", file=sys.stderr)
+        return 2
+    impaths = expand_paths(args.images)
+
+    def report(result: BatchResult):
+        if result.ok:
+            print("saved", result.result_path)
+        else:
+            # one broken image doesn't stop the whole batch
+            print(f"failed {result.impath}", file=sys.stderr)
+            print(result.error, file=sys.stderr)
+
+    results = run_batch(impaths, settings, args.processes, on_result=report)
+    failed = sum(not result.ok for result in results)
+    print(f"DONE {len(impaths) - failed}/{len(impaths)}")
+    if args.trace:
+        tracing.export(args.trace, chrome=args.trace_format == "chrome")
+        for name, stage in sorted(
+            tracing.summary().items(), key=lambda x: -x[1]["total"]
+        ):
+            print(f"{name:10} {stage['count']:6} {stage['total']:10.3f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
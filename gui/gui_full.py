@@ -10,24 +10,76 @@ It should be able to:
 For now it's semi-automatic process. Image generation is on user.
 TODO: Later use api module for image generation.
 """
+
 import os
 import tkinter as tk
 import tkinter.filedialog
-from typing import List, Dict
+import tkinter.messagebox
+from typing import Optional, Tuple
 
 import cv2
 import numpy as np
 
-from image_preparation import cut_logo
-from image_preparation.data import Directions, PanoramaPart
+from image_preparation.blending import BlendMode
 from image_preparation.data.directions import CombinedDirections
-from image_preparation.panorama_dalle2 import (
-    combine_parts,
-    combine_images,
-    prepare_full_panorama,
+from image_preparation.geometry import DEFAULT_GEOMETRY
+from image_preparation.grid_job import GridJob
+from image_preparation.panorama_dalle2 import combine_images
+from image_preparation.panorama_job import PanoramaJob, done_path
+from image_preparation.preview import (
+    PreviewPyramid,
+    load_fit,
+    open_preview_pyramid,
 )
+from image_preparation.result_cache import DEFAULT_CACHE_FOLDER, ResultCache
+from image_preparation.tracing import span
+from image_preparation.watcher import DoneWatcher
 from PIL import Image, ImageTk
 
+from gui.worker import BackgroundWorker
+
+# size of the area the image is shown in
+VIEW_WIDTH = 1600
+VIEW_HEIGHT = 700
+
+
+def to_pil(im: np.ndarray) -> Image.Image:
+    """
+    Converts image read by OpenCV to PIL image
+    """
+    if im.ndim == 2:
+        return Image.fromarray(im)
+    if im.shape[2] == 4:
+        return Image.fromarray(cv2.cvtColor(im, cv2.COLOR_BGRA2RGBA))
+    return Image.fromarray(cv2.cvtColor(im, cv2.COLOR_BGR2RGB))
+
+
+def load_view(
+    impath: str, level: Optional[int], center: Tuple[float, float]
+) -> Tuple[Image.Image, Optional[PreviewPyramid]]:
+    """
+    Reads the part of the image that is shown
+    Doesn't touch Tk, so it's safe to call from a background thread
+    :param impath: path to the image
+    :param level: level of the pyramid shown 1:1, None to fit the image
+    :param center: center of the shown area relative to the image size
+    :return: image to show and the pyramid of the image
+    """
+    with span("view", path=impath, level=level):
+        pyramid = open_preview_pyramid(impath)
+        if level is None or pyramid is None:
+            return to_pil(load_fit(impath, VIEW_WIDTH, VIEW_HEIGHT)), pyramid
+        height, width = pyramid.level_shape(level)
+        top = int(center[1] * height - VIEW_HEIGHT / 2)
+        left = int(center[0] * width - VIEW_WIDTH / 2)
+        top = max(min(top, height - VIEW_HEIGHT), 0)
+        left = max(min(left, width - VIEW_WIDTH), 0)
+        im = pyramid.region(level, top, left, VIEW_HEIGHT, VIEW_WIDTH)
+        if im is None:
+            # pyramid was written again meanwhile, the image is decoded
+            return to_pil(load_fit(impath, VIEW_WIDTH, VIEW_HEIGHT)), None
+        return to_pil(im), pyramid
+
 
 class MainWindowFull(tk.Tk):
     def __init__(self, *args, **kwargs):
@@ -38,17 +90,35 @@ class MainWindowFull(tk.Tk):
         self.filename = None
         self.impath = None
         self.directions = None
-        self.parts: Dict[Directions, List[PanoramaPart]] = {}
-        self.current_part = None
-        self.current_direction = None
+        self.job: Optional[PanoramaJob] = None
+        # parts generated before are put next to the part right away,
+        # only if the user asks for it: hand-generated parts can't be told
+        # apart by their prompt, so a cached one would never be regenerated
+        self.use_cache = tk.BooleanVar(value=False)
         self.chosen_directions = [
             tk.Variable(value="0"),
             tk.Variable(value="0"),
         ]
-        self.num_pixels = 1024 - 1024 // 3
+        self.blend = tk.StringVar(value=str(BlendMode.NONE))
+        # go to the next part as soon as the current one is generated
+        self.auto_advance = tk.BooleanVar(value=False)
+        self.watcher: Optional[DoneWatcher] = None
+        self.tile_geometry = DEFAULT_GEOMETRY
         self.prepare_panorama_button = None
         self.next_part_ready_button = None
+        self.progress_label = None
+        # shown image, its pyramid level (None fits the image) and center
+        self.view_path: Optional[str] = None
+        self.view_level: Optional[int] = None
+        self.view_center = (0.5, 0.5)
+        self.view_pyramid: Optional[PreviewPyramid] = None
+        self.view_outdated = False
+        self.pan_start = (0, 0)
         self.create_widgets()
+        # reading, combining and writing images don't block the window
+        self.worker = BackgroundWorker(
+            self, on_progress=self.show_progress, on_error=self.show_error
+        )
 
     def create_widgets(self):
         # left column is buttons only
@@ -84,8 +154,38 @@ class MainWindowFull(tk.Tk):
                 directions_frame.pack(fill=tk.BOTH, expand=False)
             self.directions_checkboxes.append(checkbox)
 
+        # blending of the seams
+        blend_frame = tk.Frame(left_column)
+        blend_frame.pack(fill=tk.BOTH, expand=False)
+        tk.Label(blend_frame, text="Blend seams").pack(side=tk.LEFT)
+        self.blend_menu = tk.OptionMenu(
+            blend_frame, self.blend, *[str(x) for x in BlendMode]
+        )
+        self.blend_menu.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.auto_advance_checkbox = tk.Checkbutton(
+            left_column,
+            text="Next part when _done is saved",
+            variable=self.auto_advance,
+            command=self.advance_if_done,
+        )
+        self.auto_advance_checkbox.pack(fill=tk.X, expand=False)
+
+        self.use_cache_checkbox = tk.Checkbutton(
+            left_column,
+            text="Reuse cached parts",
+            variable=self.use_cache,
+        )
+        self.use_cache_checkbox.pack(fill=tk.X, expand=False)
+
         self.image_label = tk.Label(right_column)
         self.image_label.pack(fill=tk.BOTH, expand=True)
+        # zoom with mouse wheel, pan by dragging
+        self.image_label.bind("<MouseWheel>", self.zoom)
+        self.image_label.bind("<Button-4>", self.zoom)
+        self.image_label.bind("<Button-5>", self.zoom)
+        self.image_label.bind("<ButtonPress-1>", self.start_pan)
+        self.image_label.bind("<B1-Motion>", self.pan)
 
         # prepare panorama button
         self.prepare_panorama_button = tk.Button(
@@ -103,6 +203,10 @@ class MainWindowFull(tk.Tk):
         )
         self.next_part_ready_button.pack(fill=tk.X, expand=True)
 
+        # what's being done in the background
+        self.progress_label = tk.Label(left_column, text="", anchor=tk.W)
+        self.progress_label.pack(fill=tk.X, expand=True)
+
         # combine images button
         # self.combine_images_button = tk.Button(
         #     left_column,
@@ -112,6 +216,8 @@ class MainWindowFull(tk.Tk):
         # self.combine_images_button.pack(fill=tk.X, expand=True)
 
     def prepare_panorama(self):
+        if self.worker.busy:
+            return
         chosen_directions = [
             direction if x.get() == "1" else None
             for x, direction in zip(self.chosen_directions, CombinedDirections)
@@ -122,171 +228,97 @@ class MainWindowFull(tk.Tk):
         chosen_directions = [
             direction for direction in chosen_directions if direction
         ]
-        if len(chosen_directions) > 1:
-            raise ValueError("Only one combined direction is supported")
-
-        if CombinedDirections.LEFT_RIGHT in chosen_directions:
-            self.directions = [Directions.LEFT, Directions.RIGHT]
-        elif CombinedDirections.UP_DOWN in chosen_directions:
-            self.directions = [Directions.UP, Directions.DOWN]
+        if chosen_directions:
+            self.directions = [
+                direction
+                for combined in chosen_directions
+                for direction in combined.to_directions()
+            ]
         self.impath = self.filename
         if self.impath:
-            self.parts: Dict[
-                Directions, List[PanoramaPart]
-            ] = prepare_full_panorama(self.impath, self.directions)
-            for dir in self.parts:
-                print(dir, len(self.parts[dir]))
-
-            # View OK pop-up and tell paths to the generated images
-            self.view_ok_popup()
-
-    def get_done(self, part: PanoramaPart):
-        folder = os.path.dirname(part.path)
-        basename = os.path.basename(part.path)
-        basename_without_extension = os.path.splitext(basename)[0]
-        done_path = os.path.join(
-            folder, basename_without_extension + f"_done.png"
-        )
-        if not os.path.exists(done_path):
-            raise ValueError(f"{done_path} does not exist")
-        im = cv2.imread(done_path, cv2.IMREAD_UNCHANGED)
-        im = cv2.cvtColor(im, cv2.COLOR_RGB2RGBA)
-        return PanoramaPart(
-            path=done_path,
-            direction=part.direction,
-            img=cut_logo(im),
-            part_number=part.part_number,
-        )
-
-    def combine_parts(
-        self,
-        parts: List[PanoramaPart],
-        num_pixels: int = 1024 // 3,
-        default_shape=1024,
-    ) -> np.ndarray:
-        for part in parts:
-            part.img = self.get_done(part).img
-        result_img = parts[0].img
-        # result-img save to
-
-        direction: Directions = parts[0].direction
-        for part in parts[1:]:
-            # concatenate images given direction
-            # UP and DOWN are concatenated left to right
-            # LEFT and RIGHT are concatenated top to bottom
-            # using np.concatenate.
-            # result_img should be cut to the num_pixels from border.
-            # New part is concatenated fully
-            # each cycle result_img is cut to the num_pixels from border
-            if direction == Directions.UP or direction == Directions.DOWN:
-                result_img = np.concatenate(
-                    (
-                        result_img[:, :-num_pixels],
-                        part.img,
-                    ),
-                    axis=1,
-                )
-            elif direction == Directions.LEFT or direction == Directions.RIGHT:
-                result_img = np.concatenate(
-                    (
-                        result_img[:-num_pixels, :],
-                        part.img,
+            # both axes are extended at once, corners included
+            job_class = GridJob if len(chosen_directions) > 1 else PanoramaJob
+            try:
+                self.job = job_class(
+                    self.impath,
+                    self.directions,
+                    geometry=self.tile_geometry,
+                    cache=(
+                        ResultCache(DEFAULT_CACHE_FOLDER)
+                        if self.use_cache.get()
+                        else None
                     ),
-                    axis=0,
+                    blend=BlendMode(self.blend.get()),
+                    write_previews=True,
                 )
-
-        folder = os.path.dirname(self.impath)
-        basename = os.path.basename(self.impath)
-        basename_without_extension = os.path.splitext(basename)[0]
-        result_path = os.path.join(
-            folder, basename_without_extension + f"_{direction}_done.png"
-        )
-        print("saving", result_path)
-        cv2.imwrite(result_path, result_img)
-        return result_img
+            except ValueError as e:
+                # e.g. blending is chosen for both directions
+                self.show_error(e)
+                return
+            self.job.progress = self.worker.progress
+            self.watch_folder()
+            self.worker.progress("preparing panorama")
+            self.worker.submit(self.job.prepare, on_done=self.prepared)
+
+    def prepared(self, parts):
+        for dir in parts:
+            print(dir, len(parts[dir]))
+        self.show_progress("")
+
+        # View OK pop-up and tell paths to the generated images
+        self.view_ok_popup()
+        if self.auto_advance.get():
+            # show the first part right away
+            self.next_part()
 
     def next_part(self):
         """
+        Shows the next part to generate,
+        the combined image after the last one
+        """
+        if self.job is None or self.worker.busy:
+            return
+
+        self.worker.submit(self.job.next_part, on_done=self.show_next_part)
+
+    def show_next_part(self, part):
+        self.show_progress("")
+        if part is None:
+            # show _full image
+            self.display_image(self.job.result_path)
+            self.view_ok_popup()
+            return
+        self.display_image(part.path)
 
-        :return:
+    def watch_folder(self):
         """
-        if (
-            self.parts is not None
-            and self.current_part is None
-            and self.current_direction is None
-        ):
-            self.current_part = 0
-            self.current_direction = list(self.parts.keys())[0]
-
-            cv2.imwrite(
-                self.parts[self.current_direction][self.current_part].path,
-                self.parts[self.current_direction][self.current_part].img,
-            )
-            self.display_image(
-                self.parts[self.current_direction][self.current_part].path
-            )
-        elif (
-            self.parts is not None
-            and self.current_part is not None
-            and self.current_direction is not None
-        ):
-            # merge parts together
-            try:
-                done_part = self.get_done(
-                    self.parts[self.current_direction][self.current_part]
-                )
-                self.parts[self.current_direction][
-                    self.current_part + 1
-                ] = combine_parts(
-                    done_part,
-                    self.parts[self.current_direction][self.current_part + 1],
-                )
-            except IndexError:
-                pass
-            self.current_part += 1
-            max_part = len(self.parts[self.current_direction]) - 1
-            if self.current_part > max_part:
-                # merge image on direction
-                self.combine_parts(self.parts[self.current_direction])
-
-                # get next part
-                self.current_part = 0
-                current_dir_id = list(self.parts.keys()).index(
-                    self.current_direction
-                )
-                try:
-                    self.current_direction = list(self.parts.keys())[
-                        current_dir_id + 1
-                    ]
-                except IndexError:
-                    # self.combine_parts(self.parts[self.current_direction])
-                    combine_images(
-                        impath=self.impath, directions=list(self.parts.keys())
-                    )
-
-                    # show _full image
-                    folder = os.path.dirname(self.impath)
-                    basename = os.path.basename(self.impath)
-                    basename_without_extension = os.path.splitext(basename)[0]
-                    result_path = os.path.join(
-                        folder, basename_without_extension + f"_full.png"
-                    )
-                    self.display_image(result_path)
-                    self.view_ok_popup()
-                    return
-            # write next part on disk
-            cv2.imwrite(
-                self.parts[self.current_direction][self.current_part].path,
-                self.parts[self.current_direction][self.current_part].img,
-            )
-            self.display_image(
-                self.parts[self.current_direction][self.current_part].path
-            )
+        Watches the folder of the image for saved _done files
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+        folder = os.path.dirname(os.path.abspath(self.impath))
+        self.watcher = DoneWatcher(
+            folder,
+            # called from the watcher thread
+            on_done=lambda path: self.worker.post(self.advance_if_done),
+        ).start()
+
+    def advance_if_done(self):
+        """
+        Goes to the next part if auto advance is on and the current part
+        is saved completely
+        """
+        if not self.auto_advance.get() or self.watcher is None:
+            return
+        if self.job is None or self.job.current is None:
+            return
+        if self.watcher.is_done(done_path(self.job.current.path)):
+            self.next_part()
 
     def view_ok_popup(self):
         """Displays message Success and 'Press to close' button
         that closes window"""
-        popup = tk.Tk()
+        popup = tk.Toplevel(self)
         popup.title("Success")
         popup.geometry("300x100")
         popup.resizable(False, False)
@@ -296,47 +328,110 @@ class MainWindowFull(tk.Tk):
         label.pack(fill=tk.BOTH, expand=True)
         button = tk.Button(popup, text="Press to close", command=popup.destroy)
         button.pack(fill=tk.BOTH, expand=True)
-        popup.mainloop()
+
+    def show_error(self, error: BaseException):
+        self.show_progress("")
+        tkinter.messagebox.showerror("Error", str(error), parent=self)
+
+    def show_progress(self, text: str):
+        self.progress_label.configure(text=text)
 
     def combine_images(self):
         self.impath = self.filename
-        combined_path = combine_images(
-            self.impath, self.directions, self.num_pixels
+        self.worker.progress("combining images")
+        self.worker.submit(
+            combine_images,
+            self.impath,
+            self.directions,
+            self.tile_geometry,
+            write_preview=True,
+            # display combined image
+            on_done=self.display_image,
         )
 
-        # display combined image
-        self.display_image(combined_path)
-
     def load_image(self):
         self.filename = tk.filedialog.askopenfilename(
             filetypes=[("Image files", "*.png *.jpg")]
         )
+        if not self.filename:
+            return
         self.impath = self.filename
         self.display_image(self.impath)
 
         self.title(f"Panorama dalle 2 - {self.filename}")
 
     def display_image(self, impath):
-        # Display loaded image
-        im = Image.open(impath)
-        # resize image to 600xN where N is height
-        # of image with respect to it's width if height is greater
-        # or if width is greater than height, resize to Nx600
-        # if im.height > im.width:
-        #     im = im.resize((600, int(im.height * 600 / im.width)))
-        # else:
-        #     im = im.resize((int(im.width * 600 / im.height), 600))
-
-        # but maximum width is 1600
-        # and maximum height is 800
-        if im.width > 1600:
-            im = im.resize((1600, int(im.height * 1600 / im.width)))
-        if im.height > 700:
-            im = im.resize((int(im.width * 700 / im.height), 700))
+        # whole image fits the window
+        self.view_path = impath
+        self.view_level = None
+        self.view_center = (0.5, 0.5)
+        self.view_pyramid = None
+        self.update_view()
+
+    def update_view(self):
+        """
+        Reads the shown area in the background
+        While it's busy, only the latest view is read after it
+        """
+        if self.view_path is None:
+            return
+        if self.worker.busy:
+            self.view_outdated = True
+            return
+        self.view_outdated = False
+        self.worker.submit(
+            load_view,
+            self.view_path,
+            self.view_level,
+            self.view_center,
+            on_done=self.show_view,
+        )
 
+    def show_view(self, result):
+        im, self.view_pyramid = result
         im = ImageTk.PhotoImage(im)
         self.image_label.configure(image=im)
         self.image_label.image = im
+        if self.view_outdated:
+            self.update_view()
+        # part may have been generated while the window was busy
+        self.advance_if_done()
+
+    def zoom(self, event):
+        pyramid = self.view_pyramid
+        if pyramid is None:
+            return
+        zoom_in = event.num == 4 or event.delta > 0
+        fit_level = pyramid.fit_level(VIEW_WIDTH, VIEW_HEIGHT)
+        level = fit_level if self.view_level is None else self.view_level
+        level = level - 1 if zoom_in else level + 1
+        if level >= fit_level:
+            # image fits the window again
+            self.view_level = None
+        else:
+            self.view_level = max(level, 0)
+        self.update_view()
+
+    def start_pan(self, event):
+        self.pan_start = (event.x, event.y)
+
+    def pan(self, event):
+        if self.view_pyramid is None or self.view_level is None:
+            return
+        height, width = self.view_pyramid.level_shape(self.view_level)
+        dx, dy = event.x - self.pan_start[0], event.y - self.pan_start[1]
+        self.pan_start = (event.x, event.y)
+        self.view_center = (
+            min(max(self.view_center[0] - dx / width, 0), 1),
+            min(max(self.view_center[1] - dy / height, 0), 1),
+        )
+        self.update_view()
+
+    def destroy(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.worker.shutdown()
+        super().destroy()
 
 
 if __name__ == "__main__":
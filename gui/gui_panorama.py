@@ -11,8 +11,12 @@ import tkinter as tk
 import tkinter.filedialog
 
 from image_preparation.data import Directions
+from image_preparation.geometry import DEFAULT_GEOMETRY
 from image_preparation.panorama_dalle2 import prepare_panorama, combine_images
-from PIL import Image, ImageTk
+from image_preparation.preview import load_fit
+from PIL import ImageTk
+
+from gui.gui_full import VIEW_HEIGHT, VIEW_WIDTH, to_pil
 
 
 class MainWindow(tk.Tk):
@@ -30,7 +34,7 @@ class MainWindow(tk.Tk):
             tk.Variable(value='0'),
             tk.Variable(value='0'),
         ]
-        self.num_pixels = None
+        self.tile_geometry = None
         self.prepare_panorama_button = None
         self.combine_images_button = None
         self.create_widgets()
@@ -99,10 +103,12 @@ class MainWindow(tk.Tk):
             direction for direction in self.directions if direction
         ]
         print(self.directions)
-        self.num_pixels = 1024 - 1024 // 3
+        self.tile_geometry = DEFAULT_GEOMETRY
         self.impath = self.filename
         if self.impath:
-            prepare_panorama(self.impath, self.directions)
+            prepare_panorama(
+                self.impath, self.directions, self.tile_geometry
+            )
 
             # View OK pop-up and tell paths to the generated images
             self.view_ok_popup()
@@ -124,7 +130,12 @@ class MainWindow(tk.Tk):
 
     def combine_images(self):
         self.impath = self.filename
-        combined_path = combine_images(self.impath, self.directions, self.num_pixels)
+        combined_path = combine_images(
+            self.impath,
+            self.directions,
+            self.tile_geometry,
+            write_preview=True,
+        )
 
         # display combined image
         self.display_image(combined_path)
@@ -139,23 +150,8 @@ class MainWindow(tk.Tk):
         self.title(f"Panorama dalle 2 - {self.filename}")
 
     def display_image(self, impath):
-        # Display loaded image
-        im = Image.open(impath)
-        # resize image to 600xN where N is height
-        # of image with respect to it's width if height is greater
-        # or if width is greater than height, resize to Nx600
-        # if im.height > im.width:
-        #     im = im.resize((600, int(im.height * 600 / im.width)))
-        # else:
-        #     im = im.resize((int(im.width * 600 / im.height), 600))
-
-        # but maximum width is 1600
-        # and maximum height is 800
-        if im.width > 1600:
-            im = im.resize((1600, int(im.height * 1600 / im.width)))
-        if im.height > 700:
-            im = im.resize((int(im.width * 700 / im.height), 700))
-
+        # only the level of the preview pyramid that fits is read
+        im = to_pil(load_fit(impath, VIEW_WIDTH, VIEW_HEIGHT))
         im = ImageTk.PhotoImage(im)
         self.image_label.configure(image=im)
         self.image_label.image = im
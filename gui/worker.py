@@ -0,0 +1,102 @@
+"""
+Background work for the windows
+
+Tk is not thread-safe, so the work is done in a thread pool and its
+results, errors and progress messages are put to a queue. The queue is
+polled from the Tk event loop with after(), where the callbacks run.
+"""
+import queue
+import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class BackgroundWorker:
+    def __init__(
+        self,
+        root: tk.Misc,
+        max_workers: int = 1,
+        poll_interval: int = 50,
+        on_progress: Optional[Callable[[str], None]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ):
+        """
+        :param root: widget whose event loop runs the callbacks
+        :param max_workers: number of functions run at the same time
+        :param poll_interval: milliseconds between checks of the queue
+        :param on_progress: called with every progress message
+        :param on_error: called with errors of functions without on_error
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.pending = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._queue: "queue.Queue[Callable[[], None]]" = queue.Queue()
+        self._poll()
+
+    @property
+    def busy(self) -> bool:
+        return self.pending > 0
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        on_done: Optional[Callable[[Any], None]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+        **kwargs,
+    ) -> Future:
+        """
+        Runs fn(*args, **kwargs) in the background
+        :param on_done: called in the Tk thread with the result
+        :param on_error: called in the Tk thread with the raised error
+        """
+        self.pending += 1
+        future = self._pool.submit(fn, *args, **kwargs)
+
+        def finished(future: Future):
+            # runs in the Tk thread
+            self.pending -= 1
+            error = future.exception()
+            if error is None:
+                if on_done is not None:
+                    on_done(future.result())
+            elif on_error is not None:
+                on_error(error)
+            elif self.on_error is not None:
+                self.on_error(error)
+            else:
+                raise error
+
+        future.add_done_callback(
+            lambda future: self._queue.put(lambda: finished(future))
+        )
+        return future
+
+    def progress(self, text: str):
+        """
+        Reports progress, safe to call from any thread
+        """
+        if self.on_progress is not None:
+            self._queue.put(lambda: self.on_progress(text))
+
+    def post(self, fn: Callable[..., None], *args):
+        """
+        Calls fn(*args) in the Tk thread, safe to call from any thread
+        """
+        self._queue.put(lambda: fn(*args))
+
+    def _poll(self):
+        try:
+            while True:
+                self._queue.get_nowait()()
+        except queue.Empty:
+            pass
+        finally:
+            # keep polling even if a callback has raised
+            self.root.after(self.poll_interval, self._poll)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
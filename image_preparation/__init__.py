@@ -1 +1,12 @@
-from .image_edit import shift, cut_logo, replace_logo, shift_large
+from .image_edit import (
+    shift,
+    cut_logo,
+    replace_logo,
+    shift_large,
+    iter_shift_large,
+    shift_view,
+    tile_windows,
+    ShiftedImage,
+)
+from .geometry import DEFAULT_GEOMETRY, TileGeometry
+from .masked_tile import MaskedTile
@@ -0,0 +1,195 @@
+"""
+Inpainting backends
+
+Backend gets a part of the panorama with transparent pixels to be
+generated and returns the generated image of the same size.
+OpenCVBackend and SeededFillBackend generate parts locally and
+deterministically, so the whole pipeline can be run without a generator,
+e.g. to test the scheduler, the cache and combining under load.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+import time
+import zlib
+from typing import Dict, Optional, Type
+
+import cv2
+import numpy as np
+
+from image_preparation.data import PanoramaPart
+from image_preparation.image_store import read_rgba
+from image_preparation.watcher import DoneWatcher
+
+
+class InpaintingBackend(ABC):
+    # True if the backend returns images the user saved as _done files,
+    # so they are not written again
+    reads_done_files: bool = False
+
+    def params(self) -> dict:
+        """
+        :return: parameters that affect the generated images,
+            cached results are reused only for the same parameters
+        """
+        return {"backend": type(self).__name__}
+
+    @abstractmethod
+    def inpaint(self, part: PanoramaPart, done_path: str) -> np.ndarray:
+        """
+        Generates transparent pixels of the part
+        :param part: part to generate, alpha is 0 where pixels are generated
+        :param done_path: path the generated part is expected at
+        :return: generated RGBA image of the same size as part.img
+        """
+
+    def close(self):
+        """
+        Releases resources of the backend
+        """
+
+
+class FolderBackend(InpaintingBackend):
+    """
+    Waits for the generated part to be saved next to the part,
+    that's how parts are generated by hand in the web browser
+    The folder is watched, so the part is picked up as soon as it's saved
+    """
+
+    reads_done_files = True
+
+    def __init__(
+        self, poll_interval: float = 1.0, timeout: Optional[float] = None
+    ):
+        """
+        :param poll_interval: seconds between checks for the _done file
+            if the folder can't be watched with inotify
+        :param timeout: seconds to wait for the _done file, None is forever
+        """
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._watchers: Dict[str, DoneWatcher] = {}
+        self._lock = threading.Lock()
+
+    def watcher(self, folder: str) -> DoneWatcher:
+        """
+        :return: running watcher of the folder, one per folder
+        """
+        folder = os.path.abspath(folder)
+        with self._lock:
+            if folder not in self._watchers:
+                self._watchers[folder] = DoneWatcher(
+                    folder, poll_interval=self.poll_interval
+                ).start()
+            return self._watchers[folder]
+
+    def inpaint(self, part: PanoramaPart, done_path: str) -> np.ndarray:
+        watcher = self.watcher(os.path.dirname(done_path))
+        if not watcher.wait(done_path, self.timeout):
+            raise TimeoutError(f"{done_path} did not appear")
+        # decoded by the watcher already, the job reads it from the store
+        return read_rgba(done_path)
+
+    def close(self):
+        """
+        Stops watching the folders, parts waited for are not generated
+        Folders are watched again when the backend is used again
+        """
+        with self._lock:
+            for watcher in self._watchers.values():
+                watcher.stop()
+            self._watchers.clear()
+
+
+def generated_mask(im: np.ndarray) -> np.ndarray:
+    """
+    :return: bool mask of the pixels to generate, True where alpha is 0
+    """
+    return im[..., 3] == 0
+
+
+class OpenCVBackend(InpaintingBackend):
+    """
+    Fills the transparent pixels with cv2.inpaint
+    """
+
+    def __init__(self, method: str = "telea", radius: int = 3):
+        """
+        :param method: "telea" or "ns" (Navier-Stokes) cv2.inpaint method
+        :param radius: radius of the neighbourhood of every inpainted pixel
+        """
+        if method not in ("telea", "ns"):
+            raise ValueError(f"Unknown inpainting method {method}")
+        self.method = method
+        self.radius = radius
+
+    def params(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "method": self.method,
+            "radius": self.radius,
+        }
+
+    def inpaint(self, part: PanoramaPart, done_path: str) -> np.ndarray:
+        im = part.img
+        mask = generated_mask(im)
+        flags = cv2.INPAINT_TELEA if self.method == "telea" else cv2.INPAINT_NS
+        ret = np.array(im)
+        ret[..., :3] = cv2.inpaint(
+            np.ascontiguousarray(im[..., :3]),
+            mask.astype(np.uint8),
+            self.radius,
+            flags,
+        )
+        ret[mask, 3] = 255
+        return ret
+
+
+class SeededFillBackend(InpaintingBackend):
+    """
+    Fills the transparent pixels with noise around the mean color
+    of the known pixels, after a configurable delay
+    The noise is seeded by the seed and the pixels of the part,
+    so the same part is always generated the same way
+    """
+
+    def __init__(
+        self, seed: int = 0, latency: float = 0.0, jitter: float = 0.0
+    ):
+        """
+        :param seed: seed of the generated pixels
+        :param latency: seconds every part takes to generate
+        :param jitter: up to this many seconds are added to the latency,
+            seeded as well
+        """
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+
+    def params(self) -> dict:
+        # latency doesn't change the generated images
+        return {"backend": type(self).__name__, "seed": self.seed}
+
+    def inpaint(self, part: PanoramaPart, done_path: str) -> np.ndarray:
+        im = part.img
+        rng = np.random.default_rng(
+            [self.seed, zlib.crc32(np.ascontiguousarray(im).data)]
+        )
+        delay = self.latency + self.jitter * rng.random()
+        if delay > 0:
+            time.sleep(delay)
+        mask = generated_mask(im)
+        known = im[~mask, :3]
+        mean = known.mean(axis=0) if len(known) else np.full(3, 127.0)
+        noise = rng.normal(0, 16, (int(mask.sum()), 3))
+        ret = np.array(im)
+        ret[mask, :3] = np.clip(mean + noise, 0, 255).astype(im.dtype)
+        ret[mask, 3] = 255
+        return ret
+
+
+BACKENDS: Dict[str, Type[InpaintingBackend]] = {
+    "folder": FolderBackend,
+    "opencv": OpenCVBackend,
+    "fill": SeededFillBackend,
+}
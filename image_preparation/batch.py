@@ -0,0 +1,207 @@
+"""
+Panoramas of many source images in parallel processes
+
+Every source image is generated by its own job in a process of the pool,
+so decoding, encoding and combining of different images use all the
+cores. Workers get paths and settings of the jobs and write the results
+to disk, no pixels are pickled between the processes. An image that fails
+doesn't stop the other ones, its traceback is returned in its result.
+"""
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from image_preparation.backends import BACKENDS, InpaintingBackend
+from image_preparation.blending import BlendMode
+from image_preparation.data import Directions
+from image_preparation.geometry import DEFAULT_GEOMETRY, TileGeometry
+from image_preparation.grid_job import GridJob
+from image_preparation.image_io import Codec
+from image_preparation.panorama_job import PanoramaJob
+from image_preparation.result_cache import ResultCache
+
+
+@dataclass
+class JobSettings:
+    """
+    Everything a job needs besides its source image,
+    it's sent to the worker processes
+    """
+
+    directions: List[Directions]
+    geometry: TileGeometry = DEFAULT_GEOMETRY
+    # name of the backend in BACKENDS and its keyword arguments
+    backend: str = "folder"
+    backend_args: dict = field(default_factory=dict)
+    cache_folder: Optional[str] = None
+    prompt: str = ""
+    blend: BlendMode = BlendMode.NONE
+    resume: bool = True
+    # if True, all the directions are generated at once by GridJob
+    grid: bool = False
+    # number of parts of one image generated at the same time
+    max_workers: int = 1
+    # if True, only the combined images are written
+    in_memory: bool = False
+    # codecs of the intermediate files and of the combined images
+    codec: Codec = Codec.FAST
+    final_codec: Codec = Codec.FAST
+    # if set, canvases of the combined images are memory-mapped files in it
+    canvas_folder: Optional[str] = None
+
+    def make_backend(self) -> InpaintingBackend:
+        """
+        :raise TypeError: if the backend doesn't take the backend_args
+        """
+        return BACKENDS[self.backend](**self.backend_args)
+
+
+@dataclass
+class BatchResult:
+    impath: str
+    result_path: Optional[str] = None
+    # traceback of the error the image failed with
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def is_generated(path: str, stems: List[str]) -> bool:
+    """
+    :return: True if the image is written by the job of another image,
+        e.g. {image}_LEFT_000.png or {image}_full.png
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return any(
+        stem != other and stem.startswith(other + "_") for other in stems
+    )
+
+
+def expand_paths(patterns: List[str]) -> List[str]:
+    """
+    :param patterns: paths, glob patterns or folders
+    :return: paths to the source images, images generated from the other
+        images of a folder or a glob pattern are skipped
+    """
+    ret = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = sorted(glob.glob(os.path.join(pattern, "*.png")))
+        else:
+            paths = sorted(glob.glob(pattern)) or [pattern]
+        stems = [os.path.splitext(os.path.basename(x))[0] for x in paths]
+        ret.extend(x for x in paths if not is_generated(x, stems))
+    return ret
+
+
+def run_job(
+    impath: str,
+    settings: JobSettings,
+    backend: Optional[InpaintingBackend] = None,
+) -> BatchResult:
+    """
+    Generates the panorama of one image, errors are returned, not raised
+    :param impath: path to the source image
+    :param settings: settings of the job
+    :param backend: backend shared by the jobs,
+        if None, a new one is made from the settings and closed after
+    """
+    start = time.perf_counter()
+    own_backend = backend is None
+    try:
+        if own_backend:
+            backend = settings.make_backend()
+        job_class = GridJob if settings.grid else PanoramaJob
+        job = job_class(
+            impath,
+            settings.directions,
+            backend=backend,
+            geometry=settings.geometry,
+            cache=(
+                ResultCache(settings.cache_folder, codec=settings.codec)
+                if settings.cache_folder
+                else None
+            ),
+            prompt=settings.prompt,
+            blend=settings.blend,
+            resume=settings.resume,
+            in_memory=settings.in_memory,
+            codec=settings.codec,
+            final_codec=settings.final_codec,
+            canvas_folder=settings.canvas_folder,
+        )
+        name = os.path.basename(impath)
+        job.progress = lambda message: print(f"{name}: {message}")
+        result_path = job.run(max_workers=settings.max_workers)
+        return BatchResult(
+            impath, result_path, seconds=time.perf_counter() - start
+        )
+    except Exception:
+        return BatchResult(
+            impath,
+            error=traceback.format_exc(),
+            seconds=time.perf_counter() - start,
+        )
+    finally:
+        if own_backend and backend is not None:
+            backend.close()
+
+
+def run_batch(
+    impaths: List[str],
+    settings: JobSettings,
+    processes: int = 1,
+    on_result: Optional[Callable[[BatchResult], None]] = None,
+) -> List[BatchResult]:
+    """
+    Generates panoramas of all the images
+    :param impaths: paths to the source images
+    :param settings: settings of every job
+    :param processes: number of images generated at the same time,
+        each in its own process. With 1 the jobs are run one by one in
+        this process and share one backend
+    :param on_result: called with the result of every image once it's done
+    :return: results in the order of impaths
+    :raise ValueError: if processes is less than 1
+    """
+    if processes < 1:
+        raise ValueError(f"processes must be at least 1, got {processes}")
+    # the same image is never generated twice at the same time
+    impaths = list(dict.fromkeys(impaths))
+    results = {}
+    if processes == 1:
+        backend = settings.make_backend()
+        try:
+            for impath in impaths:
+                results[impath] = run_job(impath, settings, backend)
+                if on_result is not None:
+                    on_result(results[impath])
+        finally:
+            backend.close()
+        return [results[x] for x in impaths]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {
+            pool.submit(run_job, impath, settings): impath
+            for impath in impaths
+        }
+        for future in as_completed(futures):
+            impath = futures[future]
+            try:
+                results[impath] = future.result()
+            except BrokenProcessPool:
+                # worker was killed, e.g. out of memory
+                results[impath] = BatchResult(
+                    impath, error=traceback.format_exc()
+                )
+            if on_result is not None:
+                on_result(results[impath])
+    return [results[x] for x in impaths]
@@ -0,0 +1,141 @@
+"""
+Blending of the overlap between adjacent images
+
+Images are not hard cut at the seam anymore, the band where they overlap
+is blended: either linearly (feather) or frequency by frequency with
+Laplacian pyramids, so low frequencies blend over the whole band while
+fine details don't get ghosted.
+Only the overlap band is processed, in chunks along the seam, so time and
+memory stay bounded for any length of the seam.
+"""
+from enum import Enum
+
+import cv2
+import numpy as np
+
+
+class BlendMode(str, Enum):
+    NONE = "none"
+    FEATHER = "feather"
+    LAPLACIAN = "laplacian"
+
+    def __str__(self):
+        return self.value
+
+
+def ramp(
+    length: int,
+    width: int,
+    axis: int,
+    towards_end: bool,
+    step: bool = False,
+) -> np.ndarray:
+    """
+    :param length: size of the band across the seam (along axis)
+    :param width: size of the band along the seam
+    :param axis: axis across the seam
+    :param towards_end: if True, weights grow along the axis
+    :param step: if True, weights jump from 0 to 1 in the middle of the band
+    :return: 2d float32 weights of the new image, from 0 to 1
+    """
+    weights = (np.arange(length, dtype=np.float32) + 0.5) / length
+    if step:
+        weights = (weights >= 0.5).astype(np.float32)
+    if not towards_end:
+        weights = weights[::-1]
+    if axis == 0:
+        return np.repeat(weights[:, None], width, axis=1)
+    return np.repeat(weights[None, :], width, axis=0)
+
+
+def _feather(base: np.ndarray, new: np.ndarray, weights: np.ndarray):
+    weights = weights[..., None]
+    return base * (1 - weights) + new * weights
+
+
+def _laplacian(
+    base: np.ndarray, new: np.ndarray, weights: np.ndarray, levels: int
+):
+    levels = min(levels, int(np.log2(min(weights.shape))))
+    gaussian_base = [base]
+    gaussian_new = [new]
+    gaussian_weights = [weights]
+    for _ in range(levels):
+        gaussian_base.append(cv2.pyrDown(gaussian_base[-1]))
+        gaussian_new.append(cv2.pyrDown(gaussian_new[-1]))
+        gaussian_weights.append(cv2.pyrDown(gaussian_weights[-1]))
+
+    def expand(im: np.ndarray, like: np.ndarray) -> np.ndarray:
+        return cv2.pyrUp(im, dstsize=(like.shape[1], like.shape[0]))
+
+    # blend every level of Laplacian pyramids, the coarsest one is gaussian
+    blended = []
+    for i in range(levels + 1):
+        if i < levels:
+            band_base = gaussian_base[i] - expand(
+                gaussian_base[i + 1], gaussian_base[i]
+            )
+            band_new = gaussian_new[i] - expand(
+                gaussian_new[i + 1], gaussian_new[i]
+            )
+        else:
+            band_base, band_new = gaussian_base[i], gaussian_new[i]
+        blended.append(_feather(band_base, band_new, gaussian_weights[i]))
+
+    ret = blended[-1]
+    for level in reversed(blended[:-1]):
+        ret = expand(ret, level) + level
+    return ret
+
+
+def blend_overlap(
+    base: np.ndarray,
+    new: np.ndarray,
+    axis: int,
+    towards_end: bool = True,
+    mode: BlendMode = BlendMode.FEATHER,
+    levels: int = 5,
+    chunk: int = 1024,
+) -> np.ndarray:
+    """
+    Blends the overlap band of two images
+    :param base: pixels of the band already in place
+    :param new: pixels of the band from the new image
+    :param axis: axis across the seam, 0 if images are stacked vertically
+    :param towards_end: if True, the new image continues after the band
+        along the axis, else before it
+    :param mode: blending mode
+    :param levels: number of pyramid levels for LAPLACIAN blending
+    :param chunk: number of pixels along the seam processed at once
+    :return: blended band of the same shape and dtype
+    """
+    if mode == BlendMode.NONE:
+        return new
+    length = base.shape[axis]
+    width = base.shape[1 - axis]
+    # pyramid levels need the neighbourhood, chunks overlap by the margin
+    margin = 2 ** (levels + 1) if mode == BlendMode.LAPLACIAN else 0
+    ret = np.empty_like(new)
+    for start in range(0, width, chunk):
+        stop = min(start + chunk, width)
+        lo, hi = max(start - margin, 0), min(stop + margin, width)
+        if axis == 0:
+            window = (slice(None), slice(lo, hi))
+            inner = (slice(None), slice(start - lo, stop - lo))
+            target = (slice(None), slice(start, stop))
+        else:
+            window = (slice(lo, hi), slice(None))
+            inner = (slice(start - lo, stop - lo), slice(None))
+            target = (slice(start, stop), slice(None))
+        base_chunk = base[window].astype(np.float32)
+        new_chunk = new[window].astype(np.float32)
+        # pyramids smooth the mask themselves, level by level
+        weights = ramp(
+            length, hi - lo, axis, towards_end, mode == BlendMode.LAPLACIAN
+        )
+        if mode == BlendMode.LAPLACIAN:
+            blended = _laplacian(base_chunk, new_chunk, weights, levels)
+        else:
+            blended = _feather(base_chunk, new_chunk, weights)
+        ret[target] = np.clip(np.rint(blended[inner]), 0, 255)
+    return ret
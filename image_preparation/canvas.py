@@ -0,0 +1,88 @@
+"""
+Preallocated canvas for combining panorama parts
+
+Final bounds of the panorama are known before any part is read, so the
+canvas is allocated once and every part is written straight into place.
+Pixels are held either in memory or in a disk-backed np.memmap, so huge
+panoramas don't have to fit in RAM.
+"""
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from image_preparation.data import Directions
+from image_preparation.geometry import DEFAULT_GEOMETRY, TileGeometry
+
+
+class Canvas:
+    def __init__(
+        self,
+        height: int,
+        width: int,
+        channels: int = 4,
+        dtype=np.uint8,
+        backing_path: Optional[str] = None,
+    ):
+        """
+        :param height: height of the canvas in pixels
+        :param width: width of the canvas in pixels
+        :param channels: number of channels of the canvas
+        :param dtype: dtype of the canvas
+        :param backing_path: if set, pixels are kept in np.memmap at this path
+        """
+        self.shape = (height, width, channels)
+        self.backing_path = backing_path
+        if backing_path is None:
+            self.img = np.zeros(self.shape, dtype=dtype)
+        else:
+            # w+ creates a zero-filled file of the full canvas size
+            self.img = np.memmap(
+                backing_path, dtype=dtype, mode="w+", shape=self.shape
+            )
+
+    @classmethod
+    def for_directions(
+        cls,
+        shape: Tuple[int, ...],
+        directions: List[Directions],
+        geometry: TileGeometry = DEFAULT_GEOMETRY,
+        **kwargs,
+    ) -> Tuple["Canvas", int, int]:
+        """
+        Creates canvas large enough for the image extended in all directions
+        :param shape: shape of the source image
+        :param directions: directions the image is extended in
+        :param geometry: the image is extended by geometry.num_pixels
+        :return: canvas, top and left position of the source image on it
+        """
+        height, width, top, left = geometry.canvas_bounds(shape, directions)
+        canvas = cls(
+            height=height,
+            width=width,
+            channels=shape[2] if len(shape) > 2 else 1,
+            **kwargs,
+        )
+        return canvas, top, left
+
+    def window(
+        self, top: int, left: int, height: int, width: int
+    ) -> np.ndarray:
+        """
+        :return: view of the canvas, no pixels are copied
+        """
+        return self.img[top : top + height, left : left + width]
+
+    def paste(self, im: np.ndarray, top: int, left: int):
+        """
+        Writes the image into the canvas at the given position
+        """
+        self.window(top, left, im.shape[0], im.shape[1])[:] = im
+
+    def close(self):
+        """
+        Releases the pixels. Backing file of the memmap is removed
+        """
+        self.img = None
+        if self.backing_path is not None and os.path.exists(self.backing_path):
+            os.remove(self.backing_path)
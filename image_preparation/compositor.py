@@ -0,0 +1,110 @@
+"""
+Incremental combining of the generated parts of a direction
+
+The strip of a direction is allocated once, at the size of the shifted
+image, and every generated part is pasted into it as soon as it's done,
+blended with the overlap of the part before it. The strip is complete the
+moment the last part lands, instead of re-reading all the parts and
+concatenating them one by one after the last one.
+"""
+from typing import List, Set, Tuple
+
+import numpy as np
+
+from image_preparation.blending import BlendMode, blend_overlap
+from image_preparation.canvas import Canvas
+from image_preparation.data import Directions
+from image_preparation.geometry import DEFAULT_GEOMETRY, TileGeometry
+from image_preparation.panorama_dalle2 import replace_logo_band
+
+
+class StripCompositor:
+    def __init__(
+        self,
+        shape: Tuple[int, ...],
+        direction: Directions,
+        windows: List[Tuple[int, int, int, int]],
+        geometry: TileGeometry = DEFAULT_GEOMETRY,
+        blend: BlendMode = BlendMode.NONE,
+        dtype=np.uint8,
+    ):
+        """
+        :param shape: shape of the shifted image the parts are cut from
+        :param direction: direction of the parts
+        :param windows: (top, left, height, width) of every part
+        :param geometry: parts overlap by geometry.overlap pixels
+        :param blend: blending of the seams between the parts
+        :param dtype: dtype of the parts
+        """
+        self.direction = direction
+        self.windows = windows
+        self.geometry = geometry
+        self.blend = blend
+        self.canvas = Canvas(
+            shape[0],
+            shape[1],
+            channels=shape[2] if len(shape) > 2 else 1,
+            dtype=dtype,
+        )
+        # numbers of the parts pasted into the strip
+        self.added: Set[int] = set()
+
+    @property
+    def complete(self) -> bool:
+        return len(self.added) == len(self.windows)
+
+    @property
+    def img(self) -> np.ndarray:
+        return self.canvas.img
+
+    def add(self, part_number: int, im: np.ndarray):
+        """
+        Pastes the generated part into the strip, its overlap with
+        the part before it is blended
+        :raise ValueError: if the part before it is not pasted yet
+        """
+        if part_number > 0 and part_number - 1 not in self.added:
+            raise ValueError(
+                f"part {part_number - 1} of {self.direction.name} "
+                f"is not combined yet"
+            )
+        top, left, height, width = self.windows[part_number]
+        window = self.canvas.window(top, left, height, width)
+        im = im[: window.shape[0], : window.shape[1]]
+        window = window[: im.shape[0], : im.shape[1]]
+        overlap = self.geometry.overlap
+        if part_number == 0 or not overlap:
+            window[:] = im
+        elif self.direction in (Directions.UP, Directions.DOWN):
+            # UP and DOWN parts follow each other left to right
+            seam = blend_overlap(
+                self._base(window[:, :overlap], im[:, :overlap]),
+                im[:, :overlap],
+                axis=1,
+                mode=self.blend,
+            )
+            window[:, overlap:] = im[:, overlap:]
+            window[:, :overlap] = seam
+        else:
+            # LEFT and RIGHT parts follow each other top to bottom
+            seam = blend_overlap(
+                self._base(window[:overlap], im[:overlap]),
+                im[:overlap],
+                axis=0,
+                mode=self.blend,
+            )
+            window[overlap:] = im[overlap:]
+            window[:overlap] = seam
+        self.added.add(part_number)
+
+    def _base(self, band: np.ndarray, im: np.ndarray) -> np.ndarray:
+        """
+        :param band: overlap band of the part before, its logo is cut off
+        :param im: overlap band of the new part
+        :return: band with its logo replaced by the pixels of the new part,
+            so the cut-out doesn't bleed into the blended seam
+        """
+        return replace_logo_band(band, im, self.geometry, self.blend)
+
+    def close(self):
+        self.canvas.close()
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import List
 
 
 class Directions(str, Enum):
@@ -16,3 +17,8 @@ class CombinedDirections(str, Enum):
 
     def __str__(self):
         return self.value
+
+    def to_directions(self) -> List[Directions]:
+        if self == CombinedDirections.LEFT_RIGHT:
+            return [Directions.LEFT, Directions.RIGHT]
+        return [Directions.UP, Directions.DOWN]
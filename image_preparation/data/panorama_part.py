@@ -1,12 +1,136 @@
-import numpy as np
 from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
 
 from image_preparation.data import Directions
+from image_preparation.geometry import DEFAULT_GEOMETRY, TileGeometry
+from image_preparation.image_io import map_image
+from image_preparation.image_store import file_version, read_rgba
+from image_preparation.lru_cache import LRUCache
+from image_preparation.masked_tile import MaskedTile
+
+# Pixels of the parts computed from their source images, as MaskedTile.
+# Parts keep only geometry, pixels are recomputed after eviction
+PARTS_CACHE = LRUCache(max_bytes=256 * 1024 * 1024)
+# RGBA pixels of the parts read lately. A part is read a few times in a row,
+# written for the generator, hashed for the result cache and inpainted,
+# so it's materialised once for all of them
+RGBA_CACHE = LRUCache(max_bytes=64 * 1024 * 1024)
+
+
+def read_source(source_path: str) -> np.ndarray:
+    """
+    :return: read-only RGBA source image, decoded once by the image store.
+        RGBA .npy source is mapped from disk instead, so sources larger
+        than RAM are read part by part
+    """
+    im = map_image(source_path)
+    if im is not None and im.ndim == 3 and im.shape[2] == 4:
+        return im
+    return read_rgba(source_path)
 
 
 @dataclass
 class PanoramaPart:
+    """
+    Part of the panorama that is generated at once
+
+    Part is either computed from its source image (source_path, window and
+    geometry are set) and pixels are materialised on first access of img,
+    or holds pixels assigned to img, e.g. read from a _done image
+    """
+
+    __slots__ = (
+        "path",
+        "direction",
+        "part_number",
+        "source_path",
+        "window",
+        "geometry",
+        "_img",
+    )
     path: str
     direction: Directions
-    img: np.ndarray
     part_number: int
+    source_path: Optional[str]
+    # (top, left, height, width) of the part in the shifted source image
+    window: Optional[Tuple[int, int, int, int]]
+    geometry: TileGeometry
+
+    def __init__(
+        self,
+        path: str,
+        direction: Directions,
+        img: Optional[np.ndarray] = None,
+        part_number: int = 0,
+        *,
+        source_path: Optional[str] = None,
+        window: Optional[Tuple[int, int, int, int]] = None,
+        geometry: TileGeometry = DEFAULT_GEOMETRY,
+    ):
+        self.path = path
+        self.direction = direction
+        self.part_number = part_number
+        self.source_path = source_path
+        self.window = window
+        self.geometry = geometry
+        self._img = img
+
+    @property
+    def img(self) -> np.ndarray:
+        """
+        Assigned pixels, or read-only RGBA pixels computed from the source
+        """
+        if self._img is not None:
+            return self._img
+        if self.source_path is None:
+            raise ValueError(f"{self.path} has neither pixels nor source")
+        return RGBA_CACHE.get_or_compute(
+            ("rgba",) + self._source_key(), self._compute_img
+        )
+
+    @img.setter
+    def img(self, img: Optional[np.ndarray]):
+        self._img = img
+
+    @property
+    def tile(self) -> MaskedTile:
+        """
+        Compact pixels of the part, cached while it's computed from the source
+        """
+        if self._img is not None:
+            return MaskedTile.from_rgba(self._img)
+        if self.source_path is None:
+            raise ValueError(f"{self.path} has neither pixels nor source")
+        return PARTS_CACHE.get_or_compute(
+            ("part",) + self._source_key(), self._compute_tile
+        )
+
+    def _source_key(self) -> tuple:
+        return (
+            self.source_path,
+            # parts of the changed source are computed again
+            file_version(self.source_path),
+            self.direction,
+            self.window,
+            self.geometry,
+        )
+
+    def _compute_img(self) -> np.ndarray:
+        img = self.tile.to_rgba()
+        img.flags.writeable = False
+        return img
+
+    def _compute_tile(self) -> MaskedTile:
+        # image_edit imports this package, so it's imported on first use
+        from image_preparation.image_edit import shift_view
+
+        shifted = shift_view(
+            read_source(self.source_path),
+            direction=self.direction,
+            geometry=self.geometry,
+        )
+        tile = shifted.masked_tile(*self.window)
+        tile.rgb.flags.writeable = False
+        return tile
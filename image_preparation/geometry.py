@@ -0,0 +1,122 @@
+"""
+Geometry of the panorama parts
+
+Every part is a square tile of tile_size pixels, 1024 for DALL·E 2 or
+e.g. 512 and 768 for local models. Consecutive tiles of a direction repeat
+overlap pixels of the previous tile, the other num_pixels pixels of every
+tile are new, so a smaller overlap means fewer generation calls and a
+larger one smoother seams. Generated images may carry a logo in the lower
+right corner, it's cut off before the parts are combined.
+"""
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from image_preparation.data.directions import Directions
+
+
+@dataclass(frozen=True)
+class TileGeometry:
+    # side of the square generated image
+    tile_size: int = 1024
+    # pixels every tile repeats from the previous one
+    overlap: int = 1024 // 3
+    # (height, width) of the logo in the lower right corner, (0, 0) if none
+    logo_size: Tuple[int, int] = (17, 81)
+
+    def __post_init__(self):
+        if self.tile_size <= 0:
+            raise ValueError(f"tile_size must be positive: {self.tile_size}")
+        if not 0 <= self.overlap < self.tile_size:
+            raise ValueError(
+                f"overlap must be in [0, {self.tile_size}): {self.overlap}"
+            )
+        if not all(0 <= x <= self.tile_size for x in self.logo_size):
+            raise ValueError(f"logo doesn't fit the tile: {self.logo_size}")
+
+    @classmethod
+    def from_ratio(
+        cls,
+        tile_size: int = 1024,
+        overlap_ratio: float = 1 / 3,
+        logo_size: Tuple[int, int] = (17, 81),
+    ) -> "TileGeometry":
+        """
+        :param tile_size: side of the square generated image
+        :param overlap_ratio: part of the tile repeated from the previous one
+        :param logo_size: (height, width) of the logo, (0, 0) if none
+        """
+        return cls(tile_size, int(tile_size * overlap_ratio), logo_size)
+
+    @property
+    def num_pixels(self) -> int:
+        """
+        :return: number of new pixels of every tile, the image is extended
+            by this number of pixels in every direction
+        """
+        return self.tile_size - self.overlap
+
+    def tile_starts(self, length: int, fit: bool = False) -> List[int]:
+        """
+        :param length: length of the image along the tiles
+        :param fit: if True, the last tile is moved back to end at the
+            border of the image, so every tile is tile_size pixels long
+        :return: offsets of the tiles covering the whole length,
+            the last tile may be cut by the border of the image
+        """
+        if length <= self.tile_size:
+            return [0]
+        starts = range(0, length - self.overlap, self.num_pixels)
+        if fit:
+            return [min(start, length - self.tile_size) for start in starts]
+        return list(starts)
+
+    def tile_windows(
+        self, shape: Tuple[int, ...], direction: Directions
+    ) -> List[Tuple[int, int, int, int]]:
+        """
+        Splits the shifted image into tiles
+        LEFT and RIGHT are split top to bottom, UP and DOWN left to right
+        :param shape: shape of the shifted image
+        :param direction: direction the image is shifted to
+        :return: list of (top, left, height, width) of the tiles
+        """
+        if direction == Directions.LEFT or direction == Directions.RIGHT:
+            return [
+                (start, 0, self.tile_size, shape[1])
+                for start in self.tile_starts(shape[0])
+            ]
+        return [
+            (0, start, shape[0], self.tile_size)
+            for start in self.tile_starts(shape[1])
+        ]
+
+    def canvas_bounds(
+        self, shape: Tuple[int, ...], directions: List[Directions]
+    ) -> Tuple[int, int, int, int]:
+        """
+        :param shape: shape of the source image
+        :param directions: directions the image is extended in
+        :return: height and width of the panorama,
+            top and left position of the source image on it
+        """
+        # Directions are named after the side the image shifts to,
+        # so LEFT extends the image to the right and so on
+        top = self.num_pixels if Directions.DOWN in directions else 0
+        left = self.num_pixels if Directions.RIGHT in directions else 0
+        bottom = self.num_pixels if Directions.UP in directions else 0
+        right = self.num_pixels if Directions.LEFT in directions else 0
+        return shape[0] + top + bottom, shape[1] + left + right, top, left
+
+    def logo_box(self, shape: Tuple[int, ...]) -> Tuple[slice, slice]:
+        """
+        :param shape: shape of the generated image
+        :return: index of the logo in the lower right corner
+        """
+        logo_height, logo_width = self.logo_size
+        return (
+            slice(max(shape[0] - logo_height, 0), shape[0]),
+            slice(max(shape[1] - logo_width, 0), shape[1]),
+        )
+
+
+DEFAULT_GEOMETRY = TileGeometry()
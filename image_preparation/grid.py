@@ -0,0 +1,123 @@
+"""
+Planning of the panorama extended in all the directions at once
+
+The image is extended by geometry.num_pixels on every chosen side, corners
+included, in one pass over one canvas. Tiles along the source image
+(LEFT and RIGHT directions) are planned first, then tiles along the whole
+width of the canvas (UP and DOWN), so their end tiles fill the corners
+next to the sides generated before. Every tile depends on the tiles
+before it whose new pixels it overlaps, tiles that don't overlap each
+other can be generated at the same time.
+"""
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from image_preparation.data import Directions
+from image_preparation.geometry import DEFAULT_GEOMETRY, TileGeometry
+from image_preparation.masked_tile import Rect
+
+
+@dataclass
+class GridTile:
+    direction: Directions
+    part_number: int
+    # (top, left, height, width) of the tile on the canvas
+    window: Rect
+    # (direction, part_number) of the tiles that must be generated before
+    dependencies: List[Tuple[Directions, int]] = field(default_factory=list)
+
+    @property
+    def key(self) -> Tuple[Directions, int]:
+        return self.direction, self.part_number
+
+
+def intersects(a: Rect, b: Rect) -> bool:
+    """
+    :return: True if (top, left, height, width) rectangles overlap
+    """
+    return (
+        a[0] < b[0] + b[2]
+        and b[0] < a[0] + a[2]
+        and a[1] < b[1] + b[3]
+        and b[1] < a[1] + a[3]
+    )
+
+
+def subtract(rect: Rect, hole: Rect) -> List[Rect]:
+    """
+    :return: rectangles covering the rect without the hole
+    """
+    if not intersects(rect, hole):
+        return [rect]
+    top, left, height, width = rect
+    bottom, right = top + height, left + width
+    hole_top = max(hole[0], top)
+    hole_left = max(hole[1], left)
+    hole_bottom = min(hole[0] + hole[2], bottom)
+    hole_right = min(hole[1] + hole[3], right)
+    ret = [
+        (top, left, hole_top - top, width),
+        (hole_bottom, left, bottom - hole_bottom, width),
+        (hole_top, left, hole_bottom - hole_top, hole_left - left),
+        (hole_top, hole_right, hole_bottom - hole_top, right - hole_right),
+    ]
+    return [x for x in ret if x[2] > 0 and x[3] > 0]
+
+
+def plan_grid(
+    shape: Tuple[int, ...],
+    directions: List[Directions],
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
+) -> List[GridTile]:
+    """
+    :param shape: shape of the source image
+    :param directions: directions to extend the image in
+    :param geometry: tile size and overlap of the generated tiles
+    :return: tiles in the order they can be generated one by one
+    """
+    height, width, top, left = geometry.canvas_bounds(shape, directions)
+    source = (top, left, shape[0], shape[1])
+    tile_size = geometry.tile_size
+    windows = {}
+    # Directions are named after the side the image shifts to,
+    # so LEFT extends the image to the right and so on
+    for direction in directions:
+        if direction == Directions.LEFT or direction == Directions.RIGHT:
+            tile_left = (
+                0 if direction == Directions.RIGHT else width - tile_size
+            )
+            windows[direction] = [
+                (top + start, max(tile_left, 0), tile_size, tile_size)
+                for start in geometry.tile_starts(shape[0], fit=True)
+            ]
+    for direction in directions:
+        if direction == Directions.UP or direction == Directions.DOWN:
+            tile_top = (
+                0 if direction == Directions.DOWN else height - tile_size
+            )
+            windows[direction] = [
+                (max(tile_top, 0), start, tile_size, tile_size)
+                for start in geometry.tile_starts(width, fit=True)
+            ]
+
+    tiles: List[GridTile] = []
+    # pixels of every tile that are not in the source image
+    new_pixels: List[List[Rect]] = []
+    for direction, direction_windows in windows.items():
+        for i, window in enumerate(direction_windows):
+            # tiles are cut by the border of the canvas
+            window = (
+                window[0],
+                window[1],
+                min(window[2], height - window[0]),
+                min(window[3], width - window[1]),
+            )
+            tile = GridTile(direction=direction, part_number=i, window=window)
+            tile.dependencies = [
+                other.key
+                for other, rects in zip(tiles, new_pixels)
+                if any(intersects(window, rect) for rect in rects)
+            ]
+            tiles.append(tile)
+            new_pixels.append(subtract(window, source))
+    return tiles
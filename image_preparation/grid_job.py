@@ -0,0 +1,299 @@
+"""
+Panorama extended in all the directions in one pass
+
+Tiles planned by plan_grid are generated in order and composited into one
+canvas: a generated tile only fills the pixels of the canvas that are not
+known yet. The source image is decoded once and the result is encoded
+once, instead of running a whole job again on the _full image for every
+other direction. Parts are saved as {image}_grid_{direction}_{nnn}.png,
+the rest works as in PanoramaJob, including resuming from the manifest.
+Logo of the source is cut from the canvas where tiles cover it, so it's
+generated over like in the other directions.
+"""
+import os
+from functools import partial
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from image_preparation.blending import BlendMode
+from image_preparation.canvas import Canvas
+from image_preparation.data import Directions, PanoramaPart
+from image_preparation.data.panorama_part import read_source
+from image_preparation.grid import GridTile, intersects, plan_grid
+from image_preparation.image_io import write_image
+from image_preparation.manifest import file_checksum
+from image_preparation.panorama_job import PanoramaJob, _skip
+from image_preparation.preview import write_preview_pyramid
+from image_preparation.scheduler import run_dag
+from image_preparation.tracing import span
+
+
+class GridJob(PanoramaJob):
+    """
+    PanoramaJob that extends the image in all the directions at once,
+    corners included. Seams are not blended, generated pixels only fill
+    the pixels of the canvas that are not known yet
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Takes the arguments of PanoramaJob
+        :raise ValueError: if blend is not BlendMode.NONE,
+            seams of the grid are not blended
+        """
+        super().__init__(*args, **kwargs)
+        if self.blend != BlendMode.NONE:
+            raise ValueError(
+                "seams of the grid are not blended, "
+                f"blend {self.blend} can't be used"
+            )
+        self.canvas: Optional[Canvas] = None
+        self.tiles: List[GridTile] = []
+        # tiles composited into the canvas
+        self.done: Set[Tuple[Directions, int]] = set()
+
+    def prepare(self) -> Dict[Directions, List[PanoramaPart]]:
+        self.close_canvas()
+        im = read_source(self.impath)
+        self.canvas, top, left = Canvas.for_directions(
+            im.shape,
+            self.directions,
+            self.geometry,
+            dtype=im.dtype,
+            backing_path=self.canvas_path(),
+        )
+        self.canvas.paste(im, top, left)
+        self.tiles = plan_grid(im.shape, self.directions, self.geometry)
+        self.cut_logo(im.shape, top, left)
+        self.parts = {}
+        for tile in self.tiles:
+            self.parts.setdefault(tile.direction, []).append(
+                PanoramaPart(
+                    path=self.tile_path(tile),
+                    direction=tile.direction,
+                    part_number=tile.part_number,
+                    window=tile.window,
+                    geometry=self.geometry,
+                )
+            )
+        self.manifest = self.load_manifest()
+        self.done = set()
+        self.current_part = None
+        self.current_direction = None
+        self.result_path = None
+        return self.parts
+
+    def cut_logo(self, shape: Tuple[int, ...], top: int, left: int):
+        """
+        Makes the logo of the source transparent where tiles cover it,
+        e.g. tiles of LEFT and UP directions, the tiles generate it over
+        :param shape: shape of the source image
+        :param top: top position of the source on the canvas
+        :param left: left position of the source on the canvas
+        """
+        logo_height, logo_width = self.geometry.logo_size
+        logo = (
+            top + max(shape[0] - logo_height, 0),
+            left + max(shape[1] - logo_width, 0),
+            min(logo_height, shape[0]),
+            min(logo_width, shape[1]),
+        )
+        if not logo[2] or not logo[3]:
+            return
+        for tile in self.tiles:
+            if not intersects(tile.window, logo):
+                continue
+            tile_top, tile_left, tile_height, tile_width = tile.window
+            cut_top = max(logo[0], tile_top)
+            cut_left = max(logo[1], tile_left)
+            cut_bottom = min(logo[0] + logo[2], tile_top + tile_height)
+            cut_right = min(logo[1] + logo[3], tile_left + tile_width)
+            self.canvas.window(
+                cut_top, cut_left, cut_bottom - cut_top, cut_right - cut_left
+            )[:] = 0
+
+    def tile_path(self, tile: GridTile) -> str:
+        """
+        :return: path to the tile, {impath}_grid_{direction}_{nnn}.png
+        """
+        folder = os.path.dirname(self.impath)
+        basename = os.path.basename(self.impath)
+        basename_without_extension = os.path.splitext(basename)[0]
+        return os.path.join(
+            folder,
+            basename_without_extension
+            + f"_grid_{tile.direction}_{tile.part_number:03d}"
+            + self.codec.extension,
+        )
+
+    def restore(self):
+        """
+        Composites tiles generated before into the canvas,
+        as far as the tiles they depend on are generated as well
+        """
+        for tile in self.tiles:
+            if tile.key in self.done:
+                continue
+            if all(x in self.done for x in tile.dependencies) and (
+                self.is_part_done(*tile.key)
+            ):
+                # the tile as it was sent to the generator,
+                # it's the cache key of the generated tile
+                self.parts[tile.direction][tile.part_number].img = (
+                    self.tile_image(tile)
+                )
+                self.composite(tile)
+
+    def composite(self, tile: GridTile):
+        """
+        Fills the pixels of the canvas that are not known yet
+        with the generated tile
+        Pixels of the part must be set, they're dropped after
+        :raise ValueError: if the tile is not generated yet
+        """
+        part = self.parts[tile.direction][tile.part_number]
+        im = self.get_done(part).img
+        with span("combine", path=part.path):
+            window = self.canvas.window(*tile.window)
+            im = im[: window.shape[0], : window.shape[1]]
+            # cut logo is transparent, it stays unknown as well
+            mask = (window[..., 3] == 0) & (im[..., 3] != 0)
+            window[mask] = im[mask]
+        # pixels are read from the canvas, not kept in the part
+        part.img = None
+        self.done_images.pop(tile.key, None)
+        self.done.add(tile.key)
+
+    def tile_image(self, tile: GridTile) -> np.ndarray:
+        """
+        :return: copy of the canvas under the tile,
+            pixels that are not known yet are transparent
+        """
+        return self.canvas.window(*tile.window).copy()
+
+    def write_tile(self, tile: GridTile) -> PanoramaPart:
+        """
+        Makes the tile the current part and writes it to disk
+        """
+        part = self.parts[tile.direction][tile.part_number]
+        part.img = self.tile_image(tile)
+        self.current_direction = tile.direction
+        self.current_part = tile.part_number
+        if not self.is_part_done(*tile.key):
+            self.write_part(part)
+        return part
+
+    def generate_tile(self, tile: GridTile):
+        """
+        Gets the tile generated by the backend and composites it
+        Tiles it depends on must be composited already
+        """
+        part = self.parts[tile.direction][tile.part_number]
+        part.img = self.tile_image(tile)
+        self.inpaint(part)
+        self.composite(tile)
+
+    def start(self) -> Optional[PanoramaPart]:
+        """
+        Writes the first tile that's not generated yet to disk
+        :return: first tile to generate, None if the panorama is done
+        """
+        if not self.parts or self.canvas is None:
+            self.prepare()
+        self.restore()
+        return self._next_tile()
+
+    def _next_part(self) -> Optional[PanoramaPart]:
+        current = self.parts[self.current_direction][self.current_part]
+        self.composite(self.tile_of(current))
+        return self._next_tile()
+
+    def _next_tile(self) -> Optional[PanoramaPart]:
+        for tile in self.tiles:
+            if tile.key not in self.done:
+                return self.write_tile(tile)
+        self.result_path = self.combine_all()
+        return None
+
+    def tile_of(self, part: PanoramaPart) -> GridTile:
+        for tile in self.tiles:
+            if tile.key == (part.direction, part.part_number):
+                return tile
+        raise ValueError(f"{part.path} is not a tile of the grid")
+
+    def is_direction_combined(self, direction: Directions) -> bool:
+        # tiles are composited as soon as they are generated
+        return False
+
+    def combine_all(self) -> str:
+        """
+        Writes the canvas, unless it's written already and not changed since
+        :return: path to the combined image
+        """
+        folder = os.path.dirname(self.impath)
+        basename = os.path.basename(self.impath)
+        basename_without_extension = os.path.splitext(basename)[0]
+        result_path = os.path.join(
+            folder,
+            basename_without_extension + f"_full{self.final_codec.extension}",
+        )
+        checksum = self.manifest.result
+        if checksum is not None and checksum == file_checksum(result_path):
+            self.close_canvas()
+            return result_path
+        self.progress(f"saving {result_path}")
+        with span("write", path=result_path):
+            write_image(result_path, self.canvas.img, self.final_codec)
+        if self.write_previews:
+            write_preview_pyramid(result_path, self.canvas.img)
+        self.close_canvas()
+        self.manifest.result = file_checksum(result_path)
+        self.save_manifest()
+        return result_path
+
+    def close_canvas(self):
+        """
+        Releases the canvas, its np.memmap file is removed
+        """
+        if self.canvas is not None:
+            self.canvas.close()
+            self.canvas = None
+
+    def run(self, max_workers: int = 1) -> str:
+        """
+        Generates all the tiles with the backend and writes the canvas
+        Every tile is generated as soon as the tiles it overlaps are done,
+        up to max_workers tiles are generated at the same time
+        :param max_workers: number of tiles generated at the same time
+        :return: path to the combined image
+        """
+        if not self.parts or self.canvas is None:
+            # the canvas is released after the job is done or failed
+            with span("prepare", path=self.impath):
+                self.prepare()
+        self.restore()
+        tasks = {}
+        dependencies = {}
+        for tile in self.tiles:
+            # tiles generated before are not generated again
+            tasks[tile.key] = (
+                _skip
+                if tile.key in self.done
+                else partial(self.generate_tile, tile)
+            )
+            dependencies[tile.key] = tile.dependencies
+        tasks["full"] = self.combine_all
+        dependencies["full"] = [tile.key for tile in self.tiles]
+        try:
+            # a failed part stops the backend, so the parts waiting for it
+            # return instead of keeping the error from being raised
+            self.result_path = run_dag(
+                tasks, dependencies, max_workers, on_error=self.backend.close
+            )["full"]
+        except BaseException:
+            # np.memmap file of the canvas is not left behind, generated
+            # tiles are composited again from their _done files on resume
+            self.close_canvas()
+            raise
+        return self.result_path
@@ -1,127 +1,335 @@
-from typing import List
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
 
+import cv2
 import numpy as np
 
 from image_preparation.data import Directions
+from image_preparation.geometry import DEFAULT_GEOMETRY, TileGeometry
+from image_preparation.grid import subtract
+from image_preparation.masked_tile import MaskedTile
+from image_preparation.tracing import span
 
 
-def replace_logo(im: np.ndarray, old_im: np.ndarray, direction: Directions):
+def replace_logo(
+    im: np.ndarray,
+    old_im: np.ndarray,
+    direction: Directions,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
+):
     """
     shifts the new image to the right and replaces the logo in the image
     with the logo in the new_im
     """
     if direction == Directions.RIGHT:
-        old_im = shift(old_im, direction=Directions.RIGHT)
+        old_im = shift(old_im, direction=Directions.RIGHT, geometry=geometry)
     if direction == Directions.DOWN:
-        old_im = shift(old_im, direction=Directions.DOWN)
-    im[-17:, -81:] = old_im[-17:, -81:]
+        old_im = shift(old_im, direction=Directions.DOWN, geometry=geometry)
+    logo = geometry.logo_box(im.shape)
+    im[logo] = old_im[logo]
     return im
 
 
-def cut_logo(im: np.ndarray):
+def cut_logo(im: np.ndarray, geometry: TileGeometry = DEFAULT_GEOMETRY):
     """
     sets the logo in the lower right corner to black
 
-    logo is positioned 17 pixels by Y from the bottom and 81 pixels by X from the right
+    logo is positioned geometry.logo_size pixels from the lower right corner
     alpha channel is edited to 0
     """
-    im[-17:, -81:] = 0
-    im[-17:, -81:, 3] = 0
+    im[geometry.logo_box(im.shape)] = 0
     return im
 
 
+@dataclass
+class ShiftedImage:
+    """
+    Shifted image that is not materialised
+    Holds a read-only view of the source pixels that stay in the image
+    and where they are placed, every other pixel is transparent
+    """
+
+    # read-only view of the source pixels kept by the shift
+    source: np.ndarray
+    # shape of the shifted image
+    shape: Tuple[int, ...]
+    # position of the source view in the shifted image
+    top: int
+    left: int
+    # (top, left, bottom, right) of the cut logo in the shifted image
+    logo: Optional[Tuple[int, int, int, int]] = None
+
+    def mask(self, top: int, left: int, height: int, width: int) -> np.ndarray:
+        """
+        :return: bool mask of the window, True where pixels are transparent
+        """
+        height = min(height, self.shape[0] - top)
+        width = min(width, self.shape[1] - left)
+        mask = np.ones((height, width), dtype=bool)
+        src_top = max(self.top - top, 0)
+        src_left = max(self.left - left, 0)
+        src_bottom = min(self.top + self.source.shape[0] - top, height)
+        src_right = min(self.left + self.source.shape[1] - left, width)
+        mask[src_top:src_bottom, src_left:src_right] = False
+        if self.logo is not None:
+            logo_top, logo_left, logo_bottom, logo_right = self.logo
+            mask[
+                max(logo_top - top, 0) : max(logo_bottom - top, 0),
+                max(logo_left - left, 0) : max(logo_right - left, 0),
+            ] = True
+        return mask
+
+    def tile(self, top: int, left: int, height: int, width: int) -> np.ndarray:
+        """
+        Materialises only the given window of the shifted image
+        :return: new array, at most height by width pixels
+        """
+        height = min(height, self.shape[0] - top)
+        width = min(width, self.shape[1] - left)
+        with span("tile", top=top, left=left, height=height, width=width):
+            tile = np.zeros(
+                (height, width) + self.shape[2:], self.source.dtype
+            )
+            src_top = max(self.top - top, 0)
+            src_left = max(self.left - left, 0)
+            src_bottom = min(self.top + self.source.shape[0] - top, height)
+            src_right = min(self.left + self.source.shape[1] - left, width)
+            if src_bottom > src_top and src_right > src_left:
+                tile[src_top:src_bottom, src_left:src_right] = self.source[
+                    src_top + top - self.top : src_bottom + top - self.top,
+                    src_left + left - self.left : src_right + left - self.left,
+                ]
+            if self.logo is not None:
+                logo_top, logo_left, logo_bottom, logo_right = self.logo
+                tile[
+                    max(logo_top - top, 0) : max(logo_bottom - top, 0),
+                    max(logo_left - left, 0) : max(logo_right - left, 0),
+                ] = 0
+        return tile
+
+    def masked_tile(
+        self, top: int, left: int, height: int, width: int
+    ) -> MaskedTile:
+        """
+        Same as tile, but keeps RGB pixels and the transparent area apart
+        :return: new tile, at most height by width pixels
+        """
+        height = min(height, self.shape[0] - top)
+        width = min(width, self.shape[1] - left)
+        with span("tile", top=top, left=left, height=height, width=width):
+            tile = MaskedTile(
+                rgb=np.zeros((height, width, 3), self.source.dtype)
+            )
+            src_top = max(self.top - top, 0)
+            src_left = max(self.left - left, 0)
+            src_bottom = min(self.top + self.source.shape[0] - top, height)
+            src_right = min(self.left + self.source.shape[1] - left, width)
+            if src_bottom > src_top and src_right > src_left:
+                box = (slice(src_top, src_bottom), slice(src_left, src_right))
+                source = self.source[
+                    src_top + top - self.top : src_bottom + top - self.top,
+                    src_left + left - self.left : src_right + left - self.left,
+                ]
+                if source.shape[2:] == (4,):
+                    # cvtColor writes into the window of the tile, much
+                    # faster than numpy copy of 3 of 4 channels
+                    cv2.cvtColor(source, cv2.COLOR_BGRA2BGR, dst=tile.rgb[box])
+                else:
+                    tile.rgb[box] = source[..., :3]
+                tile.holes = subtract(
+                    (0, 0, height, width),
+                    (
+                        src_top,
+                        src_left,
+                        src_bottom - src_top,
+                        src_right - src_left,
+                    ),
+                )
+                if source.shape[2:] == (4,):
+                    alpha = source[..., 3]
+                    transparent = alpha == 0
+                    if not np.all(transparent | (alpha == 255)):
+                        tile.alpha = np.full((height, width), 255, alpha.dtype)
+                        tile.alpha[box] = alpha
+                    if transparent.any():
+                        mask = np.zeros((height, width), dtype=bool)
+                        mask[box] = transparent
+                        tile.packed_mask = np.packbits(mask)
+            else:
+                tile.holes = [(0, 0, height, width)]
+            if self.logo is not None:
+                logo_top, logo_left, logo_bottom, logo_right = self.logo
+                logo_top = max(logo_top - top, 0)
+                logo_left = max(logo_left - left, 0)
+                logo_bottom = min(max(logo_bottom - top, 0), height)
+                logo_right = min(max(logo_right - left, 0), width)
+                if logo_bottom > logo_top and logo_right > logo_left:
+                    tile.rgb[logo_top:logo_bottom, logo_left:logo_right] = 0
+                    tile.holes.append(
+                        (
+                            logo_top,
+                            logo_left,
+                            logo_bottom - logo_top,
+                            logo_right - logo_left,
+                        )
+                    )
+        return tile
+
+    def materialise(self) -> np.ndarray:
+        """
+        :return: the whole shifted image as a new array
+        """
+        return self.tile(0, 0, self.shape[0], self.shape[1])
+
+
+def shift_view(
+    im: np.ndarray,
+    direction: Directions,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
+    to_cut_logo: bool = True,
+) -> ShiftedImage:
+    """
+    Same as shift, but no pixels are copied
+    :param im: 4d array of the image
+    :param direction: direction to shift the image
+    :param geometry: the image is shifted by geometry.num_pixels pixels,
+        geometry.tile_size pixels are left in given direction
+    :param to_cut_logo: if True, logo is cutted off at LEFT and UP directions
+    :return: shifted image holding a read-only view of im
+    """
+    height, width = im.shape[:2]
+    axis = 1 if direction in (Directions.LEFT, Directions.RIGHT) else 0
+    length = im.shape[axis]
+    kept = min(length, geometry.tile_size)
+    kept_source = max(kept - geometry.num_pixels, 0)
+    if direction in (Directions.LEFT, Directions.UP):
+        # source pixels are moved to the start, the end is transparent
+        src_start, offset = length - kept_source, 0
+    else:
+        # source pixels are moved to the end, the start is transparent
+        src_start, offset = 0, kept - kept_source
+    if axis == 1:
+        source = im[:, src_start : src_start + kept_source]
+        shape = (height, kept) + im.shape[2:]
+        top, left = 0, offset
+    else:
+        source = im[src_start : src_start + kept_source]
+        shape = (kept, width) + im.shape[2:]
+        top, left = offset, 0
+    source = source.view()
+    source.flags.writeable = False
+
+    logo = None
+    logo_height, logo_width = geometry.logo_size
+    if (
+        to_cut_logo
+        and direction in (Directions.LEFT, Directions.UP)
+        and logo_height
+        and logo_width
+    ):
+        # logo in the lower right corner of the source moves with it
+        logo = (
+            height - logo_height + top - (src_start if axis == 0 else 0),
+            width - logo_width + left - (src_start if axis == 1 else 0),
+            height + top - (src_start if axis == 0 else 0),
+            width + left - (src_start if axis == 1 else 0),
+        )
+    return ShiftedImage(
+        source=source, shape=shape, top=top, left=left, logo=logo
+    )
+
+
 def shift(
     im: np.ndarray,
     direction: Directions,
-    num_pixels: int = 1024 - 1024 // 3,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
     to_cut_logo: bool = True,
 ) -> np.ndarray:
     """
-    Shifts the image (4d array) in the given direction by num_pixels pixels
+    Shifts the image (4d array) in the given direction
+    by geometry.num_pixels pixels
     If image shifts to the left or up, the logo is cutted off
     And then sets alpha channel of shifted pixels to 0
     :param im: 4d array of the image
     :param direction: direction to shift the image
-    :param num_pixels: number of pixels to shift the image
+    :param geometry: tile size and overlap of the generated images
     :param to_cut_logo: if True, logo is cutted off at LEFT and UP directions
-    :return: shifted image, but only 1024 pixels of it in given direction
-    """
-    new_im = np.zeros(im.shape, dtype=im.dtype)
-    new_im[:, :] = im[:, :].copy()
-    if direction == Directions.LEFT:
-        if to_cut_logo:
-            new_im = cut_logo(new_im)
-        new_im[:, :-num_pixels] = new_im[:, num_pixels:]
-        new_im[:, -num_pixels:] = 0
-        new_im[:, -num_pixels:, 3] = 0
-        new_im = new_im[:, -1024:]  # leave only 1024 pixels to the left
-
-    elif direction == Directions.RIGHT:
-        new_im[:, num_pixels:] = new_im[:, :-num_pixels]
-        new_im[:, :num_pixels] = 0
-        new_im[:, :num_pixels, 3] = 0
-        new_im = new_im[:, :1024]  # leave only 1024 pixels to the right
-
-    elif direction == Directions.UP:
-        if to_cut_logo:
-            new_im = cut_logo(new_im)
-        new_im[:-num_pixels, :] = new_im[num_pixels:, :]
-        new_im[-num_pixels:, :] = 0
-        new_im[-num_pixels:, :, 3] = 0
-        new_im = new_im[-1024:, :]  # leave only 1024 pixels to the top
-    elif direction == Directions.DOWN:
-        new_im[num_pixels:, :] = new_im[:-num_pixels, :]
-        new_im[:num_pixels, :] = 0
-        new_im[:num_pixels, :, 3] = 0
-        new_im = new_im[:1024, :]  # leave only 1024 pixels to the bottom
-
-    return new_im
+    :return: shifted image, but only geometry.tile_size pixels of it
+        in given direction
+    """
+    with span("shift", direction=direction.name):
+        return shift_view(
+            im,
+            direction=direction,
+            geometry=geometry,
+            to_cut_logo=to_cut_logo,
+        ).materialise()
+
+
+def tile_windows(
+    shape: Tuple[int, ...],
+    direction: Directions,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Splits the shifted image into geometry.tile_size tiles
+    each with shift of geometry.num_pixels
+    :param shape: shape of the shifted image
+    :param direction: direction the image is shifted to
+    :param geometry: tile size and overlap of the generated images
+    :return: list of (top, left, height, width) of the tiles
+    """
+    return geometry.tile_windows(shape, direction)
 
 
 def shift_large(
     im: np.ndarray,
     direction: Directions,
-    num_pixels: int = 1024 - 1024 // 3,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
     to_cut_logo: bool = True,
-    default_shape: int = 1024,
 ) -> List[np.ndarray]:
     """
     :param im: 4d array of the image
     :param direction: direction to shift the image
-    :param num_pixels: number of pixels to shift the image
+    :param geometry: tile size and overlap of the generated images
     :param to_cut_logo: if True, logo is cutted off at LEFT and UP directions
-    :param default_shape: default shape of the generated image
-    :return: List of images 1024 by 1024, they are part of the input image
-            with num_pixels pixels shifted
+    :return: List of images geometry.tile_size by geometry.tile_size,
+            they are part of the input image with geometry.num_pixels
+            pixels shifted
     """
-    shifted_image = shift(
-        im, direction=direction, num_pixels=num_pixels, to_cut_logo=to_cut_logo
-    )
+    with span("shift", direction=direction.name):
+        return list(
+            iter_shift_large(
+                im,
+                direction=direction,
+                geometry=geometry,
+                to_cut_logo=to_cut_logo,
+            )
+        )
 
-    # if the image is not of the default shape,
-    # slice it to the default shape images each with shift of num_pixels
-    ret = []
 
-    if (
-        shifted_image.shape[0] != default_shape
-        or shifted_image.shape[1] != default_shape
-    ):
-        if direction == Directions.LEFT or direction == Directions.RIGHT:
-            max_shift = shifted_image.shape[0]
-        else:
-            max_shift = shifted_image.shape[1]
-        for num_shift in range(0, max_shift - num_pixels, num_pixels):
-
-            # if direction is left or right, go vertically
-            # else go horizontally
-            if direction == Directions.LEFT or direction == Directions.RIGHT:
-                ret.append(
-                    shifted_image[num_shift : num_shift + default_shape, :]
-                )
-            else:
-                ret.append(
-                    shifted_image[:, num_shift : num_shift + default_shape]
-                )
-    else:
-        ret.append(shifted_image)
-    return ret
+def iter_shift_large(
+    im: np.ndarray,
+    direction: Directions,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
+    to_cut_logo: bool = True,
+) -> Iterator[np.ndarray]:
+    """
+    Same as shift_large, but the tiles are yielded one at a time,
+    so only one of them is in memory however long the image is
+    :param im: 4d array of the image, e.g. np.memmap of a .npy file,
+        only the pixels of the current tile are read from it
+    :param direction: direction to shift the image
+    :param geometry: tile size and overlap of the generated images
+    :param to_cut_logo: if True, logo is cutted off at LEFT and UP directions
+    :return: iterator of images geometry.tile_size by geometry.tile_size
+    """
+    # only the tiles are materialised, never the whole shifted image
+    shifted_image = shift_view(
+        im,
+        direction=direction,
+        geometry=geometry,
+        to_cut_logo=to_cut_logo,
+    )
+    for window in tile_windows(shifted_image.shape, direction, geometry):
+        yield shifted_image.tile(*window)
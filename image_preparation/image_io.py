@@ -0,0 +1,125 @@
+"""
+Reading and writing of the image files of the pipeline
+
+Every image the pipeline writes goes through write_image with a codec:
+    FAST: PNG with the fastest zlib settings, for parts, _done images and
+        the other intermediate files
+    SMALL: lossless PNG with the best ratio, for the combined image when
+        its size matters more than the time to encode it
+    NPY: raw pixels without any encoding, for scratch files that only the
+        pipeline reads back, never for files a generator reads
+PNGs are encoded strip by strip by png_writer, so views and np.memmap
+canvases are never copied whole. Sources saved as .npy are mapped from
+disk instead of read whole, see map_image.
+"""
+import io
+import os
+import threading
+import zlib
+from enum import Enum
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from image_preparation.png_writer import PngFilter, write_png
+
+
+class Codec(str, Enum):
+    FAST = "fast"
+    SMALL = "small"
+    NPY = "npy"
+
+    def __str__(self):
+        return self.value
+
+    @property
+    def extension(self) -> str:
+        """
+        :return: extension of the files written with the codec
+        """
+        return ".npy" if self == Codec.NPY else ".png"
+
+
+# zlib level, PNG filter and zlib strategy of the PNG codecs
+PNG_SETTINGS = {
+    Codec.FAST: (1, PngFilter.SUB, zlib.Z_RLE),
+    Codec.SMALL: (9, PngFilter.AVERAGE, zlib.Z_FILTERED),
+}
+
+
+def write_image(path: str, im: np.ndarray, codec: Codec = Codec.FAST):
+    """
+    :param path: path to the file, its extension must match the codec
+    :param im: image in OpenCV BGR(A) channel order,
+        may be a view or np.memmap
+    :param codec: codec of the file
+    :raise ValueError: if the extension of the path doesn't match the codec,
+        or a PNG codec is given an image that is not uint8
+    """
+    codec = Codec(codec)
+    extension = os.path.splitext(path)[1].lower()
+    if extension != codec.extension:
+        raise ValueError(f"{path} can't be written as {codec}")
+    if codec == Codec.NPY:
+        # written next to the file and swapped in, like PNGs, readers
+        # never see a half-written file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # file object, np.save would add .npy to other paths
+            with open(tmp_path, "wb") as f:
+                np.save(f, im)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return
+    compression, filter_type, strategy = PNG_SETTINGS[codec]
+    write_png(
+        path,
+        im,
+        compression=compression,
+        filter_type=filter_type,
+        strategy=strategy,
+    )
+
+
+def read_image(path: str) -> Optional[np.ndarray]:
+    """
+    :return: pixels of the image as they're saved, in OpenCV channel
+        order, None if the file can't be decoded
+    """
+    if os.path.splitext(path)[1].lower() == Codec.NPY.extension:
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            # e.g. while it's being written
+            return None
+    return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+
+def decode_image(data: bytes) -> Optional[np.ndarray]:
+    """
+    :param data: contents of a file written by write_image with any codec
+    :return: pixels of the image as they're saved, in OpenCV channel
+        order, None if the data can't be decoded
+    """
+    if data.startswith(np.lib.format.MAGIC_PREFIX):
+        try:
+            return np.load(io.BytesIO(data))
+        except ValueError:
+            return None
+    return cv2.imdecode(
+        np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED
+    )
+
+
+def map_image(path: str) -> Optional[np.ndarray]:
+    """
+    :return: read-only np.memmap of the .npy image, its pixels are read
+        from disk only when they're accessed, None for other formats
+    """
+    if os.path.splitext(path)[1].lower() != Codec.NPY.extension:
+        return None
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,125 @@
+"""
+Decoded images shared by the whole process
+
+The source image and the generated _done images are read by several
+steps of the pipeline. The store decodes every file once and keeps the
+RGBA pixels while the file stays the same: entries are keyed by the path,
+modification time and size of the file, so a changed file is decoded
+again. Arrays from the store are read-only, copy them before editing.
+"""
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from image_preparation.image_io import read_image
+from image_preparation.lru_cache import LRUCache
+from image_preparation.tracing import span
+
+Version = Tuple[int, int]
+
+# times a file that changes while it's decoded is decoded again
+READ_ATTEMPTS = 3
+
+
+def file_version(path: str) -> Version:
+    """
+    :return: modification time and size of the file
+    :raise FileNotFoundError: if the file does not exist
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def decode_rgba(path: str) -> Optional[np.ndarray]:
+    """
+    :return: RGBA pixels of the image, None if it can't be decoded
+    """
+    with span("read", path=path):
+        im = read_image(path)
+    if im is None:
+        return None
+    if im.ndim == 3 and im.shape[2] == 4:
+        # converting would only copy the pixels
+        return im
+    with span("cvtColor"):
+        return cv2.cvtColor(im, cv2.COLOR_RGB2RGBA)
+
+
+class ImageStore:
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: total size of the decoded images kept in memory
+        """
+        self._cache = LRUCache(max_bytes, on_evict=self._evicted)
+        # version of every cached path, so outdated pixels are dropped
+        self._versions: Dict[str, Version] = {}
+        self._lock = threading.Lock()
+
+    def read(self, path: str) -> np.ndarray:
+        """
+        :return: read-only RGBA pixels of the image, decoded once
+            while the file stays the same
+        :raise FileNotFoundError: if the file does not exist
+        :raise ValueError: if the file can't be decoded, e.g. while
+            it's being written
+        """
+        for _ in range(READ_ATTEMPTS):
+            version = file_version(path)
+            im = self._cache.get((os.path.abspath(path), version))
+            if im is not None:
+                return im
+            im = decode_rgba(path)
+            if im is None:
+                raise ValueError(f"{path} can't be decoded")
+            # file may have been replaced while it was decoded
+            if file_version(path) == version:
+                im.flags.writeable = False
+                self._store(path, version, im)
+                return im
+        raise ValueError(f"{path} keeps changing while it's decoded")
+
+    def put(self, path: str, im: np.ndarray):
+        """
+        Stores pixels of the file that was just written, so it's not
+        decoded again
+        :param path: path to the written file
+        :param im: RGBA pixels as read() would return them,
+            they must not be edited afterwards
+        """
+        im = im.view()
+        im.flags.writeable = False
+        self._store(path, file_version(path), im)
+
+    def _store(self, path: str, version: Version, im: np.ndarray):
+        path = os.path.abspath(path)
+        with self._lock:
+            old_version = self._versions.get(path)
+            if old_version is not None and old_version != version:
+                self._cache.pop((path, old_version))
+            self._versions[path] = version
+        self._cache.put((path, version), im)
+
+    def _evicted(self, key: Tuple[str, Version]):
+        path, version = key
+        with self._lock:
+            # a newer version may be stored already
+            if self._versions.get(path) == version:
+                del self._versions[path]
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+        self._cache.clear()
+
+
+IMAGE_STORE = ImageStore(max_bytes=512 * 1024 * 1024)
+
+
+def read_rgba(path: str) -> np.ndarray:
+    """
+    :return: read-only RGBA pixels of the image from IMAGE_STORE
+    """
+    return IMAGE_STORE.read(path)
@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Least recently used cache of arrays bounded by their total size
+    Values may be other objects with nbytes as well, e.g. MaskedTile
+    Safe to use from several threads
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        on_evict: Optional[Callable[[Hashable], None]] = None,
+    ):
+        """
+        :param max_bytes: total nbytes of the arrays kept in the cache
+        :param on_evict: called with the key of every array evicted,
+            or not cached for being larger than max_bytes, after the lock
+            of the cache is released
+        """
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.nbytes = 0
+        self._items: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: Hashable):
+        return key in self._items
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """
+        :return: cached array or None, the array becomes most recently used
+        """
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: np.ndarray):
+        """
+        Adds the array and evicts least recently used ones over max_bytes
+        Arrays larger than max_bytes are not cached
+        """
+        evicted_keys = []
+        with self._lock:
+            self.pop(key)
+            if value.nbytes > self.max_bytes:
+                evicted_keys.append(key)
+            else:
+                self._items[key] = value
+                self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes:
+                evicted_key, evicted = self._items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                evicted_keys.append(evicted_key)
+        if self.on_evict is not None:
+            for evicted_key in evicted_keys:
+                self.on_evict(evicted_key)
+
+    def pop(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self.nbytes -= value.nbytes
+            return value
+
+    def get_or_compute(
+        self, key: Hashable, compute: Callable[[], np.ndarray]
+    ) -> Optional[np.ndarray]:
+        """
+        :param key: key of the array
+        :param compute: called to get the array if it's not cached,
+            None is returned and not cached
+        :return: cached or computed array
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
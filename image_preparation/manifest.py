@@ -0,0 +1,129 @@
+"""
+Manifest of a panorama job, kept next to the source image
+
+It records the geometry of every part, how far the part has got, the
+checksum of every _done file the job has used and the parameters the
+parts are generated with. A job started again for the same image and
+parameters resumes at the first part that's not done, directions that
+are combined already are not combined again. The manifest is replaced
+atomically, so a crash never leaves it half-written.
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import Dict, List, Optional
+
+MANIFEST_VERSION = 1
+
+
+class PartStatus(str, Enum):
+    # part is not written yet
+    PENDING = "pending"
+    # part is written, waiting to be generated
+    WRITTEN = "written"
+    # generated part is read by the job, its checksum is recorded
+    DONE = "done"
+
+    def __str__(self):
+        return self.value
+
+
+def manifest_path(impath: str) -> str:
+    """
+    :return: path to the manifest of the job of the image,
+        {impath}_manifest.json
+    """
+    return os.path.splitext(impath)[0] + "_manifest.json"
+
+
+def file_checksum(path: str) -> Optional[str]:
+    """
+    :return: sha256 of the file, None if it does not exist
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+@dataclass
+class PartRecord:
+    # name of the part file, it's next to the source image
+    name: str
+    # (top, left, height, width) of the part in the shifted source image
+    window: Optional[List[int]]
+    status: PartStatus = PartStatus.PENDING
+    # checksum of the _done file the job has used
+    checksum: Optional[str] = None
+
+
+@dataclass
+class JobManifest:
+    source_checksum: str
+    # everything the generated parts depend on
+    params: dict
+    parts: Dict[str, List[PartRecord]]
+    # checksums of {image}_{direction}_done.png of combined directions
+    combined: Dict[str, str] = field(default_factory=dict)
+    # checksum of the combined image
+    result: Optional[str] = None
+    version: int = MANIFEST_VERSION
+
+    def __post_init__(self):
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, path: str) -> Optional["JobManifest"]:
+        """
+        :return: manifest, None if it's missing, broken or outdated
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                return None
+            data["parts"] = {
+                direction: [
+                    PartRecord(
+                        name=record["name"],
+                        window=record["window"],
+                        status=PartStatus(record["status"]),
+                        checksum=record["checksum"],
+                    )
+                    for record in records
+                ]
+                for direction, records in data["parts"].items()
+            }
+            return cls(**data)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, path: str):
+        """
+        Replaces the manifest atomically
+        """
+        with self._lock:
+            data = asdict(self)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=1, default=str)
+            os.replace(tmp_path, path)
+
+    def update_part(
+        self,
+        direction: str,
+        part_number: int,
+        status: PartStatus,
+        checksum: Optional[str] = None,
+    ):
+        with self._lock:
+            record = self.parts[direction][part_number]
+            record.status = status
+            record.checksum = checksum
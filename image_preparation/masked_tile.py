@@ -0,0 +1,101 @@
+"""
+Compact tile of RGB pixels and the area that's transparent
+
+Alpha of the parts only marks the pixels to generate: the shifted out
+strip and the cut logo, both rectangles, and the rare transparent pixels
+of the source. A tile keeps RGB pixels and the transparent area as
+rectangles and a bit-packed mask, instead of a whole alpha byte per pixel,
+and is converted to RGBA only when it's written out for the generator.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+Rect = Tuple[int, int, int, int]
+
+
+@dataclass
+class MaskedTile:
+    # RGB pixels of the tile
+    rgb: np.ndarray
+    # (top, left, height, width) of the transparent rectangles
+    holes: List[Rect] = field(default_factory=list)
+    # np.packbits of the other transparent pixels, row-major
+    packed_mask: Optional[np.ndarray] = None
+    # alpha of the tile, kept only if it has semi-transparent pixels
+    alpha: Optional[np.ndarray] = None
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        """
+        :return: shape of the tile as RGBA image
+        """
+        return self.rgb.shape[0], self.rgb.shape[1], 4
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :return: bytes held by the tile, so it can be kept in LRUCache
+        """
+        ret = self.rgb.nbytes
+        if self.packed_mask is not None:
+            ret += self.packed_mask.nbytes
+        if self.alpha is not None:
+            ret += self.alpha.nbytes
+        return ret
+
+    def mask(self) -> np.ndarray:
+        """
+        :return: bool mask of the tile, True where pixels are transparent
+        """
+        height, width = self.rgb.shape[:2]
+        if self.packed_mask is not None:
+            mask = np.unpackbits(self.packed_mask, count=height * width)
+            mask = mask.reshape(height, width).astype(bool)
+        else:
+            mask = np.zeros((height, width), dtype=bool)
+        for top, left, hole_height, hole_width in self.holes:
+            mask[top : top + hole_height, left : left + hole_width] = True
+        return mask
+
+    def to_rgba(self) -> np.ndarray:
+        """
+        :return: new RGBA array of the tile
+        """
+        # cvtColor adds opaque alpha much faster than strided assignment
+        ret = cv2.cvtColor(self.rgb, cv2.COLOR_BGR2BGRA)
+        if self.alpha is not None:
+            ret[..., 3] = self.alpha
+        for top, left, height, width in self.holes:
+            ret[top : top + height, left : left + width, 3] = 0
+        if self.packed_mask is not None:
+            height, width = self.rgb.shape[:2]
+            mask = np.unpackbits(self.packed_mask, count=height * width)
+            ret[..., 3][mask.reshape(height, width).astype(bool)] = 0
+        return ret
+
+    @classmethod
+    def from_rgba(cls, im: np.ndarray) -> "MaskedTile":
+        """
+        :param im: RGBA image
+        :return: tile of the image, transparent pixels that form
+            one rectangle are kept as a hole
+        """
+        alpha = im[..., 3]
+        transparent = alpha == 0
+        tile = cls(rgb=np.ascontiguousarray(im[..., :3]))
+        if not np.all(transparent | (alpha == 255)):
+            tile.alpha = alpha.copy()
+        rows = np.flatnonzero(transparent.any(axis=1))
+        if not len(rows):
+            return tile
+        cols = np.flatnonzero(transparent.any(axis=0))
+        top, bottom = int(rows[0]), int(rows[-1]) + 1
+        left, right = int(cols[0]), int(cols[-1]) + 1
+        if transparent[top:bottom, left:right].all():
+            tile.holes = [(top, left, bottom - top, right - left)]
+        else:
+            tile.packed_mask = np.packbits(transparent)
+        return tile
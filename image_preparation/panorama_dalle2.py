@@ -1,15 +1,24 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 
-import cv2
 import numpy as np
 import os
 
-from image_preparation import shift, shift_large, replace_logo
+from image_preparation import shift, shift_view, tile_windows
+from image_preparation.blending import BlendMode, blend_overlap
+from image_preparation.canvas import Canvas
 from image_preparation.data import Directions, PanoramaPart
+from image_preparation.data.panorama_part import read_source
+from image_preparation.geometry import DEFAULT_GEOMETRY, TileGeometry
+from image_preparation.image_io import Codec, write_image
+from image_preparation.image_store import decode_rgba, read_rgba
+from image_preparation.preview import write_preview_pyramid
+from image_preparation.tracing import span
 
 
 def prepare_panorama(
-    impath: str, directions: Optional[List[Directions]] = None
+    impath: str,
+    directions: Optional[List[Directions]] = None,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
 ):
     """
     Prepare for image generation
@@ -17,6 +26,7 @@ def prepare_panorama(
     {impath}_shifted.png
     :param impath: path to the image
     :param directions: list of directions to shift the image
+    :param geometry: tile size and overlap of the generated images
     :return: None
     """
     if directions is None:
@@ -24,171 +34,300 @@ def prepare_panorama(
     folder = os.path.dirname(impath)
     basename = os.path.basename(impath)
     basename_without_extension = os.path.splitext(basename)[0]
-    im = cv2.imread(impath, cv2.IMREAD_UNCHANGED)
-    im = cv2.cvtColor(im, cv2.COLOR_RGB2RGBA)
+    im = read_rgba(impath)
     for direction in directions:
-        shifted_im = shift(im, direction=direction)
-        cv2.imwrite(
-            os.path.join(
-                folder, basename_without_extension + f"_{direction}.png"
-            ),
-            shifted_im,
+        shifted_im = shift(im, direction=direction, geometry=geometry)
+        shifted_path = os.path.join(
+            folder, basename_without_extension + f"_{direction}.png"
         )
+        with span("write", path=shifted_path):
+            write_image(shifted_path, shifted_im)
 
 
 def prepare_full_panorama(
-    impath: str, directions: Optional[List[Directions]] = None
+    impath: str,
+    directions: Optional[List[Directions]] = None,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
+    codec: Codec = Codec.FAST,
 ) -> Dict[Directions, List[PanoramaPart]]:
     """
     Prepare for image generation
-    Read the image. Shift the image and save it near the other with name
-    {impath}_shifted.png
+    Read the image and split the shifted image into parts that are saved
+    near the other with name {impath}_{direction}_{part_number}.png
+    Parts hold only their geometry, pixels are computed on first access
     :param impath: path to the image
     :param directions: list of directions to shift the image
-    :return: dictionary of shifted images
+    :param geometry: tile size and overlap of the parts
+    :param codec: codec the parts are written with, e.g. .npy for NPY
+    :return: dictionary of parts of the shifted images
     """
     if directions is None:
         directions = Directions
     folder = os.path.dirname(impath)
     basename = os.path.basename(impath)
     basename_without_extension = os.path.splitext(basename)[0]
-    im = cv2.imread(impath, cv2.IMREAD_UNCHANGED)
-    im = cv2.cvtColor(im, cv2.COLOR_RGB2RGBA)
+    # source is decoded once and stays cached for the parts, .npy source
+    # is mapped from disk, only pixels of the parts are read when needed
+    im = read_source(impath)
     ret = {}
     for direction in directions:
         ret[direction] = []
-        # shifted_ims = shift_large(im, direction=direction)
-        shifted_ims = shift_large(im, direction=direction)
-        for i, shifted_im in enumerate(shifted_ims):
+        shifted_im = shift_view(im, direction=direction, geometry=geometry)
+        windows = tile_windows(shifted_im.shape, direction, geometry)
+        for i, window in enumerate(windows):
             shifted_im_name = os.path.join(
                 folder,
-                basename_without_extension + f"_{direction}_{i:03d}.png",
+                basename_without_extension
+                + f"_{direction}_{i:03d}{codec.extension}",
             )
 
             ret[direction].append(
                 PanoramaPart(
                     path=shifted_im_name,
                     direction=direction,
-                    img=shifted_im,
                     part_number=i,
+                    source_path=impath,
+                    window=window,
+                    geometry=geometry,
                 )
             )
     return ret
 
 
 def combine_parts(
-    old_part: PanoramaPart, new_part: PanoramaPart, num_pixels=1024 // 3
+    old_part: PanoramaPart,
+    new_part: PanoramaPart,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
 ) -> PanoramaPart:
     """
     :param old_part:
     :param new_part:
+    :param geometry: new part starts with geometry.overlap pixels
+        of the old one
     :return:
     """
-    ret_part = PanoramaPart(
-        path=new_part.path,
-        part_number=new_part.part_number,
-        direction=new_part.direction,
-        img=new_part.img,
-    )
-    if old_part.direction == Directions.UP:
-        ret_part.img[:, :num_pixels, :] = old_part.img[:, -num_pixels:, :]
-    elif old_part.direction == Directions.DOWN:
-        ret_part.img[:, :num_pixels, :] = old_part.img[:, -num_pixels:, :]
-    elif old_part.direction == Directions.LEFT:
-        ret_part.img[:num_pixels, :, :] = old_part.img[-num_pixels:, :, :]
-    elif old_part.direction == Directions.RIGHT:
-        ret_part.img[:num_pixels, :, :] = old_part.img[-num_pixels:, :, :]
+    num_pixels = geometry.overlap
+    with span("combine", path=new_part.path):
+        ret_part = PanoramaPart(
+            path=new_part.path,
+            part_number=new_part.part_number,
+            direction=new_part.direction,
+            img=new_part.img.copy(),
+        )
+        if old_part.direction == Directions.UP:
+            ret_part.img[:, :num_pixels, :] = old_part.img[:, -num_pixels:, :]
+        elif old_part.direction == Directions.DOWN:
+            ret_part.img[:, :num_pixels, :] = old_part.img[:, -num_pixels:, :]
+        elif old_part.direction == Directions.LEFT:
+            ret_part.img[:num_pixels, :, :] = old_part.img[-num_pixels:, :, :]
+        elif old_part.direction == Directions.RIGHT:
+            ret_part.img[:num_pixels, :, :] = old_part.img[-num_pixels:, :, :]
 
     return ret_part
 
 
+def replace_logo_band(
+    band: np.ndarray,
+    base: np.ndarray,
+    geometry: TileGeometry,
+    blend: BlendMode,
+) -> np.ndarray:
+    """
+    :param band: overlap band at the lower or right end of the generated
+        image, with the logo
+    :param base: pixels of the band already on the canvas
+    :param geometry: size of the logo
+    :param blend: blending of the band
+    :return: copy of the band with the logo replaced by the pixels already
+        on the canvas, so the logo doesn't bleed into the blended seam,
+        the band itself if it's not blended at all
+    """
+    if blend == BlendMode.NONE:
+        return band
+    logo = geometry.logo_box(band.shape)
+    band = band.copy()
+    band[logo] = base[logo]
+    return band
+
+
 def combine_images(
     impath: str,
     directions: Optional[List[Directions]] = None,
-    num_pixels: int = 1024 - 1024 // 3,
+    geometry: TileGeometry = DEFAULT_GEOMETRY,
+    backing_path: Optional[str] = None,
+    codec: Codec = Codec.FAST,
+    blend: BlendMode = BlendMode.NONE,
+    write_preview: bool = False,
+    images: Optional[Dict[Directions, np.ndarray]] = None,
 ) -> str:
     """
     Combine the images with the given direction images
     Reads image, reads direction_done image.
-    Image should be extended to the size of num_pixels in the opposite
-    direction, then changes from direction_done are applied to the image
+    Final size of the image is computed ahead, so the canvas is allocated
+    once and every direction_done image is written straight into place
     :param impath: path to the image
     :param directions: list of directions to combine the image
-    :param num_pixels: number of pixels to extend the image in any direction
+    :param geometry: the image is extended by geometry.num_pixels pixels
+        in any direction, logo of the direction images is replaced
+    :param backing_path: if set, canvas is kept in np.memmap at this path
+        instead of RAM, the file is removed once the result is written
+        or combining fails
+    :param codec: codec of the result, SMALL for the smallest PNG
+    :param blend: blending of the overlap between the image and
+        the direction images
+    :param write_preview: if True, preview pyramid is written for the result
+    :param images: direction images already in memory,
+        the other ones are read from disk
     :return: combined_path
     """
+    if directions is None:
+        directions = Directions
+    # source is usually decoded already by prepare_full_panorama
+    im = read_source(impath)
+    canvas, top, left = Canvas.for_directions(
+        im.shape,
+        list(directions),
+        geometry,
+        dtype=im.dtype,
+        backing_path=backing_path,
+    )
+    # the canvas may be a file of the size of the result, it's removed
+    # on errors as well
+    try:
+        canvas.paste(im, top, left)
+        bottom, right = top + im.shape[0], left + im.shape[1]
+        del im
+        return _combine_on_canvas(
+            impath,
+            directions,
+            geometry,
+            canvas,
+            (top, left, bottom, right),
+            codec,
+            blend,
+            write_preview,
+            images,
+        )
+    finally:
+        canvas.close()
+
+
+def _combine_on_canvas(
+    impath: str,
+    directions: List[Directions],
+    geometry: TileGeometry,
+    canvas: Canvas,
+    bounds: Tuple[int, int, int, int],
+    codec: Codec,
+    blend: BlendMode,
+    write_preview: bool,
+    images: Optional[Dict[Directions, np.ndarray]],
+) -> str:
+    """
+    Pastes the direction images around the image on the canvas and writes
+    the result, see combine_images
+    :param bounds: top, left, bottom and right of the image on the canvas
+    """
     folder = os.path.dirname(impath)
     basename = os.path.basename(impath)
     basename_without_extension = os.path.splitext(basename)[0]
-    if directions is None:
-        directions = Directions
-    im = cv2.imread(impath, cv2.IMREAD_UNCHANGED)
-    im = cv2.cvtColor(im, cv2.COLOR_RGB2RGBA)
+    top, left, bottom, right = bounds
+    num_pixels = geometry.num_pixels
     for direction in directions:
-        im_direction = cv2.imread(
-            os.path.join(
-                folder, basename_without_extension + f"_{direction}_done.png"
-            ),
-            cv2.IMREAD_UNCHANGED,
+        direction_path = os.path.join(
+            folder, basename_without_extension + f"_{direction}_done.png"
         )
-        im_direction = cv2.cvtColor(im_direction, cv2.COLOR_RGB2RGBA)
-        if direction == Directions.LEFT:
-            # extend image to the right
-            im = np.concatenate(
-                (
-                    im,
-                    np.zeros((im.shape[0], num_pixels, 4), dtype=im.dtype),
-                ),
-                axis=1,
-            )
-            # replace new part with im_direction
-            im[:, -1024:] = im_direction
-        if direction == Directions.RIGHT:
-            # replace logo
-            im_direction = replace_logo(im_direction, im, direction=direction)
-            # extend image to the left
-            im = np.concatenate(
-                (
-                    np.zeros((im.shape[0], num_pixels, 4), dtype=im.dtype),
-                    im,
-                ),
-                axis=1,
-            )
-            # replace new part with im_direction
-            im[:, :1024] = im_direction
-        if direction == Directions.UP:
-            # extend image to the bottom
-            im = np.concatenate(
-                (
-                    im,
-                    np.zeros((num_pixels, im.shape[1], 4), dtype=im.dtype),
-                ),
-                axis=0,
-            )
-            # replace new part with im_direction
-            im[-1024:, :] = im_direction
-        if direction == Directions.DOWN:
-            # replace logo
-            im_direction = replace_logo(
-                im_direction, im[:1024], direction=direction
-            )
-            # im_direction[-17:, -81:] = im[1024-17:1024, 1024-81:1024]
-
-            # extend image to the top
-            im = np.concatenate(
-                (
-                    np.zeros((num_pixels, im.shape[1], 4), dtype=im.dtype),
-                    im,
-                ),
-                axis=0,
-            )
-            # replace new part with im_direction
-            im[:1024, :] = im_direction
+        # only the overlap band is blended apart, the given or decoded
+        # pixels are never edited or copied whole
+        if images is not None and direction in images:
+            im_direction = images[direction]
+        else:
+            # read once, it's not kept in the image store
+            im_direction = decode_rgba(direction_path)
+            if im_direction is None:
+                raise ValueError(f"{direction_path} can't be decoded")
+        with span("combine", direction=direction.name):
+            height, width = im_direction.shape[:2]
+            logo = geometry.logo_box(im_direction.shape)
+            if direction == Directions.LEFT:
+                # extend image to the right
+                right += num_pixels
+                window = canvas.window(top, right - width, height, width)
+                overlap = width - num_pixels
+                seam = blend_overlap(
+                    window[:, :overlap],
+                    im_direction[:, :overlap],
+                    1,
+                    True,
+                    blend,
+                )
+                # replace new part with im_direction
+                window[:, overlap:] = im_direction[:, overlap:]
+                window[:, :overlap] = seam
+            if direction == Directions.RIGHT:
+                # extend image to the left
+                left -= num_pixels
+                window = canvas.window(top, left, height, width)
+                start = num_pixels
+                seam = blend_overlap(
+                    window[:, start:],
+                    replace_logo_band(
+                        im_direction[:, start:],
+                        window[:, start:],
+                        geometry,
+                        blend,
+                    ),
+                    1,
+                    False,
+                    blend,
+                )
+                # replace logo with the pixels already on the canvas
+                logo_pixels = window[logo].copy()
+                # replace new part with im_direction
+                window[:, :start] = im_direction[:, :start]
+                window[:, start:] = seam
+                window[logo] = logo_pixels
+            if direction == Directions.UP:
+                # extend image to the bottom
+                bottom += num_pixels
+                window = canvas.window(bottom - height, left, height, width)
+                overlap = height - num_pixels
+                seam = blend_overlap(
+                    window[:overlap], im_direction[:overlap], 0, True, blend
+                )
+                # replace new part with im_direction
+                window[overlap:] = im_direction[overlap:]
+                window[:overlap] = seam
+            if direction == Directions.DOWN:
+                # extend image to the top
+                top -= num_pixels
+                window = canvas.window(top, left, height, width)
+                start = num_pixels
+                seam = blend_overlap(
+                    window[start:],
+                    replace_logo_band(
+                        im_direction[start:], window[start:], geometry, blend
+                    ),
+                    0,
+                    False,
+                    blend,
+                )
+                # replace logo with the pixels already on the canvas
+                logo_pixels = window[logo].copy()
+                # replace new part with im_direction
+                window[:start] = im_direction[:start]
+                window[start:] = seam
+                window[logo] = logo_pixels
+        # seam may be a view of the image, neither of them is kept
+        del im_direction, seam
     combined_path = os.path.join(
-        folder, basename_without_extension + f"_full.png"
-    )
-    cv2.imwrite(
-        combined_path,
-        im,
+        folder, basename_without_extension + f"_full{codec.extension}"
     )
+    # result is encoded strip by strip straight from the canvas
+    result = canvas.window(top, left, bottom - top, right - left)
+    with span("write", path=combined_path):
+        write_image(combined_path, result, codec)
+    if write_preview:
+        write_preview_pyramid(combined_path, result)
+    del result
     return combined_path
@@ -0,0 +1,639 @@
+"""
+Panorama generation without UI
+It goes through the same steps the user goes through in the UI:
+    1) Prepare parts of the panorama (prepare_full_panorama)
+    2) Write the current part to disk and get it generated by the backend
+    3) Merge generated part into the next part (combine_parts)
+       and paste it into the strip of its direction (StripCompositor)
+    4) After the last part of a direction, save the direction strip
+    5) After the last direction, combine the images (combine_images)
+Progress is kept in the manifest next to the image, a job started again
+resumes at the first part that's not generated.
+With a backend that returns the generated images, the job can run in
+memory: parts, generated images and direction strips are passed between
+the steps as arrays and only the combined image is written.
+"""
+import json
+import os
+from dataclasses import asdict
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from image_preparation import cut_logo, shift_view
+from image_preparation.backends import FolderBackend, InpaintingBackend
+from image_preparation.blending import BlendMode
+from image_preparation.compositor import StripCompositor
+from image_preparation.data import Directions, PanoramaPart
+from image_preparation.data.panorama_part import read_source
+from image_preparation.geometry import DEFAULT_GEOMETRY, TileGeometry
+from image_preparation.image_io import Codec, write_image
+from image_preparation.image_store import IMAGE_STORE, read_rgba
+from image_preparation.manifest import (
+    JobManifest,
+    PartRecord,
+    PartStatus,
+    file_checksum,
+    manifest_path,
+)
+from image_preparation.panorama_dalle2 import (
+    combine_images,
+    combine_parts,
+    prepare_full_panorama,
+)
+from image_preparation.preview import write_preview_pyramid
+from image_preparation.result_cache import ResultCache, make_key
+from image_preparation.scheduler import part_dependencies, run_dag
+from image_preparation.tracing import span
+
+
+def done_path(path: str) -> str:
+    """
+    :return: path the generated image is saved to, {path}_done.png,
+        with the extension of the path
+    """
+    folder = os.path.dirname(path)
+    basename = os.path.basename(path)
+    basename_without_extension, extension = os.path.splitext(basename)
+    return os.path.join(
+        folder, basename_without_extension + f"_done{extension}"
+    )
+
+
+def _skip():
+    """
+    Task of a step that's done already
+    """
+
+
+class PanoramaJob:
+    def __init__(
+        self,
+        impath: str,
+        directions: Optional[List[Directions]],
+        backend: Optional[InpaintingBackend] = None,
+        geometry: TileGeometry = DEFAULT_GEOMETRY,
+        cache: Optional[ResultCache] = None,
+        prompt: str = "",
+        blend: BlendMode = BlendMode.NONE,
+        write_previews: bool = False,
+        resume: bool = True,
+        in_memory: bool = False,
+        codec: Codec = Codec.FAST,
+        final_codec: Codec = Codec.FAST,
+        canvas_folder: Optional[str] = None,
+    ):
+        """
+        :param impath: path to the source image
+        :param directions: directions to extend the image in,
+            all of them if None or empty, e.g. when none is chosen in the UI
+        :param backend: backend generating the parts, FolderBackend if None
+        :param geometry: tile size and overlap of the generated parts
+        :param cache: if set, generated parts are reused from it
+        :param prompt: prompt the parts are generated with
+        :param blend: blending of the seams between generated parts
+        :param write_previews: if True, preview pyramids are written for
+            the parts and the combined image, to be shown in the UI
+        :param resume: if True, the job continues from its manifest,
+            if it was started before with the same parameters
+        :param in_memory: if True, no intermediate files are written,
+            only the combined image. There's nothing to resume from
+        :param codec: codec of the intermediate files, NPY only with
+            a backend that doesn't read _done files
+        :param final_codec: codec of the combined image
+        :param canvas_folder: if set, the canvas of the combined image is
+            kept in np.memmap in this folder instead of RAM
+        :raise ValueError: if in_memory or NPY codec is used with a backend
+            that reads _done files
+        """
+        self.impath = impath
+        self.directions = list(directions or Directions)
+        self.backend = backend if backend is not None else FolderBackend()
+        self.geometry = geometry
+        self.cache = cache
+        self.prompt = prompt
+        self.blend = blend
+        self.write_previews = write_previews
+        self.resume = resume
+        self.in_memory = in_memory
+        self.codec = Codec(codec)
+        self.final_codec = Codec(final_codec)
+        self.canvas_folder = canvas_folder
+        if in_memory and self.backend.reads_done_files:
+            raise ValueError(
+                f"{type(self.backend).__name__} reads _done files, "
+                f"it can't be used in memory"
+            )
+        if self.codec == Codec.NPY and self.backend.reads_done_files:
+            raise ValueError(
+                f"{type(self.backend).__name__} reads _done files, "
+                f"they can't be {self.codec}"
+            )
+        self.manifest: Optional[JobManifest] = None
+        self.manifest_path = manifest_path(impath)
+        # called with a message at every step, may be called from threads
+        self.progress: Callable[[str], None] = print
+        self.parts: Dict[Directions, List[PanoramaPart]] = {}
+        # generated parts combined so far, for every direction
+        self.strips: Dict[Directions, StripCompositor] = {}
+        # generated images of the job in memory, until they're combined
+        self.done_images: Dict[Tuple[Directions, int], np.ndarray] = {}
+        self.current_part: Optional[int] = None
+        self.current_direction: Optional[Directions] = None
+        self.result_path: Optional[str] = None
+
+    @property
+    def current(self) -> Optional[PanoramaPart]:
+        """
+        :return: part that's currently being generated
+        """
+        if self.current_part is None or self.result_path is not None:
+            return None
+        return self.parts[self.current_direction][self.current_part]
+
+    @property
+    def finished(self) -> bool:
+        return self.result_path is not None
+
+    def prepare(self) -> Dict[Directions, List[PanoramaPart]]:
+        self.parts = prepare_full_panorama(
+            self.impath, self.directions, self.geometry, self.codec
+        )
+        self.manifest = self.load_manifest()
+        self.close_strips()
+        self.done_images = {}
+        self.current_part = None
+        self.current_direction = None
+        self.result_path = None
+        return self.parts
+
+    def manifest_params(self) -> dict:
+        """
+        :return: parameters the generated parts depend on
+        """
+        params = {
+            "directions": [direction.name for direction in self.directions],
+            "geometry": asdict(self.geometry),
+            "prompt": self.prompt,
+            "backend": self.backend.params(),
+            "blend": str(self.blend),
+        }
+        # same as after saving and loading
+        return json.loads(json.dumps(params, default=str))
+
+    def load_manifest(self) -> JobManifest:
+        """
+        :return: manifest saved by the same job before,
+            a new one if there's none or it's for other parameters
+        """
+        parts = {
+            direction.name: [
+                PartRecord(
+                    name=os.path.basename(part.path),
+                    window=list(part.window) if part.window else None,
+                )
+                for part in parts
+            ]
+            for direction, parts in self.parts.items()
+        }
+        source_checksum = file_checksum(self.impath)
+        params = self.manifest_params()
+        if self.resume and not self.in_memory:
+            manifest = JobManifest.load(self.manifest_path)
+            if (
+                manifest is not None
+                and manifest.source_checksum == source_checksum
+                and manifest.params == params
+                and {
+                    direction: [(x.name, x.window) for x in records]
+                    for direction, records in manifest.parts.items()
+                }
+                == {
+                    direction: [(x.name, x.window) for x in records]
+                    for direction, records in parts.items()
+                }
+            ):
+                return manifest
+        manifest = JobManifest(source_checksum, params, parts)
+        if not self.in_memory:
+            manifest.save(self.manifest_path)
+        return manifest
+
+    def save_manifest(self):
+        """
+        Saves the manifest, a job in memory keeps it in memory only
+        """
+        if not self.in_memory:
+            self.manifest.save(self.manifest_path)
+
+    def record_part(
+        self,
+        part: PanoramaPart,
+        status: PartStatus,
+        checksum: Optional[str] = None,
+    ):
+        self.manifest.update_part(
+            part.direction.name, part.part_number, status, checksum
+        )
+        self.save_manifest()
+
+    def is_part_done(self, direction: Directions, part_number: int) -> bool:
+        """
+        :return: True if the _done file of the part is saved and it's
+            the same file the job has used before, if any
+        """
+        record = self.manifest.parts[direction.name][part_number]
+        if self.in_memory:
+            return record.status == PartStatus.DONE or (
+                (direction, part_number) in self.done_images
+            )
+        if record.status == PartStatus.PENDING:
+            return False
+        part = self.parts[direction][part_number]
+        checksum = file_checksum(done_path(part.path))
+        if checksum is None:
+            return False
+        return record.checksum is None or record.checksum == checksum
+
+    def is_direction_combined(self, direction: Directions) -> bool:
+        """
+        :return: True if the direction is combined already
+            and its _done image is not changed since
+        """
+        if self.in_memory:
+            strip = self.strips.get(direction)
+            return strip is not None and strip.complete
+        checksum = self.manifest.combined.get(direction.name)
+        return checksum is not None and checksum == file_checksum(
+            self.direction_path(direction)
+        )
+
+    def first_not_done(self, direction: Directions) -> int:
+        """
+        :return: number of the first part of the direction that's not
+            generated, number of parts if all of them are
+        """
+        for i in range(len(self.parts[direction])):
+            if not self.is_part_done(direction, i):
+                return i
+        return len(self.parts[direction])
+
+    def start(self) -> Optional[PanoramaPart]:
+        """
+        Writes the first part that's not generated yet to disk
+        :return: first part to generate, None if the panorama is done
+        """
+        if not self.parts:
+            self.prepare()
+        for direction in self.parts:
+            if not self.is_direction_combined(direction):
+                return self.resume_direction(direction)
+        self.result_path = self.combine_all()
+        return None
+
+    def resume_direction(self, direction: Directions) -> PanoramaPart:
+        """
+        Makes the first part of the direction that's not generated yet
+        the current one and writes it to disk
+        :return: current part
+        """
+        parts = self.parts[direction]
+        part_number = min(self.first_not_done(direction), len(parts) - 1)
+        if part_number > 0:
+            parts[part_number] = combine_parts(
+                self.get_done(parts[part_number - 1]),
+                parts[part_number],
+                self.geometry,
+            )
+        self.current_direction = direction
+        self.current_part = part_number
+        if not self.is_part_done(direction, part_number):
+            self.write_part(self.current)
+        return self.current
+
+    def part_key(self, part: PanoramaPart) -> str:
+        """
+        :return: cache key of the generated part
+        """
+        return make_key(part.img, self.prompt, self.backend.params())
+
+    def write_part(self, part: PanoramaPart) -> bool:
+        """
+        Writes the part to disk to be generated, unless the job is in memory
+        If it was generated before, the cached result is saved as well
+        :return: True if the part is generated already
+        """
+        if not self.in_memory:
+            # _done image left by another job is not generated from this part
+            if os.path.exists(done_path(part.path)):
+                os.remove(done_path(part.path))
+            self.progress(f"writing {part.path}")
+            # RGBA is materialised once for writing, the key and the backend
+            img = part.img
+            with span("write", path=part.path):
+                write_image(part.path, img, self.codec)
+            if self.write_previews:
+                write_preview_pyramid(part.path, img)
+        self.record_part(part, PartStatus.WRITTEN)
+        if self.cache is None:
+            return False
+        im = self.cache.get(self.part_key(part))
+        if im is None:
+            return False
+        self.put_done(part, im)
+        return True
+
+    def put_done(self, part: PanoramaPart, im: np.ndarray):
+        """
+        Saves the generated image of the part as its _done image,
+        a job in memory keeps it in memory
+        """
+        if self.in_memory:
+            self.done_images[(part.direction, part.part_number)] = im
+            return
+        path = done_path(part.path)
+        with span("write", path=path):
+            write_image(path, im, self.codec)
+        IMAGE_STORE.put(path, im)
+
+    def get_done(self, part: PanoramaPart) -> PanoramaPart:
+        """
+        Reads generated part, its logo is cut off
+        :raise ValueError: if the part is not generated yet
+        """
+        path = done_path(part.path)
+        if self.in_memory:
+            im = self.done_images.get((part.direction, part.part_number))
+            if im is None:
+                raise ValueError(f"{path} is not generated yet")
+            self.record_part(part, PartStatus.DONE)
+        else:
+            if not os.path.exists(path):
+                raise ValueError(f"{path} does not exist")
+            # decoded once, next_part and composite_part both read it
+            im = read_rgba(path)
+            self.record_part(part, PartStatus.DONE, file_checksum(path))
+        if self.cache is not None:
+            key = self.part_key(part)
+            if key not in self.cache:
+                self.cache.put(key, im)
+        return PanoramaPart(
+            path=path,
+            direction=part.direction,
+            img=cut_logo(im.copy(), self.geometry),
+            part_number=part.part_number,
+        )
+
+    def strip(self, direction: Directions) -> StripCompositor:
+        """
+        :return: strip the generated parts of the direction are pasted into,
+            allocated on first use
+        """
+        strip = self.strips.get(direction)
+        if strip is None:
+            source = read_source(self.impath)
+            shape = shift_view(source, direction, self.geometry).shape
+            strip = StripCompositor(
+                shape,
+                direction,
+                self.geometry.tile_windows(shape, direction),
+                geometry=self.geometry,
+                blend=self.blend,
+                dtype=source.dtype,
+            )
+            self.strips[direction] = strip
+        return strip
+
+    def composite_part(self, done_part: PanoramaPart):
+        """
+        Pastes the generated part into the strip of its direction,
+        parts before it that are not pasted yet are read and pasted first,
+        e.g. the ones generated before the job was resumed
+        :param done_part: generated part returned by get_done
+        """
+        strip = self.strip(done_part.direction)
+        parts = self.parts[done_part.direction]
+        with span("combine", path=done_part.path):
+            for part in parts[: done_part.part_number]:
+                if part.part_number not in strip.added:
+                    strip.add(part.part_number, self.get_done(part).img)
+            strip.add(done_part.part_number, done_part.img)
+        # merged pixels of the part are read from the strip, not kept in it
+        parts[done_part.part_number].img = None
+        # part before it is merged into this one already
+        self.done_images.pop(
+            (done_part.direction, done_part.part_number - 1), None
+        )
+
+    def close_strips(self):
+        for strip in self.strips.values():
+            strip.close()
+        self.strips = {}
+
+    def combine_direction(self, direction: Directions) -> np.ndarray:
+        """
+        Saves the strip of the direction as {impath}_{direction}_done.png
+        Parts are pasted into it as they are generated, the ones that are
+        not pasted yet are read from disk
+        :param direction: direction to combine
+        :return: combined image
+        """
+        self.progress(f"combining {direction.name} parts")
+        strip = self.strip(direction)
+        last = self.parts[direction][-1]
+        if last.part_number not in strip.added:
+            self.composite_part(self.get_done(last))
+        self.done_images.pop((direction, last.part_number), None)
+        if self.in_memory:
+            return strip.img
+
+        result_path = self.direction_path(direction)
+        self.progress(f"saving {result_path}")
+        with span("write", path=result_path):
+            write_image(result_path, strip.img, self.codec)
+        self.manifest.combined[direction.name] = file_checksum(result_path)
+        self.save_manifest()
+        return strip.img
+
+    def direction_path(self, direction: Directions) -> str:
+        """
+        :return: path to the combined parts of the direction,
+            {impath}_{direction}_done.png
+        """
+        folder = os.path.dirname(self.impath)
+        basename = os.path.basename(self.impath)
+        basename_without_extension = os.path.splitext(basename)[0]
+        return os.path.join(
+            folder,
+            basename_without_extension
+            + f"_{direction}_done{self.codec.extension}",
+        )
+
+    def canvas_path(self) -> Optional[str]:
+        """
+        :return: path to the np.memmap of the combined image,
+            {canvas_folder}/{image}_canvas.raw, None if it's kept in RAM
+        """
+        if self.canvas_folder is None:
+            return None
+        basename = os.path.basename(self.impath)
+        basename_without_extension = os.path.splitext(basename)[0]
+        return os.path.join(
+            self.canvas_folder, basename_without_extension + "_canvas.raw"
+        )
+
+    def combine_all(self) -> str:
+        """
+        Combines the image with all the directions,
+        unless it's combined already and not changed since
+        :return: path to the combined image
+        """
+        folder = os.path.dirname(self.impath)
+        basename = os.path.basename(self.impath)
+        basename_without_extension = os.path.splitext(basename)[0]
+        result_path = os.path.join(
+            folder,
+            basename_without_extension + f"_full{self.final_codec.extension}",
+        )
+        checksum = self.manifest.result
+        if checksum is not None and checksum == file_checksum(result_path):
+            self.close_strips()
+            return result_path
+        self.progress("combining images")
+        images = {}
+        for direction in self.parts:
+            strip = self.strips.get(direction)
+            # strips combined by this job are not read again
+            if strip is not None and strip.complete:
+                images[direction] = strip.img
+            else:
+                images[direction] = read_rgba(self.direction_path(direction))
+        result_path = combine_images(
+            impath=self.impath,
+            directions=list(self.parts.keys()),
+            geometry=self.geometry,
+            backing_path=self.canvas_path(),
+            codec=self.final_codec,
+            blend=self.blend,
+            write_preview=self.write_previews,
+            images=images,
+        )
+        self.close_strips()
+        self.manifest.result = file_checksum(result_path)
+        self.save_manifest()
+        return result_path
+
+    def next_part(self) -> Optional[PanoramaPart]:
+        """
+        Merges generated current part into the next one and writes the next
+        part to disk. After the last part of the last direction
+        all the images are combined
+        :raise ValueError: if the current part is not generated yet
+        :return: next part to generate, None if the panorama is done
+        """
+        if self.current_part is None:
+            return self.start()
+        if self.finished:
+            return None
+        with span("next_part", path=self.current.path):
+            return self._next_part()
+
+    def _next_part(self) -> Optional[PanoramaPart]:
+        # merge parts together
+        parts = self.parts[self.current_direction]
+        done_part = self.get_done(self.current)
+        self.composite_part(done_part)
+        if self.current_part + 1 < len(parts):
+            parts[self.current_part + 1] = combine_parts(
+                done_part, parts[self.current_part + 1], self.geometry
+            )
+        self.current_part += 1
+        max_part = len(parts) - 1
+        if self.current_part > max_part:
+            # merge image on direction
+            self.combine_direction(self.current_direction)
+
+            # get next direction, skip the ones combined before
+            current_dir_id = list(self.parts.keys()).index(
+                self.current_direction
+            )
+            for direction in list(self.parts.keys())[current_dir_id + 1 :]:
+                if not self.is_direction_combined(direction):
+                    return self.resume_direction(direction)
+            self.result_path = self.combine_all()
+            return None
+        # write next part on disk
+        self.write_part(self.current)
+        return self.current
+
+    def generate_part(self, direction: Directions, part_number: int):
+        """
+        Merges previous generated part into the part, writes the part to
+        disk and gets it generated by the backend
+        Previous part of the direction must be generated already
+        """
+        parts = self.parts[direction]
+        if part_number > 0:
+            parts[part_number] = combine_parts(
+                self.get_done(parts[part_number - 1]),
+                parts[part_number],
+                self.geometry,
+            )
+        self.inpaint(parts[part_number])
+        self.composite_part(self.get_done(parts[part_number]))
+
+    def inpaint(self, part: PanoramaPart):
+        """
+        Writes the part to disk and gets it generated by the backend,
+        unless it's in the cache
+        """
+        if self.write_part(part):
+            return
+        path = done_path(part.path)
+        # waiting for the generator, e.g. the user saving the _done file
+        with span("wait", path=path, **self.backend.params()):
+            im = self.backend.inpaint(part, path)
+        if not self.backend.reads_done_files:
+            self.put_done(part, im)
+        if self.cache is not None:
+            self.cache.put(self.part_key(part), im)
+
+    def run(self, max_workers: int = 1) -> str:
+        """
+        Generates all the parts with the backend and combines them
+        Every part is generated as soon as the part before it is done,
+        up to max_workers parts are generated at the same time
+        :param max_workers: number of parts generated at the same time
+        :return: path to the combined image
+        """
+        if not self.parts:
+            with span("prepare", path=self.impath):
+                self.prepare()
+        tasks = {}
+        dependencies = part_dependencies(self.parts)
+        for direction, parts in self.parts.items():
+            combined = self.is_direction_combined(direction)
+            # parts generated before are not generated again
+            first = len(parts) if combined else self.first_not_done(direction)
+            for i in range(len(parts)):
+                tasks[(direction, i)] = (
+                    partial(self.generate_part, direction, i)
+                    if i >= first
+                    else _skip
+                )
+            # direction is combined after its last part
+            tasks[direction] = (
+                _skip
+                if combined
+                else partial(self.combine_direction, direction)
+            )
+            dependencies[direction] = [(direction, len(parts) - 1)]
+        tasks["full"] = self.combine_all
+        dependencies["full"] = list(self.parts.keys())
+        # a failed part stops the backend, so the parts waiting for it
+        # return instead of keeping the error from being raised
+        self.result_path = run_dag(
+            tasks, dependencies, max_workers, on_error=self.backend.close
+        )["full"]
+        return self.result_path
@@ -0,0 +1,275 @@
+"""
+Streaming PNG writer
+
+Image is encoded strip by strip as rows are produced, so only one strip
+of raw and filtered rows is kept in memory at a time instead of the whole
+image plus a full-size encode buffer like cv2.imwrite needs.
+Strips can be encoded in a background thread, zlib releases the GIL
+while compressing, so encoding overlaps producing the next strip.
+Rows go to a temporary file next to the image, which replaces the image
+only once it's complete, so a failed write never leaves a truncated PNG.
+"""
+import os
+import queue
+import struct
+import threading
+import zlib
+from enum import IntEnum
+from typing import Optional
+
+import numpy as np
+
+from image_preparation.tracing import span
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG colour types by the number of channels
+COLOR_TYPES = {1: 0, 3: 2, 4: 6}
+
+
+class PngFilter(IntEnum):
+    # PNG row filter types, applied to every row of the image
+    NONE = 0
+    SUB = 1
+    UP = 2
+    AVERAGE = 3
+    PAETH = 4
+
+
+def filter_rows(
+    rows: np.ndarray, prev_row: np.ndarray, filter_type: PngFilter, bpp: int
+) -> np.ndarray:
+    """
+    Applies PNG filter to the rows, all rows at once
+    :param rows: 2d uint8 array of raw rows (num_rows, width * bpp)
+    :param prev_row: raw row above the first row, zeros for the first strip
+    :param filter_type: PNG filter type
+    :param bpp: bytes per pixel
+    :return: filtered rows, each prefixed with the filter type byte
+    """
+    # uint8 arithmetic wraps around modulo 256 as PNG filters expect
+    if filter_type == PngFilter.NONE:
+        filtered = rows
+    else:
+        left = np.zeros_like(rows)
+        left[:, bpp:] = rows[:, :-bpp]
+        up = np.concatenate((prev_row[None], rows[:-1]), axis=0)
+        if filter_type == PngFilter.SUB:
+            filtered = rows - left
+        elif filter_type == PngFilter.UP:
+            filtered = rows - up
+        elif filter_type == PngFilter.AVERAGE:
+            average = (left.astype(np.uint16) + up) >> 1
+            filtered = rows - average.astype(np.uint8)
+        else:
+            up_left = np.zeros_like(rows)
+            up_left[:, bpp:] = up[:, :-bpp]
+            a = left.astype(np.int16)
+            b = up.astype(np.int16)
+            c = up_left.astype(np.int16)
+            pa = np.abs(b - c)
+            pb = np.abs(a - c)
+            pc = np.abs(a + b - 2 * c)
+            predictor = np.where(
+                (pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, up_left)
+            )
+            filtered = rows - predictor
+    filter_bytes = np.full((rows.shape[0], 1), filter_type, dtype=np.uint8)
+    return np.concatenate((filter_bytes, filtered), axis=1)
+
+
+class PngWriter:
+    def __init__(
+        self,
+        path: str,
+        width: int,
+        height: int,
+        channels: int = 4,
+        compression: int = 1,
+        filter_type: PngFilter = PngFilter.SUB,
+        strategy: int = zlib.Z_DEFAULT_STRATEGY,
+        bgr: bool = True,
+        background: bool = False,
+    ):
+        """
+        :param path: path to the PNG file, written only when it's complete
+        :param width: width of the image
+        :param height: height of the image
+        :param channels: 1, 3 or 4 channels, 8 bits each, 16 bits are not
+            supported
+        :param compression: zlib compression level 0-9
+        :param filter_type: PNG filter applied to the rows
+        :param strategy: zlib strategy, e.g. zlib.Z_RLE or zlib.Z_FILTERED
+        :param bgr: if True, strips are in OpenCV BGR(A) channel order
+        :param background: if True, strips are encoded in a separate thread
+        """
+        if channels not in COLOR_TYPES:
+            raise ValueError(f"{channels} channels are not supported")
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.filter_type = PngFilter(filter_type)
+        self.bgr = bgr
+        self.rows_written = 0
+        self._prev_row = np.zeros(width * channels, dtype=np.uint8)
+        self._compressor = zlib.compressobj(
+            compression, zlib.DEFLATED, zlib.MAX_WBITS, 9, strategy
+        )
+        self.path = path
+        # pid as well, main threads of the pool workers have the same ident
+        self._tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(PNG_SIGNATURE)
+        self._write_chunk(
+            b"IHDR",
+            struct.pack(
+                ">IIBBBBB", width, height, 8, COLOR_TYPES[channels], 0, 0, 0
+            ),
+        )
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        if background:
+            # two strips in flight are enough to overlap with the producer
+            self._queue = queue.Queue(maxsize=2)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(
+            struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)))
+        )
+
+    def _encode(self, strip: np.ndarray):
+        if self.bgr and self.channels >= 3:
+            strip = strip[..., [2, 1, 0, 3][: self.channels]]
+        rows = np.ascontiguousarray(strip, dtype=np.uint8).reshape(
+            strip.shape[0], -1
+        )
+        filtered = filter_rows(
+            rows, self._prev_row, self.filter_type, self.channels
+        )
+        self._prev_row = rows[-1].copy()
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._write_chunk(b"IDAT", data)
+
+    def _run(self):
+        while True:
+            strip = self._queue.get()
+            if strip is None:
+                return
+            if self._error is None:
+                try:
+                    self._encode(strip)
+                except BaseException as e:
+                    self._error = e
+
+    def write_strip(self, strip: np.ndarray):
+        """
+        Encodes next rows of the image
+        :param strip: uint8 array of shape (num_rows, width) or
+            (num_rows, width, channels)
+        :raise ValueError: if the strip doesn't fit the image or is not
+            uint8, PNGs are written with 8 bits per channel
+        """
+        if strip.shape[1] != self.width:
+            raise ValueError(
+                f"strip width {strip.shape[1]} != image width {self.width}"
+            )
+        if strip.dtype != np.uint8:
+            raise ValueError(f"{strip.dtype} strips are not supported")
+        if self.rows_written + strip.shape[0] > self.height:
+            raise ValueError("more rows written than image height")
+        self.rows_written += strip.shape[0]
+        if self._queue is None:
+            self._encode(strip)
+        else:
+            if self._error is not None:
+                raise self._error
+            # copy, so the producer is free to reuse its buffer
+            self._queue.put(np.array(strip, dtype=np.uint8))
+
+    def _join(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _abort(self):
+        self._join()
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def close(self):
+        """
+        Finishes the image, all rows must be written by now
+        """
+        self._join()
+        try:
+            if self._error is not None:
+                raise self._error
+            if self.rows_written != self.height:
+                raise ValueError(
+                    f"{self.rows_written} rows written, "
+                    f"image height is {self.height}"
+                )
+            self._write_chunk(b"IDAT", self._compressor.flush())
+            self._write_chunk(b"IEND", b"")
+        except BaseException:
+            self._file.close()
+            os.remove(self._tmp_path)
+            raise
+        self._file.close()
+        # readers never see a half-written image
+        os.replace(self._tmp_path, self.path)
+
+
+def write_png(
+    path: str,
+    im: np.ndarray,
+    strip_rows: int = 64,
+    compression: int = 1,
+    filter_type: PngFilter = PngFilter.SUB,
+    strategy: int = zlib.Z_DEFAULT_STRATEGY,
+    background: bool = True,
+):
+    """
+    Writes the image to PNG strip by strip
+    Image may be a view or np.memmap, only one strip of it is read at a time
+    :param path: path to the PNG file
+    :param im: image in OpenCV BGR(A) channel order
+    :param strip_rows: number of rows encoded at once
+    :param compression: zlib compression level 0-9
+    :param filter_type: PNG filter applied to the rows
+    :param strategy: zlib strategy
+    :param background: if True, encoding overlaps reading the next strip
+    :raise ValueError: if the image is not uint8
+    """
+    if im.dtype != np.uint8:
+        # nothing is written, e.g. uint16 would be cut to its low byte
+        raise ValueError(f"{im.dtype} images are not supported")
+    with span("encode", path=path), PngWriter(
+        path,
+        width=im.shape[1],
+        height=im.shape[0],
+        channels=im.shape[2] if im.ndim > 2 else 1,
+        compression=compression,
+        filter_type=filter_type,
+        strategy=strategy,
+        background=background,
+    ) as writer:
+        for row in range(0, im.shape[0], strip_rows):
+            writer.write_strip(im[row : row + strip_rows])
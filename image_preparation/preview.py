@@ -0,0 +1,318 @@
+"""
+Multi-resolution previews of the images
+
+When an image is written or shown, its pyramid is written to the preview
+cache in the user's cache folder, never next to the image: every level
+is half the size of the previous one and is cut into tiles. Showing the
+image then reads only the tiles of the level that fits the screen instead
+of decoding and resizing the whole image, and panning or zooming reads
+only the visible tiles.
+The preview cache is kept under PREVIEW_CACHE_MAX_BYTES, pyramids that
+were not opened for the longest time are removed first. Removing the
+folder of the preview cache is always safe, pyramids are written again
+when they're needed.
+"""
+import json
+import os
+import shutil
+import threading
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from image_preparation.image_io import Codec, read_image, write_image
+from image_preparation.lru_cache import LRUCache
+from image_preparation.result_cache import DEFAULT_CACHE_FOLDER, make_key
+
+# pyramids of all the images, by the hash of the path of the image
+PREVIEW_CACHE_FOLDER = os.path.join(DEFAULT_CACHE_FOLDER, "previews")
+# total size of the pyramids kept in the preview cache
+PREVIEW_CACHE_MAX_BYTES = 1024**3
+META_FILE = "meta.json"
+
+# decoded tiles, panning over the same area doesn't read them again
+TILES_CACHE = LRUCache(max_bytes=64 * 1024 * 1024)
+
+
+def preview_folder(path: str) -> str:
+    """
+    :return: folder with the pyramid of the image in the preview cache,
+        meta of the pyramid tells which version of the image it's of
+    """
+    path = os.path.abspath(path)
+    return os.path.join(
+        PREVIEW_CACHE_FOLDER,
+        f"{make_key(path)[:32]}_{os.path.basename(path)}",
+    )
+
+
+def level_shape(height: int, width: int, level: int) -> Tuple[int, int]:
+    """
+    :return: height and width of the level of the pyramid
+    """
+    for _ in range(level):
+        height, width = (height + 1) // 2, (width + 1) // 2
+    return height, width
+
+
+def write_preview_pyramid(path: str, im: np.ndarray, tile_size: int = 512):
+    """
+    Writes the pyramid of the image, the image must be written already
+    :param path: path to the image
+    :param im: pixels of the image, may be a view or np.memmap
+    :param tile_size: size of the square tiles of every level
+    """
+    folder = preview_folder(path)
+    # built next to the pyramid and swapped in, readers of the old one
+    # never see a half-written pyramid
+    tmp_folder = f"{folder}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    try:
+        levels = _write_levels(tmp_folder, im, tile_size)
+        stat = os.stat(path)
+        meta = {
+            "height": im.shape[0],
+            "width": im.shape[1],
+            "levels": levels,
+            "tile_size": tile_size,
+            # pyramid is valid only for this version of the image
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+        with open(os.path.join(tmp_folder, META_FILE), "w") as f:
+            json.dump(meta, f)
+        _replace_folder(tmp_folder, folder)
+    finally:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+    evict_previews(keep=folder)
+
+
+def evict_previews(
+    max_bytes: Optional[int] = None, keep: Optional[str] = None
+):
+    """
+    Removes the pyramids opened least recently, until the preview cache
+    is not larger than max_bytes
+    :param max_bytes: PREVIEW_CACHE_MAX_BYTES if None
+    :param keep: folder of the pyramid that is never removed,
+        e.g. the one just written
+    """
+    if max_bytes is None:
+        max_bytes = PREVIEW_CACHE_MAX_BYTES
+    try:
+        names = os.listdir(PREVIEW_CACHE_FOLDER)
+    except FileNotFoundError:
+        return
+    entries = []
+    for name in names:
+        # pyramids being written or replaced are not complete
+        if name.endswith((".tmp", ".old")):
+            continue
+        folder = os.path.join(PREVIEW_CACHE_FOLDER, name)
+        try:
+            # meta is touched every time the pyramid is opened
+            mtime = os.stat(os.path.join(folder, META_FILE)).st_mtime
+            size = sum(entry.stat().st_size for entry in os.scandir(folder))
+        except OSError:
+            continue
+        entries.append((mtime, size, folder))
+    entries.sort()
+    nbytes = sum(size for _, size, _ in entries)
+    for _, size, folder in entries:
+        if nbytes <= max_bytes:
+            break
+        if folder == keep:
+            continue
+        shutil.rmtree(folder, ignore_errors=True)
+        nbytes -= size
+
+
+def _write_levels(folder: str, im: np.ndarray, tile_size: int) -> int:
+    """
+    Writes tiles of every level, down to the one that fits in one tile
+    :return: number of levels
+    """
+    level = 0
+    current = im
+    while True:
+        height, width = current.shape[:2]
+        for top in range(0, height, tile_size):
+            for left in range(0, width, tile_size):
+                write_image(
+                    os.path.join(
+                        folder,
+                        f"{level}_{top // tile_size}_{left // tile_size}.png",
+                    ),
+                    current[top : top + tile_size, left : left + tile_size],
+                    # previews are read back soon, fast compression is enough
+                    Codec.FAST,
+                )
+        if height <= tile_size and width <= tile_size:
+            break
+        height, width = level_shape(height, width, 1)
+        current = cv2.resize(
+            current, (width, height), interpolation=cv2.INTER_AREA
+        )
+        level += 1
+    return level + 1
+
+
+def _replace_folder(tmp_folder: str, folder: str):
+    """
+    Moves tmp_folder to folder, the old folder is removed
+    """
+    old_folder = f"{folder}.{os.getpid()}.{threading.get_ident()}.old"
+    try:
+        os.replace(folder, old_folder)
+    except FileNotFoundError:
+        old_folder = None
+    try:
+        os.replace(tmp_folder, folder)
+    except OSError:
+        # another pyramid of the image was moved in at the same time
+        pass
+    if old_folder is not None:
+        shutil.rmtree(old_folder, ignore_errors=True)
+
+
+class PreviewPyramid:
+    def __init__(self, path: str, meta: dict):
+        """
+        Use PreviewPyramid.open
+        """
+        self.path = path
+        self.folder = preview_folder(path)
+        self.height = meta["height"]
+        self.width = meta["width"]
+        self.levels = meta["levels"]
+        self.tile_size = meta["tile_size"]
+        self.version = meta["mtime_ns"]
+
+    @classmethod
+    def open(cls, path: str) -> Optional["PreviewPyramid"]:
+        """
+        :return: pyramid of the image, None if it's missing or outdated
+        """
+        try:
+            meta_path = os.path.join(preview_folder(path), META_FILE)
+            with open(meta_path) as f:
+                meta = json.load(f)
+            stat = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        if (
+            meta["mtime_ns"] != stat.st_mtime_ns
+            or meta["size"] != stat.st_size
+        ):
+            return None
+        try:
+            # pyramids opened least recently are evicted first
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return cls(path, meta)
+
+    def level_shape(self, level: int) -> Tuple[int, int]:
+        return level_shape(self.height, self.width, level)
+
+    def fit_level(self, max_width: int, max_height: int) -> int:
+        """
+        :return: smallest level that is still at least as large as
+            the image resized to fit max_width by max_height
+        """
+        scale = min(max_width / self.width, max_height / self.height, 1)
+        for level in range(self.levels - 1, -1, -1):
+            height, width = self.level_shape(level)
+            if width >= self.width * scale and height >= self.height * scale:
+                return level
+        return 0
+
+    def _tile(self, level: int, row: int, col: int) -> Optional[np.ndarray]:
+        """
+        :return: pixels of the tile, None if it can't be read,
+            e.g. the pyramid was removed or written again
+        """
+        tile_path = os.path.join(self.folder, f"{level}_{row}_{col}.png")
+        return TILES_CACHE.get_or_compute(
+            (tile_path, self.version),
+            lambda: read_image(tile_path),
+        )
+
+    def region(
+        self, level: int, top: int, left: int, height: int, width: int
+    ) -> np.ndarray:
+        """
+        Reads only the tiles the region covers
+        :return: pixels of the region of the level, clipped to the level,
+            None if a tile can't be read, the pyramid is not valid anymore
+        """
+        level_height, level_width = self.level_shape(level)
+        top, left = max(top, 0), max(left, 0)
+        bottom = min(top + height, level_height)
+        right = min(left + width, level_width)
+        ret = None
+        size = self.tile_size
+        for row in range(top // size, (bottom - 1) // size + 1):
+            for col in range(left // size, (right - 1) // size + 1):
+                tile = self._tile(level, row, col)
+                if tile is None:
+                    return None
+                if ret is None:
+                    ret = np.zeros(
+                        (bottom - top, right - left) + tile.shape[2:],
+                        dtype=tile.dtype,
+                    )
+                tile_top, tile_left = row * size, col * size
+                y0, x0 = max(top, tile_top), max(left, tile_left)
+                y1 = min(bottom, tile_top + tile.shape[0])
+                x1 = min(right, tile_left + tile.shape[1])
+                ret[y0 - top : y1 - top, x0 - left : x1 - left] = tile[
+                    y0 - tile_top : y1 - tile_top,
+                    x0 - tile_left : x1 - tile_left,
+                ]
+        return ret
+
+
+def open_preview_pyramid(path: str) -> Optional[PreviewPyramid]:
+    """
+    Opens the pyramid of the image, it's written first if it's outdated
+    :return: pyramid, None if it can't be written to the preview cache
+    """
+    pyramid = PreviewPyramid.open(path)
+    if pyramid is None:
+        im = read_image(path)
+        if im is None:
+            raise ValueError(f"{path} can't be read")
+        try:
+            write_preview_pyramid(path, im)
+        except OSError:
+            return None
+        pyramid = PreviewPyramid.open(path)
+    return pyramid
+
+
+def load_fit(path: str, max_width: int, max_height: int) -> np.ndarray:
+    """
+    Reads the image resized to fit max_width by max_height
+    Only one level of the pyramid is read, never the whole image,
+    the image is decoded only if the pyramid can't be read
+    :raise ValueError: if the image can't be read
+    """
+    pyramid = open_preview_pyramid(path)
+    im = None
+    if pyramid is not None:
+        height, width = pyramid.height, pyramid.width
+        level = pyramid.fit_level(max_width, max_height)
+        im = pyramid.region(level, 0, 0, *pyramid.level_shape(level))
+    if im is None:
+        im = read_image(path)
+        if im is None:
+            raise ValueError(f"{path} can't be read")
+        height, width = im.shape[:2]
+    scale = min(max_width / width, max_height / height, 1)
+    size = (max(int(width * scale), 1), max(int(height * scale), 1))
+    if (im.shape[1], im.shape[0]) != size:
+        im = cv2.resize(im, size, interpolation=cv2.INTER_AREA)
+    return im
@@ -0,0 +1,146 @@
+"""
+Persistent cache of generated images
+
+Results are stored on disk by the hash of everything that determines
+them: the masked part sent to the generator, the prompt and the backend
+parameters. Running the same part again is served from the cache.
+Least recently used results are removed when the cache grows over
+max_bytes, every hit refreshes modification time of the file.
+Images are written and decoded by image_io, with the codec of the cache.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Optional, Union
+
+import numpy as np
+
+from image_preparation.image_io import Codec, decode_image, write_image
+
+KeyPart = Union[bytes, str, dict, np.ndarray, None]
+
+DEFAULT_CACHE_FOLDER = os.path.join(
+    os.path.expanduser("~"), ".cache", "dalle2panorama"
+)
+
+
+def make_key(*parts: KeyPart) -> str:
+    """
+    :param parts: anything that determines the result
+    :return: sha256 hex digest of all the parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            data = b"None"
+        elif isinstance(part, np.ndarray):
+            digest.update(f"{part.shape}{part.dtype}".encode())
+            data = np.ascontiguousarray(part).tobytes()
+        elif isinstance(part, dict):
+            data = json.dumps(part, sort_keys=True, default=str).encode()
+        elif isinstance(part, str):
+            data = part.encode()
+        else:
+            data = part
+        # length prefix, so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(
+        self,
+        folder: str,
+        max_bytes: int = 2 * 1024**3,
+        codec: Codec = Codec.FAST,
+    ):
+        """
+        :param folder: folder the results are kept in
+        :param max_bytes: total size of the results kept on disk
+        :param codec: codec the images are stored with
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.codec = Codec(codec)
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.nbytes = sum(
+            os.path.getsize(os.path.join(folder, x))
+            for x in os.listdir(folder)
+            if x.endswith(".bin")
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + ".bin")
+
+    def __contains__(self, key: str):
+        return os.path.exists(self._path(key))
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # least recently used results are evicted first
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put_bytes(self, key: str, data: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        self._replace(tmp_path, path)
+
+    def _replace(self, tmp_path: str, path: str):
+        with self._lock:
+            if os.path.exists(path):
+                self.nbytes -= os.path.getsize(path)
+            # readers never see a half-written result
+            os.replace(tmp_path, path)
+            self.nbytes += os.path.getsize(path)
+            if self.nbytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith(".bin"):
+                stat = os.stat(os.path.join(self.folder, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        self.nbytes = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if self.nbytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                continue
+            self.nbytes -= size
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        :return: cached image or None
+        """
+        data = self.get_bytes(key)
+        if data is None:
+            return None
+        return decode_image(data)
+
+    def put(self, key: str, im: np.ndarray):
+        """
+        Stores the image losslessly with the codec of the cache
+        """
+        path = self._path(key)
+        # extension of the codec, so write_image accepts the path
+        tmp_path = (
+            f"{path}.{os.getpid()}.{threading.get_ident()}"
+            f"{self.codec.extension}"
+        )
+        write_image(tmp_path, im, self.codec)
+        self._replace(tmp_path, path)
@@ -0,0 +1,94 @@
+"""
+Concurrent execution of dependent tasks
+
+Parts of different directions don't depend on each other, and inside
+one direction a part only needs the previous part to be generated
+(its overlap is merged in by combine_parts). Every task is run as soon as
+all its dependencies are done, so the wall-clock time is the critical path
+instead of the sum of all generations.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from image_preparation.data import Directions, PanoramaPart
+
+
+def part_dependencies(
+    parts: Dict[Directions, List[PanoramaPart]]
+) -> Dict[Tuple[Directions, int], List[Tuple[Directions, int]]]:
+    """
+    :param parts: parts of the panorama by direction
+    :return: (direction, part_number) of every part mapped to the parts
+        that must be generated before it
+    """
+    return {
+        (direction, i): [(direction, i - 1)] if i > 0 else []
+        for direction, direction_parts in parts.items()
+        for i in range(len(direction_parts))
+    }
+
+
+def run_dag(
+    tasks: Dict[Hashable, Callable[[], Any]],
+    dependencies: Dict[Hashable, Iterable[Hashable]],
+    max_workers: int = 4,
+    on_error: Optional[Callable[[], None]] = None,
+) -> Dict[Hashable, Any]:
+    """
+    Runs every task once all its dependencies are done
+    Ready tasks are started in the order of tasks
+    When a task fails, tasks that didn't start are cancelled and its error
+    is raised right away, without waiting for the running tasks
+    :param tasks: tasks by key
+    :param dependencies: keys of the tasks each task depends on,
+        tasks without an entry don't depend on anything
+    :param max_workers: number of tasks run at the same time
+    :param on_error: called when a task fails, before its error is raised,
+        e.g. to make the running tasks that wait for something return
+    :raise ValueError: if dependencies are unknown or cyclic
+    :return: results of the tasks by key
+    """
+    remaining = {key: set(dependencies.get(key, ())) for key in tasks}
+    dependents: Dict[Hashable, List[Hashable]] = {key: [] for key in tasks}
+    for key, deps in remaining.items():
+        for dep in deps:
+            if dep not in tasks:
+                raise ValueError(f"{key} depends on unknown task {dep}")
+            dependents[dep].append(key)
+
+    results = {}
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        running = {
+            pool.submit(tasks[key]): key
+            for key, deps in remaining.items()
+            if not deps
+        }
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = running.pop(future)
+                results[key] = future.result()
+                for dependent in dependents[key]:
+                    remaining[dependent].discard(key)
+                    if not remaining[dependent]:
+                        running[pool.submit(tasks[dependent])] = dependent
+    except BaseException:
+        # running tasks can't be cancelled, they are not waited for
+        pool.shutdown(wait=False, cancel_futures=True)
+        if on_error is not None:
+            on_error()
+        raise
+    pool.shutdown()
+    if len(results) != len(tasks):
+        raise ValueError("tasks have cyclic dependencies")
+    return results
@@ -0,0 +1,180 @@
+"""
+Timing spans of the panorama pipeline
+
+Stages of the pipeline (read, cvtColor, shift, tile, write, wait for
+_done, combine, encode) are wrapped in spans:
+
+    with span("read", path=impath):
+        im = cv2.imread(impath)
+
+Tracing is off by default: span() then returns a shared no-op context
+manager and nothing is recorded. When it's on, every span is recorded
+with its thread and parent span and can be exported as JSON or as
+Chrome trace format (chrome://tracing, https://ui.perfetto.dev).
+Set DALLE2PANORAMA_TRACE=path.json to trace the whole run and export
+it on exit, path ending with .trace.json is exported as Chrome trace.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+TRACE_ENV = "DALLE2PANORAMA_TRACE"
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter_ns()
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=1_000_000)
+        self.local = threading.local()
+
+
+_TRACER = _Tracer()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start", "parent")
+
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        stack = getattr(_TRACER.local, "stack", None)
+        if stack is None:
+            stack = _TRACER.local.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        _TRACER.local.stack.pop()
+        _TRACER.events.append(
+            {
+                "name": self.name,
+                "start": (self.start - _TRACER.origin) / 1e9,
+                "duration": (end - self.start) / 1e9,
+                "thread": threading.current_thread().name,
+                "thread_id": threading.get_ident(),
+                "parent": self.parent,
+                "args": self.args,
+            }
+        )
+        return False
+
+
+def span(name: str, **args):
+    """
+    :param name: stage of the pipeline
+    :param args: details of the span, e.g. path of the image
+    :return: context manager timing the stage, no-op if tracing is off
+    """
+    if not _TRACER.enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def enable():
+    _TRACER.enabled = True
+
+
+def disable():
+    _TRACER.enabled = False
+
+
+def is_enabled() -> bool:
+    return _TRACER.enabled
+
+
+def clear():
+    _TRACER.events.clear()
+
+
+def events() -> List[Dict[str, Any]]:
+    """
+    :return: recorded spans, start and duration are in seconds
+    """
+    return list(_TRACER.events)
+
+
+def summary() -> Dict[str, Dict[str, float]]:
+    """
+    :return: count and total seconds of every stage
+    """
+    ret: Dict[str, Dict[str, float]] = {}
+    for event in events():
+        stage = ret.setdefault(event["name"], {"count": 0, "total": 0.0})
+        stage["count"] += 1
+        stage["total"] += event["duration"]
+    return ret
+
+
+def chrome_trace() -> Dict[str, Any]:
+    """
+    :return: recorded spans in Chrome trace event format
+    """
+    pid = os.getpid()
+    return {
+        "traceEvents": [
+            {
+                "name": event["name"],
+                "cat": "panorama",
+                "ph": "X",
+                # microseconds
+                "ts": event["start"] * 1e6,
+                "dur": event["duration"] * 1e6,
+                "pid": pid,
+                "tid": event["thread_id"],
+                "args": {k: str(v) for k, v in event["args"].items()},
+            }
+            for event in events()
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+
+def export(path: str, chrome: Optional[bool] = None):
+    """
+    Writes recorded spans to the file
+    :param path: path to the file
+    :param chrome: if True, Chrome trace format is written, else JSON.
+        If None, Chrome trace format is used for paths ending with
+        .trace.json
+    """
+    if chrome is None:
+        chrome = path.endswith(".trace.json")
+    if chrome:
+        data = chrome_trace()
+    else:
+        data = {"spans": events(), "summary": summary()}
+    with open(path, "w") as f:
+        json.dump(data, f, default=str)
+
+
+def _trace_from_env():
+    path = os.environ.get(TRACE_ENV)
+    if path:
+        enable()
+        atexit.register(export, path)
+
+
+_trace_from_env()
@@ -0,0 +1,281 @@
+"""
+Watching the working folder for generated parts
+
+A part is generated when its {part}_done.png is saved next to it. The
+watcher notices _done files as soon as they are written: with inotify on
+Linux a file is picked up when its writer closes it or moves it into the
+folder, elsewhere the folder is polled and a file is picked up once its
+size and modification time stop changing. Either way the file is only
+reported after it's decoded successfully, so a half-written file is never
+reported. Decoded pixels stay in the image store for the job.
+Files saved before the watcher started are only recorded by their size
+and modification time, they're decoded when they're read, unless they
+were modified less than settle_time ago and may still be written.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional, Set
+
+from image_preparation.image_store import Version, file_version, read_rgba
+
+DONE_SUFFIX = "_done.png"
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+def _load_inotify():
+    """
+    :return: libc with inotify functions, None if it's not available
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class DoneWatcher:
+    def __init__(
+        self,
+        folder: str,
+        on_done: Optional[Callable[[str], None]] = None,
+        poll_interval: float = 0.5,
+        settle_time: float = 0.2,
+        use_inotify: bool = True,
+    ):
+        """
+        :param folder: folder the _done files are saved to
+        :param on_done: called with the path of every complete _done file,
+            from the watcher thread
+        :param poll_interval: seconds between scans of the folder
+            when inotify is not available
+        :param settle_time: seconds size and mtime of a file must stay
+            the same before it's read, when polling
+        :param use_inotify: if False, the folder is always polled
+        """
+        self.folder = os.path.abspath(folder)
+        self.on_done = on_done
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self._libc = _load_inotify() if use_inotify else None
+        self._fd: Optional[int] = None
+        # complete _done files and versions they were read at
+        self._done: Dict[str, Version] = {}
+        # polling: version of every file and when it was first seen
+        self._seen: Dict[str, tuple] = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+
+    def start(self) -> "DoneWatcher":
+        if self._thread is not None:
+            return self
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE
+                wd = self._libc.inotify_add_watch(
+                    fd, self.folder.encode(), mask
+                )
+                if wd >= 0:
+                    self._fd = fd
+                else:
+                    os.close(fd)
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="DoneWatcher", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def is_done(self, path: str) -> bool:
+        """
+        :return: True if the _done file is saved completely
+        """
+        with self._condition:
+            return self._is_done(os.path.abspath(path))
+
+    def wait(self, path: str, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the _done file to be saved completely
+        :param path: path to the _done file
+        :param timeout: seconds to wait, None is forever
+        :return: True if the file is saved, False on timeout
+        """
+        path = os.path.abspath(path)
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._is_done(path) or self._stopped.is_set(),
+                timeout,
+            ) and self._is_done(path)
+
+    def _is_done(self, path: str) -> bool:
+        """
+        :return: True if the file is still the one that was read, an entry
+            of a file deleted or rewritten since, e.g. when the part is
+            written again, is not handled by the watcher yet
+        """
+        version = self._done.get(path)
+        if version is None:
+            return False
+        try:
+            return file_version(path) == version
+        except FileNotFoundError:
+            return False
+
+    def _run(self):
+        try:
+            # files saved before the watcher started
+            self._step(self._scan, settle=False)
+            while not self._stopped.is_set():
+                if self._fd is not None:
+                    ready, _, _ = select.select(
+                        [self._fd], [], [], self.poll_interval
+                    )
+                    if ready:
+                        self._step(self._read_events)
+                else:
+                    self._stopped.wait(self.poll_interval)
+                    self._step(self._scan, settle=True)
+        finally:
+            # waiters return on stop, also if the thread stops on an error
+            self._stopped.set()
+            with self._condition:
+                self._condition.notify_all()
+
+    @staticmethod
+    def _step(func, *args, **kwargs):
+        """
+        Runs one step of the watcher, an error is printed and the watcher
+        goes on, so one bad event doesn't stop the thread
+        """
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            traceback.print_exc()
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(
+                data[offset : offset + length].rstrip(b"\0")
+            )
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, the folder is checked as a whole
+                self._scan(settle=False)
+                continue
+            if not name.endswith(DONE_SUFFIX):
+                continue
+            path = os.path.join(self.folder, name)
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._step(self._check, path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._step(self._forget, path)
+
+    def _scan(self, settle: bool):
+        now = time.monotonic()
+        paths: Set[str] = set()
+        try:
+            entries = list(os.scandir(self.folder))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.name.endswith(DONE_SUFFIX):
+                continue
+            path = os.path.join(self.folder, entry.name)
+            paths.add(path)
+            try:
+                version = file_version(path)
+            except FileNotFoundError:
+                continue
+            if self._done.get(path) == version:
+                continue
+            seen = self._seen.get(path)
+            if seen is None or seen[0] != version:
+                # file is still being written, or changed since
+                self._seen[path] = (version, now)
+                if settle:
+                    continue
+            elif now - seen[1] < self.settle_time:
+                continue
+            age = time.time() - version[0] / 1e9
+            if not settle and age >= self.settle_time:
+                # saved before, decoding every old file would only slow
+                # down the start
+                self._record(path, version)
+            else:
+                self._check(path)
+        for path in set(self._done) - paths:
+            self._forget(path)
+
+    def _check(self, path: str):
+        try:
+            version = file_version(path)
+            # decoded pixels are kept in the store for the job
+            read_rgba(path)
+        except (FileNotFoundError, ValueError):
+            # incomplete, it's checked again after the next write
+            return
+        self._record(path, version)
+
+    def _record(self, path: str, version: Version):
+        """
+        Reports the complete _done file
+        """
+        with self._condition:
+            if self._done.get(path) == version:
+                return
+            self._done[path] = version
+            self._condition.notify_all()
+        if self.on_done is not None:
+            self.on_done(path)
+
+    def _forget(self, path: str):
+        with self._condition:
+            self._done.pop(path, None)
+        self._seen.pop(path, None)
@@ -0,0 +1,149 @@
+"""
+First version of shift, shift_large and combine_images, before any of the
+optimisations, with the fixed 1024 pixels tiles it was written for
+The optimised functions must give the same pixels with DEFAULT_GEOMETRY
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+from image_preparation.data import Directions
+
+
+def replace_logo(im: np.ndarray, old_im: np.ndarray, direction: Directions):
+    if direction == Directions.RIGHT:
+        old_im = shift(old_im, direction=Directions.RIGHT)
+    if direction == Directions.DOWN:
+        old_im = shift(old_im, direction=Directions.DOWN)
+    im[-17:, -81:] = old_im[-17:, -81:]
+    return im
+
+
+def cut_logo(im: np.ndarray):
+    im[-17:, -81:] = 0
+    im[-17:, -81:, 3] = 0
+    return im
+
+
+def shift(
+    im: np.ndarray,
+    direction: Directions,
+    num_pixels: int = 1024 - 1024 // 3,
+    to_cut_logo: bool = True,
+) -> np.ndarray:
+    new_im = np.zeros(im.shape, dtype=im.dtype)
+    new_im[:, :] = im[:, :].copy()
+    if direction == Directions.LEFT:
+        if to_cut_logo:
+            new_im = cut_logo(new_im)
+        new_im[:, :-num_pixels] = new_im[:, num_pixels:]
+        new_im[:, -num_pixels:] = 0
+        new_im[:, -num_pixels:, 3] = 0
+        new_im = new_im[:, -1024:]
+    elif direction == Directions.RIGHT:
+        new_im[:, num_pixels:] = new_im[:, :-num_pixels]
+        new_im[:, :num_pixels] = 0
+        new_im[:, :num_pixels, 3] = 0
+        new_im = new_im[:, :1024]
+    elif direction == Directions.UP:
+        if to_cut_logo:
+            new_im = cut_logo(new_im)
+        new_im[:-num_pixels, :] = new_im[num_pixels:, :]
+        new_im[-num_pixels:, :] = 0
+        new_im[-num_pixels:, :, 3] = 0
+        new_im = new_im[-1024:, :]
+    elif direction == Directions.DOWN:
+        new_im[num_pixels:, :] = new_im[:-num_pixels, :]
+        new_im[:num_pixels, :] = 0
+        new_im[:num_pixels, :, 3] = 0
+        new_im = new_im[:1024, :]
+    return new_im
+
+
+def shift_large(
+    im: np.ndarray,
+    direction: Directions,
+    num_pixels: int = 1024 - 1024 // 3,
+    to_cut_logo: bool = True,
+    default_shape: int = 1024,
+) -> List[np.ndarray]:
+    shifted_image = shift(
+        im, direction=direction, num_pixels=num_pixels, to_cut_logo=to_cut_logo
+    )
+    ret = []
+    if (
+        shifted_image.shape[0] != default_shape
+        or shifted_image.shape[1] != default_shape
+    ):
+        if direction == Directions.LEFT or direction == Directions.RIGHT:
+            max_shift = shifted_image.shape[0]
+        else:
+            max_shift = shifted_image.shape[1]
+        for num_shift in range(0, max_shift - num_pixels, num_pixels):
+            if direction == Directions.LEFT or direction == Directions.RIGHT:
+                ret.append(
+                    shifted_image[num_shift : num_shift + default_shape, :]
+                )
+            else:
+                ret.append(
+                    shifted_image[:, num_shift : num_shift + default_shape]
+                )
+    else:
+        ret.append(shifted_image)
+    return ret
+
+
+def combine_images(
+    im: np.ndarray,
+    images: Dict[Directions, np.ndarray],
+    num_pixels: int = 1024 - 1024 // 3,
+) -> np.ndarray:
+    """
+    Same as combine_images of the first version, on pixels instead of files
+    :param im: source image
+    :param images: direction_done image of every direction, in order
+    """
+    for direction, im_direction in images.items():
+        im_direction = im_direction.copy()
+        if direction == Directions.LEFT:
+            im = np.concatenate(
+                (
+                    im,
+                    np.zeros((im.shape[0], num_pixels, 4), dtype=im.dtype),
+                ),
+                axis=1,
+            )
+            im[:, -1024:] = im_direction
+        if direction == Directions.RIGHT:
+            im_direction = replace_logo(im_direction, im, direction=direction)
+            im = np.concatenate(
+                (
+                    np.zeros((im.shape[0], num_pixels, 4), dtype=im.dtype),
+                    im,
+                ),
+                axis=1,
+            )
+            im[:, :1024] = im_direction
+        if direction == Directions.UP:
+            im = np.concatenate(
+                (
+                    im,
+                    np.zeros((num_pixels, im.shape[1], 4), dtype=im.dtype),
+                ),
+                axis=0,
+            )
+            im[-1024:, :] = im_direction
+        if direction == Directions.DOWN:
+            im_direction = replace_logo(
+                im_direction, im[:1024], direction=direction
+            )
+            im = np.concatenate(
+                (
+                    np.zeros((num_pixels, im.shape[1], 4), dtype=im.dtype),
+                    im,
+                ),
+                axis=0,
+            )
+            im[:1024, :] = im_direction
+    return im
@@ -0,0 +1,17 @@
+"""
+Fixtures shared by the tests
+"""
+
+import pytest
+
+from image_preparation import preview
+
+
+@pytest.fixture(autouse=True)
+def preview_cache(tmp_path, monkeypatch):
+    """
+    Previews are written to the folder of the test, not the user's cache
+    """
+    folder = str(tmp_path / "previews")
+    monkeypatch.setattr(preview, "PREVIEW_CACHE_FOLDER", folder)
+    return folder
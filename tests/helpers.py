@@ -0,0 +1,80 @@
+"""
+Geometry, source images and backends shared by the tests
+"""
+
+import os
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from image_preparation.backends import OpenCVBackend
+from image_preparation.data import PanoramaPart
+from image_preparation.geometry import TileGeometry
+
+# small tiles, so a panorama has several parts and runs fast
+GEOMETRY = TileGeometry(128, 48, (17, 81))
+
+
+class FlakyBackend(OpenCVBackend):
+    """
+    OpenCVBackend that fails after generating fail_after parts
+    """
+
+    def __init__(self, fail_after: int):
+        super().__init__()
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def inpaint(self, part: PanoramaPart, done_path: str) -> np.ndarray:
+        self.calls += 1
+        if self.calls > self.fail_after:
+            raise RuntimeError("generator is down")
+        return super().inpaint(part, done_path)
+
+
+def random_image(
+    height: int, width: int, seed: int = 0, channels: int = 4
+) -> np.ndarray:
+    """
+    :return: opaque image of random pixels, same for the same arguments
+    """
+    rng = np.random.default_rng(seed)
+    im = rng.integers(0, 255, (height, width, channels), dtype=np.uint8)
+    if channels == 4:
+        im[..., 3] = 255
+    return im
+
+
+def write_source(
+    folder: str, name: str = "source.png", im: Optional[np.ndarray] = None
+) -> str:
+    """
+    :param im: pixels of the source, random 150 by 200 if None
+    :return: path to the source image
+    """
+    os.makedirs(folder, exist_ok=True)
+    if im is None:
+        im = random_image(150, 200)
+    impath = os.path.join(folder, name)
+    if impath.endswith(".npy"):
+        np.save(impath, im)
+    else:
+        cv2.imwrite(impath, im)
+    return impath
+
+
+def write_sources(folder: str, count: int) -> List[str]:
+    """
+    :return: paths to the same image saved under count names
+    """
+    return [write_source(folder, f"source{i}.png") for i in range(count)]
+
+
+def read(path: str) -> np.ndarray:
+    """
+    :return: pixels of the image as they're saved
+    """
+    if path.endswith(".npy"):
+        return np.load(path)
+    return cv2.imread(path, cv2.IMREAD_UNCHANGED)
@@ -0,0 +1,189 @@
+"""
+LabsClient against local stand-in servers of the tasks API and of the
+image host the generations are downloaded from
+"""
+import asyncio
+import os
+from typing import List
+
+from aiohttp import web
+
+from api.async_client import LabsClient
+from image_preparation.result_cache import ResultCache
+
+AUTH_HEADER = "Bearer SECRET"
+
+
+class StandIn:
+    """
+    Tasks API that finishes a task after pending_checks status checks,
+    and image host on its own port
+    """
+
+    def __init__(self, pending_checks: int = 2, batch_size: int = 2):
+        self.pending_checks = pending_checks
+        self.batch_size = batch_size
+        # Authorization header of every request, by the host it's sent to
+        self.api_auth: List[str] = []
+        self.image_auth: List[str] = []
+        self.checks = {}
+        self.created = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runners = []
+        self.tasks_url = ""
+        self.images_url = ""
+
+    async def create_task(self, request: web.Request) -> web.Response:
+        self.api_auth.append(request.headers.get("Authorization"))
+        payload = await request.json()
+        task_id = f"task-{self.created}"
+        self.created += 1
+        self.checks[task_id] = (payload, 0)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return web.json_response({"id": task_id, "status": "pending"})
+
+    async def get_task(self, request: web.Request) -> web.Response:
+        self.api_auth.append(request.headers.get("Authorization"))
+        task_id = request.match_info["task_id"]
+        payload, checks = self.checks[task_id]
+        self.checks[task_id] = (payload, checks + 1)
+        if checks + 1 < self.pending_checks:
+            return web.json_response({"id": task_id, "status": "pending"})
+        self.in_flight -= 1
+        return web.json_response(
+            {
+                "id": task_id,
+                "status": "succeeded",
+                "prompt": {"prompt": payload["prompt"]},
+                "generations": {
+                    "data": [
+                        {
+                            "generation": {
+                                "image_path": f"{self.images_url}/"
+                                f"{task_id}/{i}.png"
+                            }
+                        }
+                        for i in range(self.batch_size)
+                    ]
+                },
+            }
+        )
+
+    async def get_image(self, request: web.Request) -> web.Response:
+        self.image_auth.append(request.headers.get("Authorization"))
+        name = f"{request.match_info['task_id']}/{request.match_info['i']}"
+        return web.Response(body=name.encode())
+
+    async def _serve(self, app: web.Application) -> str:
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self._runners.append(runner)
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def __aenter__(self):
+        api = web.Application()
+        api.router.add_post("/api/labs/tasks", self.create_task)
+        api.router.add_get("/api/labs/tasks/{task_id}", self.get_task)
+        images = web.Application()
+        images.router.add_get("/{task_id}/{i}.png", self.get_image)
+        self.tasks_url = await self._serve(api) + "/api/labs/tasks"
+        self.images_url = await self._serve(images)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for runner in self._runners:
+            await runner.cleanup()
+
+
+def make_payload(caption: str, batch_size: int = 2) -> dict:
+    return {
+        "task_type": "text2im",
+        "prompt": {"caption": caption, "batch_size": batch_size},
+    }
+
+
+def make_client(server: StandIn, **kwargs) -> LabsClient:
+    return LabsClient(
+        AUTH_HEADER,
+        tasks_url=server.tasks_url,
+        poll_interval=0.01,
+        max_poll_interval=0.05,
+        **kwargs,
+    )
+
+
+def test_generate_and_save(tmp_path):
+    async def run():
+        async with StandIn(pending_checks=3) as server:
+            async with make_client(server) as client:
+                paths = await client.generate_and_save(
+                    make_payload("panda"), str(tmp_path)
+                )
+        return server, paths
+
+    server, paths = asyncio.run(run())
+    assert [os.path.basename(x) for x in paths] == [
+        "panda_1.png",
+        "panda_2.png",
+    ]
+    with open(paths[1], "rb") as f:
+        assert f.read() == b"task-0/1"
+    # one POST and a status check until the task is done
+    assert len(server.api_auth) == 1 + 3
+
+
+def test_auth_is_not_sent_to_image_host(tmp_path):
+    async def run():
+        async with StandIn() as server:
+            async with make_client(server) as client:
+                await client.generate_and_save(
+                    make_payload("panda"), str(tmp_path)
+                )
+        return server
+
+    server = asyncio.run(run())
+    assert server.api_auth and all(x == AUTH_HEADER for x in server.api_auth)
+    assert server.image_auth == [None, None]
+
+
+def test_max_tasks_in_flight(tmp_path):
+    async def run():
+        async with StandIn(pending_checks=3) as server:
+            async with make_client(server, max_tasks=2) as client:
+                await asyncio.gather(
+                    *[
+                        client.generate_and_save(
+                            make_payload(f"panda{i}"), str(tmp_path)
+                        )
+                        for i in range(5)
+                    ]
+                )
+        return server
+
+    server = asyncio.run(run())
+    assert server.created == 5
+    assert server.max_in_flight == 2
+
+
+def test_cached_payload_is_not_requested(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+
+    async def run():
+        async with StandIn() as server:
+            async with make_client(server, cache=cache) as client:
+                first = await client.generate_and_save(
+                    make_payload("panda"), str(tmp_path)
+                )
+                second = await client.generate_and_save(
+                    make_payload("panda"), str(tmp_path)
+                )
+        return server, first, second
+
+    server, first, second = asyncio.run(run())
+    assert server.created == 1
+    assert first == second
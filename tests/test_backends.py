@@ -0,0 +1,65 @@
+"""
+Local inpainting backends and the backend interface
+"""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from image_preparation import watcher
+from image_preparation.backends import (
+    FolderBackend,
+    InpaintingBackend,
+    SeededFillBackend,
+)
+from image_preparation.data import Directions, PanoramaPart
+from tests.helpers import random_image, write_source
+
+
+def test_backend_without_inpaint_cant_be_created():
+    class Incomplete(InpaintingBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_seeded_fill_is_deterministic():
+    im = np.full((32, 32, 4), 200, dtype=np.uint8)
+    im[:, 16:, 3] = 0
+    part = PanoramaPart("part.png", Directions.RIGHT, im)
+    first = SeededFillBackend(seed=1).inpaint(part, "part_done.png")
+    second = SeededFillBackend(seed=1).inpaint(part, "part_done.png")
+    assert np.array_equal(first, second)
+    assert np.array_equal(first[:, :16], im[:, :16])
+    assert (first[:, 16:, 3] == 255).all()
+
+
+def test_folder_backend_waits_for_the_part_written_again(
+    tmp_path, monkeypatch
+):
+    # the folder is polled, a deleted file is noticed only on the next scan
+    monkeypatch.setattr(watcher, "_load_inotify", lambda: None)
+    folder = str(tmp_path)
+    part = PanoramaPart(
+        os.path.join(folder, "part.png"), Directions.RIGHT, random_image(8, 8)
+    )
+    backend = FolderBackend(poll_interval=0.05, timeout=5)
+    try:
+        done_path = write_source(folder, "part_done.png", random_image(16, 16))
+        assert np.array_equal(
+            backend.inpaint(part, done_path), random_image(16, 16)
+        )
+        # the part is written again, its old _done file is deleted
+        os.remove(done_path)
+        regenerated = random_image(16, 16, seed=1)
+        timer = threading.Timer(
+            0.3, write_source, (folder, "part_done.png", regenerated)
+        )
+        timer.start()
+        assert np.array_equal(backend.inpaint(part, done_path), regenerated)
+        timer.join()
+    finally:
+        backend.close()
@@ -0,0 +1,91 @@
+"""
+Pixels of the optimised pipeline against the first version of it,
+with the default 1024 pixels tiles
+"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from image_preparation.data import Directions
+from image_preparation.panorama_dalle2 import (
+    combine_images,
+    prepare_full_panorama,
+    prepare_panorama,
+)
+from tests import baseline
+from tests.helpers import random_image, read, write_source
+
+LEFT_RIGHT = [Directions.LEFT, Directions.RIGHT]
+UP_DOWN = [Directions.UP, Directions.DOWN]
+# source shapes and the directions they are extended in
+CASES = [
+    ((1024, 1024), list(Directions)),
+    ((2100, 1024), LEFT_RIGHT),
+    ((1024, 2100), UP_DOWN),
+]
+# the first version extends an image either horizontally or vertically
+COMBINE_CASES = [
+    ((1024, 1024), LEFT_RIGHT),
+    ((1024, 1024), UP_DOWN),
+    ((2100, 1024), LEFT_RIGHT),
+    ((1024, 2100), UP_DOWN),
+]
+
+
+def source(shape, channels: int = 4) -> np.ndarray:
+    im = random_image(*shape, channels=channels)
+    if channels == 4:
+        # transparent pixels of the source stay transparent
+        im[100:120, ::5, 3] = 0
+    return im
+
+
+def as_rgba(im: np.ndarray) -> np.ndarray:
+    """
+    :return: source as the first version read it
+    """
+    if im.shape[2] == 3:
+        return cv2.cvtColor(im, cv2.COLOR_RGB2RGBA)
+    return im
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+@pytest.mark.parametrize("shape,directions", CASES)
+def test_prepare_panorama(tmp_path, shape, directions, channels):
+    im = source(shape, channels)
+    impath = write_source(str(tmp_path), im=im)
+    prepare_panorama(impath, directions)
+    for direction in directions:
+        expected = baseline.shift(as_rgba(im), direction)
+        shifted = read(os.path.join(str(tmp_path), f"source_{direction}.png"))
+        assert np.array_equal(shifted, expected)
+
+
+@pytest.mark.parametrize("shape,directions", CASES)
+def test_prepare_full_panorama(tmp_path, shape, directions):
+    im = source(shape)
+    impath = write_source(str(tmp_path), im=im)
+    parts = prepare_full_panorama(impath, directions)
+    for direction in directions:
+        expected = baseline.shift_large(im, direction)
+        assert len(parts[direction]) == len(expected)
+        for part, expected_part in zip(parts[direction], expected):
+            assert np.array_equal(part.img, expected_part)
+
+
+@pytest.mark.parametrize("shape,directions", COMBINE_CASES)
+def test_combine_images(tmp_path, shape, directions):
+    im = source(shape)
+    impath = write_source(str(tmp_path), im=im)
+    images = {}
+    for i, direction in enumerate(directions):
+        done_shape = baseline.shift(im, direction).shape[:2]
+        images[direction] = random_image(*done_shape, seed=i + 1)
+        write_source(
+            str(tmp_path), f"source_{direction}_done.png", images[direction]
+        )
+    expected = baseline.combine_images(im, images)
+    assert np.array_equal(read(combine_images(impath, directions)), expected)
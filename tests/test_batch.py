@@ -0,0 +1,40 @@
+"""
+Batches of source images, one by one and in worker processes
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+from image_preparation.batch import JobSettings, expand_paths, run_batch
+from image_preparation.data import Directions
+from tests.helpers import GEOMETRY, write_source, write_sources
+
+
+def test_processes_share_the_cache(tmp_path):
+    impaths = write_sources(str(tmp_path), 4)
+    settings = JobSettings(
+        [Directions.LEFT, Directions.RIGHT],
+        geometry=GEOMETRY,
+        backend="opencv",
+        cache_folder=str(tmp_path / "cache"),
+    )
+    results = run_batch(impaths, settings, processes=2)
+    assert [x.error for x in results] == [None] * 4
+    expected = cv2.imread(results[0].result_path, cv2.IMREAD_UNCHANGED)
+    for result in results[1:]:
+        im = cv2.imread(result.result_path, cv2.IMREAD_UNCHANGED)
+        assert np.array_equal(im, expected)
+    assert not [x for x in os.listdir(str(tmp_path / "cache")) if ".tmp" in x]
+
+
+def test_generated_images_are_skipped(tmp_path):
+    folder = str(tmp_path)
+    sources = [write_source(folder, name) for name in ["a.png", "b_c.png"]]
+    for name in ["a_LEFT_000.png", "a_done.png", "a_full.png", "b_c_full.png"]:
+        write_source(folder, name)
+    assert expand_paths([folder]) == sources
+    assert expand_paths([os.path.join(folder, "*.png")]) == sources
+    missing = os.path.join(folder, "missing.png")
+    assert expand_paths([missing]) == [missing]
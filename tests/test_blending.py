@@ -0,0 +1,34 @@
+"""
+Seams blended across the overlap band
+"""
+
+import numpy as np
+import pytest
+
+from image_preparation.blending import BlendMode, blend_overlap
+from tests.helpers import random_image
+
+
+def test_blended_seam_goes_from_base_to_new():
+    base = np.zeros((48, 64, 4), dtype=np.uint8)
+    new = np.full((48, 64, 4), 200, dtype=np.uint8)
+    assert blend_overlap(base, new, 0, mode=BlendMode.NONE) is new
+    seam = blend_overlap(base, new, 0, mode=BlendMode.FEATHER)
+    # weights of the new image grow along axis 0
+    assert (np.diff(seam[:, 0, 0].astype(int)) >= 0).all()
+    assert seam[0, 0, 0] < 10 and seam[-1, 0, 0] > 190
+    seam = blend_overlap(base, new, 1, towards_end=False)
+    assert seam[0, 0, 0] > 190 and seam[0, -1, 0] < 10
+
+
+@pytest.mark.parametrize("mode", [BlendMode.FEATHER, BlendMode.LAPLACIAN])
+def test_blending_same_images_keeps_them(mode):
+    im = random_image(48, 300)
+    assert np.array_equal(blend_overlap(im, im, 0, mode=mode, chunk=64), im)
+
+
+def test_chunks_dont_change_feather():
+    base = random_image(48, 300, seed=1)
+    new = random_image(48, 300, seed=2)
+    whole = blend_overlap(base, new, 0, chunk=1024)
+    assert np.array_equal(blend_overlap(base, new, 0, chunk=37), whole)
@@ -0,0 +1,35 @@
+"""
+Canvas of the combined image, in RAM or in a memory-mapped file
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from image_preparation.canvas import Canvas
+from image_preparation.data import Directions
+from tests.helpers import GEOMETRY, random_image
+
+
+@pytest.mark.parametrize("backed", [False, True])
+def test_paste_and_window(tmp_path, backed):
+    backing_path = None
+    if backed:
+        backing_path = os.path.join(str(tmp_path), "canvas.raw")
+    canvas, top, left = Canvas.for_directions(
+        (150, 200, 4),
+        [Directions.LEFT, Directions.RIGHT],
+        GEOMETRY,
+        backing_path=backing_path,
+    )
+    assert canvas.shape == (150, 200 + 2 * GEOMETRY.num_pixels, 4)
+    assert (top, left) == (0, GEOMETRY.num_pixels)
+    assert isinstance(canvas.img, np.memmap) == backed
+    im = random_image(150, 200)
+    canvas.paste(im, top, left)
+    assert np.array_equal(canvas.window(top, left, 150, 200), im)
+    assert not canvas.window(0, 0, 150, left).any()
+    canvas.close()
+    assert canvas.img is None
+    assert not os.listdir(str(tmp_path))
@@ -0,0 +1,31 @@
+"""
+Arguments of the CLI
+"""
+
+import pytest
+
+from cli import main, parse_args
+
+
+@pytest.mark.parametrize("option", ["--processes", "--workers", "--tile-size"])
+@pytest.mark.parametrize("value", ["0", "-2", "two"])
+def test_count_below_one_is_rejected(option, value):
+    with pytest.raises(SystemExit):
+        parse_args(["source.png", option, value])
+
+
+def test_counts():
+    args = parse_args(["source.png", "--processes", "3", "--workers", "2"])
+    assert (args.processes, args.workers) == (3, 2)
+
+
+@pytest.mark.parametrize(
+    "args,message",
+    [
+        (["--num-pixels", "5000"], "--num-pixels: overlap must be in"),
+        (["--overlap", "2"], "--overlap: overlap must be in"),
+    ],
+)
+def test_geometry_that_doesnt_fit_the_tile_is_rejected(args, message, capsys):
+    assert main(["source.png"] + args) == 2
+    assert message in capsys.readouterr().err
@@ -0,0 +1,28 @@
+"""
+Combining the direction images into the full image
+"""
+
+import os
+
+import pytest
+
+from image_preparation.data import Directions
+from image_preparation.panorama_dalle2 import combine_images
+from tests.helpers import GEOMETRY, random_image, write_source
+
+
+def test_canvas_file_is_removed_on_error(tmp_path):
+    im = random_image(150, 128)
+    impath = write_source(str(tmp_path), im=im)
+    write_source(str(tmp_path), "source_LEFT_done.png", im)
+    with open(os.path.join(str(tmp_path), "source_RIGHT_done.png"), "w") as f:
+        f.write("not an image")
+    backing_path = os.path.join(str(tmp_path), "source_canvas.raw")
+    with pytest.raises(ValueError, match="can't be decoded"):
+        combine_images(
+            impath,
+            [Directions.LEFT, Directions.RIGHT],
+            GEOMETRY,
+            backing_path=backing_path,
+        )
+    assert not os.path.exists(backing_path)
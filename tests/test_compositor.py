@@ -0,0 +1,53 @@
+"""
+Strips of the directions composited part by part
+"""
+
+import numpy as np
+import pytest
+
+from image_preparation import cut_logo, shift_view
+from image_preparation.blending import BlendMode
+from image_preparation.compositor import StripCompositor
+from image_preparation.data import Directions
+from image_preparation.geometry import TileGeometry
+from tests.helpers import GEOMETRY, random_image
+
+
+@pytest.mark.parametrize("direction", list(Directions))
+def test_strip_of_the_parts_is_the_shifted_image(direction):
+    im = random_image(400, 300)
+    view = shift_view(im, direction, GEOMETRY)
+    windows = GEOMETRY.tile_windows(view.shape, direction)
+    strip = StripCompositor(view.shape, direction, windows, GEOMETRY)
+    for part_number, window in enumerate(windows):
+        assert not strip.complete
+        strip.add(part_number, view.tile(*window))
+    assert strip.complete
+    assert np.array_equal(strip.img, view.materialise())
+
+
+def test_parts_are_added_in_order():
+    view = shift_view(random_image(400, 300), Directions.LEFT, GEOMETRY)
+    windows = GEOMETRY.tile_windows(view.shape, Directions.LEFT)
+    strip = StripCompositor(view.shape, Directions.LEFT, windows, GEOMETRY)
+    with pytest.raises(ValueError, match="not combined yet"):
+        strip.add(1, view.tile(*windows[1]))
+
+
+@pytest.mark.parametrize("direction", list(Directions))
+def test_feathered_strip_has_no_cut_logo(direction):
+    # logo inside the overlap band of every direction
+    geometry = TileGeometry(128, 48, (17, 40))
+    view = shift_view(random_image(400, 300), direction, geometry)
+    windows = geometry.tile_windows(view.shape, direction)
+    strip = StripCompositor(
+        view.shape, direction, windows, geometry, BlendMode.FEATHER
+    )
+    for part_number, (top, left, height, width) in enumerate(windows):
+        generated = random_image(height, width, seed=part_number)
+        strip.add(part_number, cut_logo(generated, geometry))
+    # only the logo of the last part is left cut off
+    top, left, height, width = windows[-1]
+    logo = geometry.logo_box((height, width))
+    strip.img[top : top + height, left : left + width][logo] = 255
+    assert (strip.img[..., 3] == 255).all()
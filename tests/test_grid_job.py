@@ -0,0 +1,91 @@
+"""
+GridJob run with a local backend: resuming with a cache, the logo of the
+source and blending
+"""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from image_preparation.backends import OpenCVBackend
+from image_preparation.blending import BlendMode
+from image_preparation.data import Directions
+from image_preparation.grid_job import GridJob
+from image_preparation.result_cache import ResultCache
+from tests.helpers import GEOMETRY, FlakyBackend, write_source
+
+RED = (0, 0, 255, 255)
+
+
+def write_logo_source(folder: str) -> str:
+    """
+    :return: path to the source image, gray with a red logo
+    """
+    rng = np.random.default_rng(0)
+    im = np.empty((160, 200, 4), dtype=np.uint8)
+    im[..., :3] = rng.integers(96, 160, (160, 200, 3), dtype=np.uint8)
+    im[..., 3] = 255
+    logo_height, logo_width = GEOMETRY.logo_size
+    im[-logo_height:, -logo_width:] = RED
+    return write_source(folder, im=im)
+
+
+def make_job(impath: str, backend, **kwargs) -> GridJob:
+    job = GridJob(
+        impath, list(Directions), backend=backend, geometry=GEOMETRY, **kwargs
+    )
+    job.progress = lambda message: None
+    return job
+
+
+def test_resume_with_cache(tmp_path):
+    expected = make_job(
+        write_logo_source(str(tmp_path / "expected")), OpenCVBackend()
+    ).run()
+    expected = cv2.imread(expected, cv2.IMREAD_UNCHANGED)
+
+    impath = write_logo_source(str(tmp_path / "resumed"))
+    cache = ResultCache(str(tmp_path / "cache"))
+    with pytest.raises(RuntimeError):
+        make_job(impath, FlakyBackend(fail_after=3), cache=cache).run()
+    # tiles generated before are composited from their _done files
+    backend = FlakyBackend(fail_after=100)
+    job = make_job(impath, backend, cache=cache)
+    result = job.run()
+    assert backend.calls == len(job.tiles) - 3
+    assert np.array_equal(cv2.imread(result, cv2.IMREAD_UNCHANGED), expected)
+
+
+def test_logo_is_generated_over(tmp_path):
+    impath = write_logo_source(str(tmp_path))
+    result = make_job(impath, OpenCVBackend()).run()
+    im = cv2.imread(result, cv2.IMREAD_UNCHANGED)
+    assert not np.all(im == RED, axis=2).any()
+    # only logos of the tiles at the lower edge of the canvas stay cut
+    logo_height = GEOMETRY.logo_size[0]
+    assert np.all(im[:-logo_height, :, 3] == 255)
+
+
+def test_blend_is_rejected(tmp_path):
+    impath = write_logo_source(str(tmp_path))
+    with pytest.raises(ValueError):
+        make_job(impath, OpenCVBackend(), blend=BlendMode.FEATHER)
+
+
+def test_failed_run_removes_the_canvas(tmp_path):
+    impath = write_logo_source(str(tmp_path / "images"))
+    canvas_folder = tmp_path / "canvas"
+    canvas_folder.mkdir()
+    job = make_job(
+        impath, FlakyBackend(fail_after=2), canvas_folder=str(canvas_folder)
+    )
+    with pytest.raises(RuntimeError):
+        job.run()
+    assert job.canvas is None
+    assert not list(canvas_folder.iterdir())
+    # the same job runs again with a new canvas
+    job.backend = OpenCVBackend()
+    assert os.path.exists(job.run())
+    assert not list(canvas_folder.iterdir())
@@ -0,0 +1,67 @@
+"""
+Shifted images as views of the source, and their tiles
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from image_preparation import (
+    MaskedTile,
+    iter_shift_large,
+    shift,
+    shift_large,
+    shift_view,
+)
+from image_preparation.data import Directions
+from tests.helpers import GEOMETRY, random_image
+
+
+@pytest.mark.parametrize("direction", list(Directions))
+def test_view_shares_the_source(direction):
+    im = random_image(150, 200)
+    view = shift_view(im, direction, GEOMETRY)
+    assert np.shares_memory(view.source, im)
+    assert not view.source.flags.writeable
+    shifted = shift(im, direction, GEOMETRY)
+    assert np.array_equal(view.materialise(), shifted)
+    # the source is never edited, e.g. by cutting the logo
+    assert np.array_equal(im, random_image(150, 200))
+
+
+@pytest.mark.parametrize("direction", list(Directions))
+def test_shifted_pixels_are_transparent(direction):
+    im = random_image(150, 200)
+    shifted = shift(im, direction, GEOMETRY)
+    view = shift_view(im, direction, GEOMETRY)
+    mask = view.mask(0, 0, *shifted.shape[:2])
+    assert (shifted[mask] == 0).all()
+    assert (shifted[~mask, 3] == 255).all()
+
+
+@pytest.mark.parametrize("direction", list(Directions))
+def test_masked_tile_is_the_tile(direction):
+    im = random_image(150, 200)
+    im[30:40, ::4, 3] = 0
+    im[50:60, ::3, 3] = 128
+    view = shift_view(im, direction, GEOMETRY)
+    for window in GEOMETRY.tile_windows(view.shape, direction):
+        tile = view.masked_tile(*window)
+        assert isinstance(tile, MaskedTile)
+        assert np.array_equal(tile.to_rgba(), view.tile(*window))
+
+
+@pytest.mark.parametrize("direction", list(Directions))
+def test_iter_shift_large_of_a_mapped_source(tmp_path, direction):
+    im = random_image(400, 300)
+    path = os.path.join(str(tmp_path), "source.npy")
+    np.save(path, im)
+    mapped = np.load(path, mmap_mode="r")
+    tiles = iter_shift_large(mapped, direction, GEOMETRY)
+    assert not isinstance(tiles, list)
+    expected = shift_large(im, direction, GEOMETRY)
+    tiles = list(tiles)
+    assert len(tiles) == len(expected) > 1
+    for tile, expected_tile in zip(tiles, expected):
+        assert np.array_equal(tile, expected_tile)
@@ -0,0 +1,82 @@
+"""
+Codecs every image of the pipeline is written with
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from image_preparation.image_io import (
+    Codec,
+    decode_image,
+    map_image,
+    read_image,
+    write_image,
+)
+from tests.helpers import random_image
+
+
+@pytest.mark.parametrize("codec", list(Codec))
+def test_codecs_are_lossless(tmp_path, codec):
+    im = random_image(40, 30)
+    im[:10, :10, 3] = 0
+    path = os.path.join(str(tmp_path), "image" + codec.extension)
+    write_image(path, im, codec)
+    assert np.array_equal(read_image(path), im)
+    with open(path, "rb") as f:
+        assert np.array_equal(decode_image(f.read()), im)
+
+
+def test_small_is_smaller_than_fast(tmp_path):
+    im = np.zeros((200, 200, 4), dtype=np.uint8)
+    im[..., 0] = np.arange(200, dtype=np.uint8)[None]
+    im[..., 3] = 255
+    sizes = {}
+    for codec in (Codec.FAST, Codec.SMALL):
+        path = os.path.join(str(tmp_path), f"{codec}.png")
+        write_image(path, im, codec)
+        sizes[codec] = os.path.getsize(path)
+    assert sizes[Codec.SMALL] < sizes[Codec.FAST]
+
+
+def test_extension_must_match_the_codec(tmp_path):
+    with pytest.raises(ValueError):
+        write_image(
+            os.path.join(str(tmp_path), "image.png"),
+            random_image(4, 4),
+            Codec.NPY,
+        )
+
+
+def test_npy_is_mapped(tmp_path):
+    im = random_image(40, 30)
+    path = os.path.join(str(tmp_path), "image.npy")
+    write_image(path, im, Codec.NPY)
+    mapped = map_image(path)
+    assert isinstance(mapped, np.memmap)
+    assert np.array_equal(mapped, im)
+
+
+def test_failed_npy_write_keeps_the_file(tmp_path, monkeypatch):
+    im = random_image(40, 30)
+    path = os.path.join(str(tmp_path), "image.npy")
+    write_image(path, im, Codec.NPY)
+
+    def save(f, im):
+        f.write(b"\x93NUMPY")
+        raise OSError("no space left on device")
+
+    monkeypatch.setattr(np, "save", save)
+    with pytest.raises(OSError):
+        write_image(path, im[:10], Codec.NPY)
+    monkeypatch.undo()
+    assert os.listdir(str(tmp_path)) == ["image.npy"]
+    assert np.array_equal(read_image(path), im)
+
+
+def test_broken_file_is_none(tmp_path):
+    path = os.path.join(str(tmp_path), "image.npy")
+    with open(path, "wb") as f:
+        f.write(b"\x93NUMPY broken")
+    assert read_image(path) is None
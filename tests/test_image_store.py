@@ -0,0 +1,38 @@
+"""
+Decoded images kept while their files stay the same
+"""
+
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+from image_preparation import image_store
+from image_preparation.image_store import ImageStore
+from tests.helpers import random_image, write_source
+
+
+def test_evicted_images_are_forgotten(tmp_path):
+    # room for one decoded image only
+    store = ImageStore(max_bytes=random_image(32, 32).nbytes)
+    paths = [
+        write_source(str(tmp_path), f"image{i}.png", random_image(32, 32))
+        for i in range(3)
+    ]
+    for path in paths:
+        assert np.array_equal(store.read(path), random_image(32, 32))
+    assert list(store._versions) == [os.path.abspath(paths[-1])]
+
+
+def test_file_that_keeps_changing_is_not_decoded_forever(
+    tmp_path, monkeypatch
+):
+    path = write_source(str(tmp_path))
+    versions = itertools.count()
+    monkeypatch.setattr(
+        image_store, "file_version", lambda path: (next(versions), 0)
+    )
+    with pytest.raises(ValueError, match="keeps changing"):
+        ImageStore(max_bytes=1024**2).read(path)
+    assert next(versions) == 2 * image_store.READ_ATTEMPTS
@@ -0,0 +1,92 @@
+"""
+PanoramaJob run with a local backend: codecs, in-memory mode and resuming
+from the manifest
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from image_preparation.backends import OpenCVBackend
+from image_preparation.data import Directions
+from image_preparation.image_io import Codec
+from image_preparation.panorama_job import PanoramaJob
+from tests.helpers import GEOMETRY, FlakyBackend, read, write_source
+
+LEFT_RIGHT = [Directions.LEFT, Directions.RIGHT]
+
+
+def make_job(impath: str, backend=None, **kwargs) -> PanoramaJob:
+    job = PanoramaJob(
+        impath,
+        LEFT_RIGHT,
+        backend=backend if backend is not None else OpenCVBackend(),
+        geometry=GEOMETRY,
+        **kwargs,
+    )
+    job.progress = lambda message: None
+    return job
+
+
+@pytest.fixture
+def expected(tmp_path) -> np.ndarray:
+    impath = write_source(str(tmp_path / "expected"))
+    return read(make_job(impath).run())
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"codec": Codec.NPY},
+        {"in_memory": True},
+        {"final_codec": Codec.SMALL},
+        {"max_workers": 2},
+    ],
+)
+def test_modes_give_the_same_pixels(tmp_path, expected, kwargs):
+    impath = write_source(str(tmp_path / "job"))
+    max_workers = kwargs.pop("max_workers", 1)
+    result = make_job(impath, **kwargs).run(max_workers=max_workers)
+    assert np.array_equal(read(result), expected)
+
+
+def test_in_memory_writes_only_the_result(tmp_path):
+    impath = write_source(str(tmp_path / "job"))
+    result = make_job(impath, in_memory=True).run()
+    assert sorted(os.listdir(str(tmp_path / "job"))) == [
+        "source.png",
+        os.path.basename(result),
+    ]
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_merged_pixels_are_not_kept(tmp_path, in_memory):
+    impath = write_source(str(tmp_path))
+    job = make_job(impath, in_memory=in_memory)
+    job.run()
+    for parts in job.parts.values():
+        for part in parts:
+            assert part._img is None
+
+
+def test_resume_from_the_manifest(tmp_path, expected):
+    impath = write_source(str(tmp_path / "job"))
+    with pytest.raises(RuntimeError):
+        make_job(impath, FlakyBackend(fail_after=3)).run()
+    # parts generated before are not generated again
+    backend = FlakyBackend(fail_after=100)
+    job = make_job(impath, backend)
+    result = job.run()
+    total = sum(len(parts) for parts in job.parts.values())
+    assert backend.calls == total - 3
+    assert np.array_equal(read(result), expected)
+
+
+def test_restart_generates_every_part(tmp_path):
+    impath = write_source(str(tmp_path))
+    make_job(impath).run()
+    backend = FlakyBackend(fail_after=100)
+    job = make_job(impath, backend, resume=False)
+    job.run()
+    assert backend.calls == sum(len(parts) for parts in job.parts.values())
@@ -0,0 +1,39 @@
+"""
+Pixels of the parts computed from the source
+"""
+
+import numpy as np
+
+from image_preparation.data import Directions
+from image_preparation.data.panorama_part import PARTS_CACHE, RGBA_CACHE
+from image_preparation.image_edit import shift_view
+from image_preparation.panorama_dalle2 import prepare_full_panorama
+from tests.helpers import GEOMETRY, random_image, write_source
+
+
+def test_img_is_materialised_once(tmp_path):
+    im = random_image(150, 260)
+    im[40:44, ::3, 3] = 0
+    impath = write_source(str(tmp_path), im=im)
+    parts = prepare_full_panorama(impath, list(Directions), GEOMETRY)
+    for direction, direction_parts in parts.items():
+        shifted = shift_view(im, direction=direction, geometry=GEOMETRY)
+        for part in direction_parts:
+            assert part.img is part.img
+            assert not part.img.flags.writeable
+            assert np.array_equal(part.img, shifted.tile(*part.window))
+
+
+def test_evicted_pixels_are_computed_again(tmp_path):
+    im = random_image(150, 260)
+    impath = write_source(str(tmp_path), im=im)
+    parts = prepare_full_panorama(impath, [Directions.LEFT], GEOMETRY)
+    part = parts[Directions.LEFT][1]
+    # nothing is computed before the pixels are accessed
+    assert part._img is None
+    img = part.img.copy()
+    PARTS_CACHE.clear()
+    RGBA_CACHE.clear()
+    assert part.img is not img
+    assert np.array_equal(part.img, img)
+    assert np.array_equal(part.tile.to_rgba(), img)
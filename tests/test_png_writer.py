@@ -0,0 +1,62 @@
+"""
+PNGs written strip by strip, read back by OpenCV
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from image_preparation.png_writer import PngFilter, PngWriter, write_png
+from tests.helpers import random_image, read
+
+
+@pytest.mark.parametrize("filter_type", list(PngFilter))
+@pytest.mark.parametrize("channels", [1, 3, 4])
+def test_filters_round_trip(tmp_path, filter_type, channels):
+    im = random_image(101, 67, channels=channels)
+    # flat areas and gradients, every predictor of PAETH is taken
+    im[:40, :30] = 7
+    im[50:, :] = np.arange(67, dtype=np.uint8)[None, :, None]
+    im = im[..., 0] if channels == 1 else im
+    path = os.path.join(str(tmp_path), "image.png")
+    write_png(path, im, strip_rows=16, filter_type=filter_type)
+    assert np.array_equal(read(path), im)
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_strips_of_any_size(tmp_path, background):
+    im = random_image(50, 20)
+    path = os.path.join(str(tmp_path), "image.png")
+    with PngWriter(path, 20, 50, background=background) as writer:
+        for start, stop in [(0, 1), (1, 17), (17, 50)]:
+            writer.write_strip(im[start:stop])
+    assert np.array_equal(read(path), im)
+
+
+def test_failed_write_leaves_nothing(tmp_path):
+    im = random_image(50, 20)
+    path = os.path.join(str(tmp_path), "image.png")
+    write_png(path, im)
+    with pytest.raises(ValueError, match="strip width"):
+        with PngWriter(path, 20, 50) as writer:
+            writer.write_strip(im[:10])
+            writer.write_strip(im[10:, :10])
+    writer = PngWriter(path, 20, 50)
+    writer.write_strip(im[:10])
+    with pytest.raises(ValueError, match="rows written"):
+        writer.close()
+    # the image written before is kept, no temporary file is left
+    assert os.listdir(str(tmp_path)) == ["image.png"]
+    assert np.array_equal(read(path), im)
+
+
+def test_16_bit_image_is_rejected(tmp_path):
+    im = random_image(50, 20).astype(np.uint16) * 257
+    path = os.path.join(str(tmp_path), "image.png")
+    with pytest.raises(ValueError, match="uint16"):
+        write_png(path, im)
+    with pytest.raises(ValueError, match="uint16"):
+        with PngWriter(path, 20, 50) as writer:
+            writer.write_strip(im)
+    assert os.listdir(str(tmp_path)) == []
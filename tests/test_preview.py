@@ -0,0 +1,92 @@
+"""
+Preview pyramids of the images and reading them while they're rewritten
+"""
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+from image_preparation import preview
+from image_preparation.preview import (
+    TILES_CACHE,
+    PreviewPyramid,
+    load_fit,
+    open_preview_pyramid,
+    preview_folder,
+    write_preview_pyramid,
+)
+from tests.helpers import random_image, write_source
+
+
+def write_image(folder: str, name: str = "image.png") -> tuple:
+    im = random_image(300, 500)
+    path = write_source(os.path.join(folder, "images"), name, im)
+    write_preview_pyramid(path, im, tile_size=128)
+    return path, im
+
+
+def test_region_of_the_first_level_is_the_image(tmp_path):
+    path, im = write_image(str(tmp_path))
+    pyramid = open_preview_pyramid(path)
+    assert pyramid.levels == 3
+    assert np.array_equal(pyramid.region(0, 0, 0, 300, 500), im)
+    region = pyramid.region(0, 100, 200, 150, 300)
+    assert np.array_equal(region, im[100:250, 200:500])
+
+
+def test_missing_tile_falls_back_to_the_image(tmp_path):
+    path, im = write_image(str(tmp_path))
+    pyramid = open_preview_pyramid(path)
+    TILES_CACHE.clear()
+    os.remove(os.path.join(preview_folder(path), "0_0_0.png"))
+    assert pyramid.region(0, 0, 0, 300, 500) is None
+    assert len(TILES_CACHE) == 0
+    expected = cv2.resize(im, (100, 60), interpolation=cv2.INTER_AREA)
+    os.remove(os.path.join(preview_folder(path), "2_0_0.png"))
+    assert np.array_equal(load_fit(path, 100, 100), expected)
+
+
+def test_pyramid_is_replaced_as_a_whole(tmp_path):
+    path, im = write_image(str(tmp_path))
+    write_preview_pyramid(path, im, tile_size=256)
+    folder = preview_folder(path)
+    assert os.listdir(os.path.dirname(folder)) == [os.path.basename(folder)]
+    assert PreviewPyramid.open(path).tile_size == 256
+    assert "0_3_0.png" not in os.listdir(folder)
+
+
+def test_nothing_is_written_next_to_the_image(tmp_path, preview_cache):
+    path, im = write_image(str(tmp_path))
+    load_fit(path, 100, 100)
+    assert os.listdir(os.path.dirname(path)) == ["image.png"]
+    assert preview_folder(path).startswith(preview_cache)
+
+
+def pyramid_size(path: str) -> int:
+    folder = preview_folder(path)
+    return sum(entry.stat().st_size for entry in os.scandir(folder))
+
+
+def test_pyramids_opened_least_recently_are_evicted(tmp_path, monkeypatch):
+    first, _ = write_image(str(tmp_path), "first.png")
+    monkeypatch.setattr(
+        preview, "PREVIEW_CACHE_MAX_BYTES", int(pyramid_size(first) * 2.5)
+    )
+    # mtime of the meta must differ between the pyramids
+    time.sleep(0.05)
+    second, _ = write_image(str(tmp_path), "second.png")
+    time.sleep(0.05)
+    assert PreviewPyramid.open(first) is not None
+    time.sleep(0.05)
+    third, _ = write_image(str(tmp_path), "third.png")
+    assert PreviewPyramid.open(first) is not None
+    assert PreviewPyramid.open(second) is None
+    assert PreviewPyramid.open(third) is not None
+
+
+def test_pyramid_just_written_is_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(preview, "PREVIEW_CACHE_MAX_BYTES", 0)
+    path, _ = write_image(str(tmp_path))
+    assert PreviewPyramid.open(path) is not None
@@ -0,0 +1,40 @@
+"""
+Images in the ResultCache, stored with the codec of the cache
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from image_preparation.image_io import Codec
+from image_preparation.result_cache import ResultCache
+
+
+def make_image() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    im = rng.integers(0, 255, (40, 60, 4), dtype=np.uint8)
+    im[:10, :20, 3] = 0
+    return im
+
+
+@pytest.mark.parametrize("codec", list(Codec))
+def test_put_and_get(tmp_path, codec):
+    cache = ResultCache(str(tmp_path), codec=codec)
+    im = make_image()
+    cache.put("key", im)
+    assert np.array_equal(cache.get("key"), im)
+    data = cache.get_bytes("key")
+    assert data.startswith(b"\x93NUMPY") == (codec == Codec.NPY)
+    assert cache.nbytes == len(data)
+    assert not [x for x in tmp_path.iterdir() if x.suffix != ".bin"]
+
+
+def test_png_of_other_encoder_is_read(tmp_path):
+    cache = ResultCache(str(tmp_path), codec=Codec.NPY)
+    im = make_image()
+    cache.put_bytes("key", cv2.imencode(".png", im)[1].tobytes())
+    assert np.array_equal(cache.get("key"), im)
+
+
+def test_missing_key(tmp_path):
+    assert ResultCache(str(tmp_path)).get("key") is None
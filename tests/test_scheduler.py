@@ -0,0 +1,111 @@
+"""
+Dependent tasks run by run_dag: order, cycles and a failed task
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from image_preparation.backends import FolderBackend
+from image_preparation.data import Directions, PanoramaPart
+from image_preparation.panorama_job import PanoramaJob
+from image_preparation.scheduler import run_dag
+from tests.helpers import GEOMETRY, write_source
+
+
+def test_failed_task_isnt_waited_for():
+    released = threading.Event()
+
+    def fail():
+        raise RuntimeError("task failed")
+
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError, match="task failed"):
+        run_dag(
+            {"blocked": lambda: released.wait(5), "failed": fail},
+            {},
+            max_workers=2,
+            on_error=released.set,
+        )
+    assert time.perf_counter() - start < 1
+    assert released.is_set()
+
+
+def test_tasks_after_a_failed_task_dont_run():
+    ran = []
+
+    def fail():
+        raise RuntimeError("task failed")
+
+    with pytest.raises(RuntimeError):
+        run_dag(
+            {"failed": fail, "after": lambda: ran.append("after")},
+            {"after": ["failed"]},
+            max_workers=2,
+        )
+    assert ran == []
+
+
+def test_tasks_run_after_their_dependencies():
+    finished = []
+
+    def task(key):
+        def run():
+            time.sleep(0.01 * (3 - len(key)))
+            finished.append(key)
+            return key.upper()
+
+        return run
+
+    keys = ["a", "b", "ab", "abc"]
+    results = run_dag(
+        {key: task(key) for key in keys},
+        {"ab": ["a", "b"], "abc": ["ab"]},
+        max_workers=4,
+    )
+    assert results == {key: key.upper() for key in keys}
+    assert finished.index("ab") > max(finished.index("a"), finished.index("b"))
+    assert finished[-1] == "abc"
+
+
+def test_cyclic_dependencies_are_rejected():
+    with pytest.raises(ValueError, match="cyclic"):
+        run_dag(
+            {"a": lambda: 1, "b": lambda: 2, "c": lambda: 3},
+            {"a": ["b"], "b": ["a"]},
+        )
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError, match="unknown"):
+        run_dag({"a": lambda: 1}, {"a": ["b"]})
+
+
+class BrokenLeftBackend(FolderBackend):
+    """
+    FolderBackend whose LEFT parts fail, RIGHT parts wait for the user
+    """
+
+    def inpaint(self, part: PanoramaPart, done_path: str) -> np.ndarray:
+        if part.direction == Directions.LEFT:
+            # the other direction is waited for already
+            time.sleep(0.2)
+            raise ValueError(f"{done_path} can't be decoded")
+        return super().inpaint(part, done_path)
+
+
+def test_failed_direction_stops_the_folder_backend(tmp_path):
+    impath = write_source(str(tmp_path))
+    job = PanoramaJob(
+        impath,
+        [Directions.LEFT, Directions.RIGHT],
+        backend=BrokenLeftBackend(timeout=None),
+        geometry=GEOMETRY,
+    )
+    job.progress = lambda message: None
+    start = time.perf_counter()
+    with pytest.raises(ValueError, match="can't be decoded"):
+        job.run(max_workers=2)
+    assert time.perf_counter() - start < 5
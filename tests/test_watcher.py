@@ -0,0 +1,89 @@
+"""
+DoneWatcher picking up _done files, also after events it can't handle
+"""
+
+import os
+import time
+
+import pytest
+
+from image_preparation import watcher as watcher_module
+from image_preparation.watcher import DoneWatcher
+from tests.helpers import random_image, write_source
+
+
+def write_done(folder: str, name: str = "part_done.png") -> str:
+    return write_source(folder, name, random_image(16, 16))
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_done_file_is_picked_up(tmp_path, use_inotify):
+    with DoneWatcher(
+        str(tmp_path),
+        poll_interval=0.05,
+        settle_time=0.05,
+        use_inotify=use_inotify,
+    ) as watcher:
+        path = write_done(str(tmp_path))
+        assert watcher.wait(path, timeout=5)
+
+
+def test_name_that_isnt_utf8_is_ignored(tmp_path):
+    folder = os.fsencode(str(tmp_path))
+    with DoneWatcher(str(tmp_path), poll_interval=0.05) as watcher:
+        # files are saved after the first scan of the folder
+        time.sleep(0.2)
+        with open(os.path.join(folder, b"\xff\xfe.txt"), "wb") as f:
+            f.write(b"x")
+        path = write_done(str(tmp_path))
+        assert watcher.wait(path, timeout=5)
+        assert watcher._thread.is_alive()
+
+
+def test_failed_callback_doesnt_stop_the_watcher(tmp_path):
+    def on_done(path):
+        if path.endswith("first_done.png"):
+            raise RuntimeError("callback failed")
+
+    with DoneWatcher(
+        str(tmp_path), on_done=on_done, poll_interval=0.05
+    ) as watcher:
+        assert watcher.wait(write_done(str(tmp_path), "first_done.png"), 5)
+        path = write_done(str(tmp_path), "second_done.png")
+        assert watcher.wait(path, timeout=5)
+        assert watcher._thread.is_alive()
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_deleted_file_is_not_done(tmp_path, use_inotify):
+    with DoneWatcher(
+        str(tmp_path), poll_interval=0.05, use_inotify=use_inotify
+    ) as watcher:
+        path = write_done(str(tmp_path))
+        assert watcher.wait(path, timeout=5)
+        os.remove(path)
+        assert not watcher.is_done(path)
+        assert not watcher.wait(path, timeout=0.2)
+        write_done(str(tmp_path))
+        assert watcher.wait(path, timeout=5)
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_files_saved_before_are_not_decoded(
+    tmp_path, monkeypatch, use_inotify
+):
+    decoded = []
+    monkeypatch.setattr(watcher_module, "read_rgba", decoded.append)
+    paths = [write_done(str(tmp_path), f"{i}_done.png") for i in range(3)]
+    for path in paths:
+        # saved an hour ago
+        os.utime(path, (time.time() - 3600,) * 2)
+    with DoneWatcher(
+        str(tmp_path), poll_interval=0.05, use_inotify=use_inotify
+    ) as watcher:
+        for path in paths:
+            assert watcher.wait(path, timeout=5)
+        # saved after the start, it's decoded before it's reported
+        path = write_done(str(tmp_path))
+        assert watcher.wait(path, timeout=5)
+    assert decoded == [path]